@@ -0,0 +1,486 @@
+# Analysis server - share one machine's engines between many clients
+# JSON lines over TCP or a Unix socket, requests are queued and handed to a
+# fixed pool of worker processes, each keeping a warm engine and TT
+#
+#   python analysis_server.py --port 8765 --workers 4
+#   python analysis_server.py --unix /tmp/chess.sock
+#
+# Client -> server (one JSON object per line):
+#   {"op": "analyse", "id": "a1", "fen": "...", "depth": 6, "time": 5.0,
+#    "nodes": null, "multipv": 1, "deadline": 10.0}
+#   {"op": "cancel", "id": "a1"}
+#   {"op": "stats"}
+#
+# Server -> client:
+#   {"id": "a1", "type": "queued", "queue_depth": 3}
+#   {"id": "a1", "type": "info", "depth": 4, "score": 35, "best_move": "e2e4",
+#    "pv": ["e2e4", "e7e5", ...], "nodes": 5210, "nps": 21000, "time": 0.25, "tt_usage": 0.001}
+#   {"id": "a1", "type": "result", "status": "done", "best_move": "e2e4", ...}
+#   {"id": "a1", "type": "error", "message": "..."}
+#   {"type": "stats", "queue_depth": 0, "busy_workers": 1, ...}
+#
+# status is "done", "cancelled" or "deadline" (deadline = seconds after the
+# request arrived, time spent queued counts against it)
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+from chess_board import ChessBoard, move_to_notation
+from chess_engine import ChessEngine, SearchInfo
+from search_limits import SearchLimits
+
+# Finished requests kept for the latency percentiles
+LATENCY_WINDOW = 1000
+
+
+# Worker side - one long-lived engine per process
+
+def _worker_main(conn, stop_flag, tt_size_mb: int):
+    # Ctrl-C goes to the whole process group - let the server shut us down instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    engine = ChessEngine(tt_size_mb=tt_size_mb)
+    engine.stop_check = lambda: stop_flag.value != 0
+
+    def send_info(info: SearchInfo):
+        conn.send(('info', _info_payload(info)))
+
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        try:
+            conn.send(('result', _analyse(engine, *task, send_info=send_info)))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+
+def _info_payload(info: SearchInfo) -> Dict:
+    return {
+        'depth': info.depth,
+        'score': info.score,
+        'best_move': move_to_notation(info.best_move),
+        'pv': [move_to_notation(move) for move in info.pv],
+        'nodes': info.nodes,
+        'nps': round(info.nps),
+        'time': round(info.time, 3),
+        'tt_usage': round(info.tt_usage, 4),
+    }
+
+
+def _analyse(engine: ChessEngine, fen: str, max_depth: int, max_time: float,
+             max_nodes: Optional[int], multipv: int, send_info=None) -> Dict:
+    # send_info gets every SearchInfo as its depth finishes
+    board = ChessBoard.from_fen(fen)
+    limits = SearchLimits.from_args(max_depth, max_time, max_nodes)
+    info = None
+    for info in engine.iter_search(board, limits, multipv=multipv):
+        if send_info is not None:
+            send_info(info)
+
+    if multipv > 1:
+        lines = [{'move': move_to_notation(move), 'score': score,
+                  'pv': [move_to_notation(pv_move) for pv_move in pv]}
+                 for move, score, pv in (info.lines if info is not None else ())]
+        best_move, score = (lines[0]['move'], lines[0]['score']) if lines else (None, None)
+    else:
+        best_move = move_to_notation(info.best_move) if info is not None else None
+        score = info.score if info is not None else None
+        lines = None
+
+    payload = {
+        'best_move': best_move,
+        'score': score,
+        'depth': engine.completed_depth,
+        'nodes': engine.nodes_searched,
+        'stopped': engine.search_stopped,
+    }
+    if lines is not None:
+        payload['lines'] = lines
+    return payload
+
+
+# Server side
+
+class AnalysisRequest:
+    # One queued or running analysis, owned by the connection that sent it
+
+    def __init__(self, connection: 'ClientConnection', request_id, fen: str, max_depth: int,
+                 max_time: float, max_nodes: Optional[int], multipv: int,
+                 deadline: Optional[float]):
+        self.connection = connection
+        self.request_id = request_id
+        self.fen = fen
+        self.max_depth = max_depth
+        self.max_time = max_time
+        self.max_nodes = max_nodes
+        self.multipv = multipv
+        self.received_time = time.monotonic()
+        # absolute monotonic time, or None for no deadline
+        self.deadline = self.received_time + deadline if deadline is not None else None
+        self.started_time = None
+        self.cancelled = False
+        self.worker = None
+
+    def time_left(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+
+class ClientConnection:
+    # Writes JSON lines back to one client and tracks its live requests
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.requests: Dict[object, AnalysisRequest] = {}
+        self.closed = False
+        self.task = None  # handler task, so the server can wait for it on shutdown
+
+    def send(self, message: Dict):
+        # StreamWriter.write never splits a call, so lines from different workers can't interleave
+        if not self.closed:
+            self.writer.write((json.dumps(message) + '\n').encode())
+
+    def send_info(self, message: Dict):
+        # progress lines aren't waited for - while a slow client's buffer is over the
+        # high-water mark they're dropped (the next depth or the result supersedes them)
+        # instead of queueing up without bound behind it
+        transport = self.writer.transport
+        if transport.get_write_buffer_size() <= transport.get_write_buffer_limits()[1]:
+            self.send(message)
+
+
+class EngineWorker:
+    # Parent-side handle of one worker process
+
+    def __init__(self, tt_size_mb: int):
+        self.tt_size_mb = tt_size_mb
+        self.process = None
+        self.conn = None
+        self.stop_flag = None
+        self.request: Optional[AnalysisRequest] = None
+
+    def start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        # plain shared byte, the engine polls it every POLL_INTERVAL nodes so no lock
+        self.stop_flag = multiprocessing.RawValue('b', 0)
+        self.process = multiprocessing.Process(target=_worker_main,
+                                               args=(child_conn, self.stop_flag, self.tt_size_mb),
+                                               daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        # blocks for up to 2s - the server runs it in an executor thread
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class AnalysisServer:
+    # Queue + fixed pool of engine processes behind an asyncio socket server
+
+    def __init__(self, workers: Optional[int] = None, tt_size_mb: int = 64,
+                 default_depth: int = 6, default_time: float = 10.0, max_queue: int = 1000):
+        self.worker_count = workers or os.cpu_count() or 1
+        self.tt_size_mb = tt_size_mb
+        self.default_depth = default_depth
+        self.default_time = default_time
+        self.max_queue = max_queue
+
+        self.workers: List[EngineWorker] = []
+        self.queue: Optional[asyncio.Queue] = None
+        self.queued = 0
+        # one thread per worker blocks on its pipe so the event loop never does
+        self.executor = None
+        self.dispatchers: List[asyncio.Task] = []
+        self.server = None
+        self.connections = set()
+
+        self.completed = 0
+        self.cancelled = 0
+        self.expired = 0
+        self.failed = 0
+        self.queue_latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.total_latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765,
+                    unix_path: Optional[str] = None):
+        self.queue = asyncio.Queue()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.worker_count)
+        for _ in range(self.worker_count):
+            worker = EngineWorker(self.tt_size_mb)
+            worker.start()
+            self.workers.append(worker)
+            self.dispatchers.append(asyncio.ensure_future(self._dispatch(worker)))
+
+        if unix_path is not None:
+            self.server = await asyncio.start_unix_server(self._handle_client, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self._handle_client, host, port)
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        # closing the sockets ends each client handler at its next read
+        connections = list(self.connections)
+        for connection in connections:
+            connection.writer.close()
+        await asyncio.gather(*(connection.task for connection in connections),
+                             return_exceptions=True)
+        for task in self.dispatchers:
+            task.cancel()
+        for worker in self.workers:
+            worker.stop_flag.value = 1
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, worker.stop) for worker in self.workers))
+        self.executor.shutdown(wait=False)
+
+    # Client protocol
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = ClientConnection(writer)
+        connection.task = asyncio.current_task()
+        self.connections.add(connection)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if line:
+                    self._handle_message(connection, line)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # nobody is left to read the answers - drop everything this client asked for
+            connection.closed = True
+            self.connections.discard(connection)
+            for request in list(connection.requests.values()):
+                self._cancel(request)
+            writer.close()
+
+    def _handle_message(self, connection: ClientConnection, line: bytes):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            connection.send({'type': 'error', 'message': "invalid JSON"})
+            return
+        if not isinstance(message, dict):
+            connection.send({'type': 'error', 'message': "expected a JSON object"})
+            return
+
+        op = message.get('op')
+        request_id = message.get('id')
+        if op == 'analyse':
+            self._submit(connection, message)
+        elif op == 'cancel':
+            request = connection.requests.get(request_id)
+            if request is None:
+                connection.send({'id': request_id, 'type': 'error', 'message': "unknown request id"})
+            else:
+                self._cancel(request)
+        elif op == 'stats':
+            connection.send(dict(self.get_stats(), type='stats'))
+        else:
+            connection.send({'id': request_id, 'type': 'error', 'message': f"unknown op {op!r}"})
+
+    def _submit(self, connection: ClientConnection, message: Dict):
+        request_id = message.get('id')
+        if request_id in connection.requests:
+            connection.send({'id': request_id, 'type': 'error', 'message': "request id already in use"})
+            return
+        if self.queued >= self.max_queue:
+            connection.send({'id': request_id, 'type': 'error', 'message': "queue full"})
+            return
+
+        try:
+            fen = message['fen']
+            ChessBoard.from_fen(fen)  # reject bad FENs here rather than in a worker
+            max_depth = int(message.get('depth') or self.default_depth)
+            max_time = float(message.get('time') or self.default_time)
+            max_nodes = int(message['nodes']) if message.get('nodes') else None
+            multipv = max(1, int(message.get('multipv') or 1))
+            deadline = float(message['deadline']) if message.get('deadline') is not None else None
+        except (KeyError, TypeError, ValueError) as e:
+            connection.send({'id': request_id, 'type': 'error', 'message': f"bad request: {e}"})
+            return
+
+        request = AnalysisRequest(connection, request_id, fen, max_depth, max_time,
+                                  max_nodes, multipv, deadline)
+        connection.requests[request_id] = request
+        self.queued += 1
+        self.queue.put_nowait(request)
+        connection.send({'id': request_id, 'type': 'queued', 'queue_depth': self.queued})
+
+    def _cancel(self, request: AnalysisRequest):
+        if request.cancelled:
+            return
+        request.cancelled = True
+        if request.worker is not None:
+            # running - the engine notices at its next node and returns what it has
+            request.worker.stop_flag.value = 1
+        else:
+            # still queued - the dispatcher skips it when it comes up
+            self.queued -= 1
+            self.cancelled += 1
+            self._finish(request, {'type': 'result', 'status': 'cancelled', 'best_move': None})
+
+    def _finish(self, request: AnalysisRequest, message: Dict):
+        message['id'] = request.request_id
+        request.connection.requests.pop(request.request_id, None)
+        request.connection.send(message)
+
+    # Dispatch
+
+    async def _dispatch(self, worker: EngineWorker):
+        # feeds one worker, one request at a time
+        loop = asyncio.get_running_loop()
+        while True:
+            request = await self.queue.get()
+            if request.cancelled:
+                continue
+            self.queued -= 1
+
+            time_left = request.time_left()
+            if time_left is not None and time_left <= 0:
+                self.expired += 1
+                self._finish(request, {'type': 'result', 'status': 'deadline', 'best_move': None})
+                continue
+
+            # the deadline is just a tighter time limit once the search starts
+            max_time = request.max_time if time_left is None else min(request.max_time, time_left)
+            request.started_time = time.monotonic()
+            request.worker = worker
+            worker.request = request
+            worker.stop_flag.value = 0
+
+            try:
+                worker.conn.send((request.fen, request.max_depth, max_time,
+                                  request.max_nodes, request.multipv))
+                while True:
+                    kind, payload = await loop.run_in_executor(self.executor, worker.conn.recv)
+                    if kind != 'info':
+                        break
+                    request.connection.send_info(dict(payload, id=request.request_id, type='info'))
+            except (EOFError, OSError):
+                # the worker died - replace it so the pool stays at full size
+                kind, payload = 'error', "engine worker crashed"
+                # stop() joins the process - not on the event loop, the other clients would stall
+                await loop.run_in_executor(None, worker.stop)
+                worker.start()
+            finally:
+                worker.request = None
+                request.worker = None
+
+            self._complete(request, kind, payload)
+
+    def _complete(self, request: AnalysisRequest, kind: str, payload):
+        now = time.monotonic()
+        if kind == 'error':
+            self.failed += 1
+            self._finish(request, {'type': 'error', 'message': payload})
+            return
+
+        if request.cancelled:
+            status = 'cancelled'
+            self.cancelled += 1
+        elif request.deadline is not None and now >= request.deadline:
+            status = 'deadline'
+            self.expired += 1
+        else:
+            status = 'done'
+            self.completed += 1
+
+        queue_time = request.started_time - request.received_time
+        total_time = now - request.received_time
+        self.queue_latencies.append(queue_time)
+        self.total_latencies.append(total_time)
+
+        message = {'type': 'result', 'status': status}
+        message.update(payload)
+        message['queue_time'] = round(queue_time, 4)
+        message['time'] = round(total_time, 4)
+        self._finish(request, message)
+
+    # Stats
+
+    def get_stats(self) -> Dict:
+        return {
+            'workers': self.worker_count,
+            'busy_workers': sum(1 for worker in self.workers if worker.request is not None),
+            'queue_depth': self.queued,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'expired': self.expired,
+            'failed': self.failed,
+            'queue_latency_ms': _percentiles(self.queue_latencies),
+            'total_latency_ms': _percentiles(self.total_latencies),
+        }
+
+
+def _percentiles(samples) -> Dict:
+    # nearest-rank p50/p90/p99 in milliseconds over the recent window
+    if not samples:
+        return {'p50': None, 'p90': None, 'p99': None}
+    ordered = sorted(samples)
+    result = {}
+    for p in (50, 90, 99):
+        index = min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))
+        result[f'p{p}'] = round(ordered[index] * 1000, 2)
+    return result
+
+
+async def _serve(args):
+    server = AnalysisServer(workers=args.workers, tt_size_mb=args.tt_mb,
+                            default_depth=args.depth, default_time=args.time,
+                            max_queue=args.max_queue)
+    await server.start(host=args.host, port=args.port, unix_path=args.unix)
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"Analysis server on {where} with {server.worker_count} engine workers", file=sys.stderr)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Serve engine analysis over JSON lines")
+    parser.add_argument('--host', default='127.0.0.1', help="TCP address to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument('--unix', default=None, help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--workers', type=int, default=None, help="engine processes (default: all cores)")
+    parser.add_argument('--tt-mb', type=int, default=64, help="transposition table size per worker")
+    parser.add_argument('--depth', type=int, default=6, help="default max depth when a request has none")
+    parser.add_argument('--time', type=float, default=10.0, help="default max seconds when a request has none")
+    parser.add_argument('--max-queue', type=int, default=1000, help="reject requests beyond this many queued")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# Persistent analysis store - a transposition table in a memory-mapped file
+# survives between runs, so repeated analysis starts from earlier results
+#
+# Layout: 64 byte header, then buckets of ENTRIES_PER_BUCKET entries.
+# Each entry is 16 bytes: (key ^ data, data) as two little-endian uint64.
+# A reader recomputes key = check ^ data, so a half-written entry (another
+# process writing, or a crash) just looks like a miss instead of bad data.
+
+import mmap
+import os
+import struct
+from typing import Optional, Tuple
+
+MAGIC = b'CHESSTT1'
+VERSION = 2  # 2: moves are the board's 16-bit int moves (1 had 12 bits, no flags)
+HEADER_FORMAT = '<8sIIQ'  # magic, version, entries per bucket, bucket count
+HEADER_SIZE = 64
+ENTRY_FORMAT = '<QQ'
+ENTRY_SIZE = 16
+ENTRIES_PER_BUCKET = 4
+BUCKET_SIZE = ENTRY_SIZE * ENTRIES_PER_BUCKET
+
+SCORE_OFFSET = 1 << 31
+MASK_64 = (1 << 64) - 1
+
+
+def pack_entry(score: int, depth: int, flag: int, move: int) -> int:
+    # score 32 bits | depth 8 | flag 8 | move 16 (0 = no move)
+    return ((score + SCORE_OFFSET) & 0xFFFFFFFF) | ((depth & 0xFF) << 32) | \
+        ((flag & 0xFF) << 40) | ((move & 0xFFFF) << 48)
+
+
+def unpack_entry(data: int) -> Tuple[int, int, int, int]:
+    score = (data & 0xFFFFFFFF) - SCORE_OFFSET
+    depth = (data >> 32) & 0xFF
+    flag = (data >> 40) & 0xFF
+    move = data >> 48
+    return score, depth, flag, move
+
+
+class PersistentAnalysisStore:
+    # Fixed-size bucketed table on disk with depth-preferred replacement
+    # open read-only to share one file between many worker processes
+
+    def __init__(self, path: str, size_mb: int = 64, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+
+        if not os.path.exists(path):
+            if readonly:
+                raise FileNotFoundError(path)
+            self._create(path, size_mb)
+
+        self.file = open(path, 'rb' if readonly else 'r+b')
+        header = self.file.read(HEADER_SIZE)
+        if len(header) < struct.calcsize(HEADER_FORMAT):
+            self.file.close()
+            raise ValueError(f"{path} is not an analysis store")
+        magic, version, entries_per_bucket, bucket_count = struct.unpack_from(HEADER_FORMAT, header)
+        if magic != MAGIC or version != VERSION or entries_per_bucket != ENTRIES_PER_BUCKET:
+            self.file.close()
+            raise ValueError(f"{path} is not a version {VERSION} analysis store")
+
+        expected_size = HEADER_SIZE + bucket_count * BUCKET_SIZE
+        if os.path.getsize(path) != expected_size:
+            self.file.close()
+            raise ValueError(f"{path} is truncated or has the wrong size")
+
+        self.bucket_count = bucket_count
+        access = mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE
+        self.map = mmap.mmap(self.file.fileno(), 0, access=access)
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def _create(path: str, size_mb: int):
+        bucket_count = max(1, (size_mb * 1024 * 1024 - HEADER_SIZE) // BUCKET_SIZE)
+        # write to a temp file and rename, so other processes never see a partial file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, ENTRIES_PER_BUCKET, bucket_count)
+            f.write(header.ljust(HEADER_SIZE, b'\0'))
+            f.truncate(HEADER_SIZE + bucket_count * BUCKET_SIZE)
+        os.replace(tmp_path, path)
+
+    def _bucket_offset(self, zobrist_hash: int) -> int:
+        return HEADER_SIZE + (zobrist_hash % self.bucket_count) * BUCKET_SIZE
+
+    def probe(self, zobrist_hash: int) -> Optional[Tuple[int, int, int, int]]:
+        # (score, depth, flag, best_move) or None
+        offset = self._bucket_offset(zobrist_hash)
+        for i in range(ENTRIES_PER_BUCKET):
+            check, data = struct.unpack_from(ENTRY_FORMAT, self.map, offset + i * ENTRY_SIZE)
+            if data and check ^ data == zobrist_hash:
+                self.hits += 1
+                return unpack_entry(data)
+        self.misses += 1
+        return None
+
+    def store(self, zobrist_hash: int, depth: int, score: int, flag: int, best_move: int = 0) -> bool:
+        # same argument order as TranspositionTable.store
+        # returns False if the entry wasn't good enough to replace anything
+        if self.readonly:
+            raise PermissionError("analysis store is open read-only")
+
+        offset = self._bucket_offset(zobrist_hash)
+        target = None
+        victim, victim_depth = None, 256
+        for i in range(ENTRIES_PER_BUCKET):
+            entry_offset = offset + i * ENTRY_SIZE
+            check, data = struct.unpack_from(ENTRY_FORMAT, self.map, entry_offset)
+            if not data:
+                # empty slots are the first choice if the position isn't stored yet
+                if victim_depth >= 0:
+                    victim, victim_depth = entry_offset, -1
+                continue
+            stored_depth = (data >> 32) & 0xFF
+            if check ^ data == zobrist_hash:
+                # same position: only a deeper (or equal) result replaces it
+                if depth < stored_depth:
+                    return False
+                target = entry_offset
+                break
+            if stored_depth < victim_depth:
+                victim, victim_depth = entry_offset, stored_depth
+
+        if target is None:
+            # depth-preferred: never evict something deeper than the new entry
+            if victim_depth > depth:
+                return False
+            target = victim
+
+        data = pack_entry(score, depth, flag, best_move)
+        struct.pack_into(ENTRY_FORMAT, self.map, target, (zobrist_hash ^ data) & MASK_64, data)
+        self.stores += 1
+        return True
+
+    def count_entries(self) -> int:
+        # full scan - for stats and tests, not for the search
+        count = 0
+        for offset in range(HEADER_SIZE, len(self.map), ENTRY_SIZE):
+            if struct.unpack_from('<Q', self.map, offset + 8)[0]:
+                count += 1
+        return count
+
+    def get_stats(self) -> dict:
+        return {
+            'path': self.path,
+            'capacity': self.bucket_count * ENTRIES_PER_BUCKET,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+        }
+
+    def flush(self):
+        if not self.readonly:
+            self.map.flush()
+
+    def close(self):
+        if self.map is not None:
+            self.flush()
+            self.map.close()
+            self.map = None
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,279 @@
+# Batch analysis - run the engine over big EPD/PGN files
+# positions are streamed, spread over a pool of worker processes
+# and written to JSONL as soon as each one finishes
+#
+#   python batch_analysis.py positions.epd -o results.jsonl --depth 5 --workers 8
+#   python batch_analysis.py games.pgn -o results.jsonl --resume
+#   python batch_analysis.py puzzles.epd -o mates.jsonl --mate 5     # mate solver instead
+
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pgn
+from analysis_store import PersistentAnalysisStore
+from chess_board import ChessBoard, move_to_notation
+from chess_engine import ChessEngine, TranspositionTable
+
+
+# Position sources (generators, so huge files never sit in memory)
+
+EPD_ID_PATTERN = re.compile(r'\bid\s+"([^"]*)"')
+
+
+def read_epd(path: str) -> Iterator[Tuple[str, str]]:
+    # yields (position_id, fen) for every EPD line
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            fields = line.split()
+            if len(fields) < 4:
+                continue
+
+            # Some files carry full FENs (with clocks) in front of the operations
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                fen = ' '.join(fields[:6])
+            else:
+                fen = ' '.join(fields[:4]) + ' 0 1'
+
+            match = EPD_ID_PATTERN.search(line)
+            position_id = match.group(1) if match else f"line{line_number}"
+            yield position_id, fen
+
+
+def read_pgn(path: str, min_ply: int = 0) -> Iterator[Tuple[str, str]]:
+    # yields (position_id, fen) for the position before every move of every game
+    for game_number, game in enumerate(pgn.read_games(path), 1):
+        try:
+            for ply, (board, _) in enumerate(game.mainline()):
+                if ply >= min_ply:
+                    yield f"game{game_number}:ply{ply}", board.to_fen()
+        except ValueError:
+            continue  # skip the rest of a game we can't follow
+
+
+def read_positions(path: str, min_ply: int = 0) -> Iterator[Tuple[str, str]]:
+    # pick the reader from the file extension
+    if path.lower().endswith('.pgn'):
+        return read_pgn(path, min_ply)
+    return read_epd(path)
+
+
+# Worker side - one long-lived engine per process
+
+_worker_engine: Optional[ChessEngine] = None
+
+
+def _init_worker(tt_size_mb: int, store_path: Optional[str]):
+    global _worker_engine
+    # workers only read the shared store, the parent process writes it
+    store = PersistentAnalysisStore(store_path, readonly=True) if store_path else None
+    _worker_engine = ChessEngine(tt_size_mb=tt_size_mb, analysis_store=store)
+
+
+def _analyse_position(task: Tuple[int, str, str, int, float, Optional[int]]) -> Dict:
+    # a position that can't be analysed (a bad FEN line) gets an error record
+    # instead of ending the whole run
+    index, position_id, fen, max_depth, max_time, mate_moves = task
+    try:
+        return _analyse(index, position_id, fen, max_depth, max_time, mate_moves)
+    except Exception as e:
+        return {'index': index, 'id': position_id, 'fen': fen, 'error': str(e)}
+
+
+def _analyse(index: int, position_id: str, fen: str, max_depth: int, max_time: float,
+             mate_moves: Optional[int]) -> Dict:
+    start_time = time.time()
+
+    board = ChessBoard.from_fen(fen)
+    if mate_moves:
+        return _solve_mate(index, position_id, fen, board, mate_moves, max_time)
+    best_move, score = _worker_engine.search(board, max_depth=max_depth, max_time=max_time)
+    stats = _worker_engine.get_statistics()
+
+    return {
+        'index': index,
+        'id': position_id,
+        'fen': fen,
+        'best_move': move_to_notation(best_move) if best_move else None,
+        'score': score if best_move else None,
+        'depth': stats['depth'],
+        'nodes': stats['nodes_searched'],
+        'time': round(time.time() - start_time, 4),
+    }
+
+
+def _solve_mate(index: int, position_id: str, fen: str, board: ChessBoard, mate_moves: int,
+                max_time: float) -> Dict:
+    result = _worker_engine.solve_mate(board, max_moves=mate_moves, max_time=max_time)
+    return {
+        'index': index,
+        'id': position_id,
+        'fen': fen,
+        'status': result['status'],
+        'mate_in': result['mate_in'],
+        'line': [move_to_notation(move) for move in result['line']],
+        'nodes': result['nodes'],
+        'time': round(result['time'], 4),
+    }
+
+
+# Driver
+
+class Checkpoint:
+    # Tracks which stream indices are done so a run can resume
+    # everything below `watermark` is done, plus the few finished out of order above it
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermark = 0
+        self.done_above = set()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            self.watermark = data['watermark']
+            self.done_above = set(data['done_above'])
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self.done_above
+
+    def mark_done(self, index: int):
+        self.done_above.add(index)
+        while self.watermark in self.done_above:
+            self.done_above.remove(self.watermark)
+            self.watermark += 1
+
+    def save(self):
+        # write-then-rename so a crash never leaves a half written checkpoint
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'watermark': self.watermark,
+                       'done_above': sorted(self.done_above)}, f)
+        os.replace(tmp_path, self.path)
+
+    def recover(self, output_path: str):
+        # the output is flushed before the checkpoint is saved, so a crash in between
+        # leaves records the checkpoint doesn't know about - count those as done too,
+        # and drop a last line the crash cut short, so resuming never duplicates records
+        if not os.path.exists(output_path):
+            return
+        with open(output_path, 'r+b') as f:
+            good_size = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    index = json.loads(line)['index']
+                except (ValueError, KeyError):
+                    break
+                if not self.is_done(index):
+                    self.mark_done(index)
+                good_size += len(line)
+            f.truncate(good_size)
+
+
+def run_batch(input_path: str, output_path: str, max_depth: int = 4, max_time: float = 5.0,
+              workers: Optional[int] = None, tt_size_mb: int = 64, resume: bool = False,
+              min_ply: int = 0, max_pending: Optional[int] = None,
+              store_path: Optional[str] = None, store_size_mb: int = 256,
+              mate_moves: Optional[int] = None) -> int:
+    # analyse every position in input_path, returns number of results written
+    # with mate_moves, solve for a mate in at most that many moves instead
+    workers = workers or os.cpu_count() or 1
+    # bounded number of in-flight tasks keeps memory flat on any input size
+    max_pending = max_pending or workers * 4
+
+    checkpoint = Checkpoint(output_path + '.ckpt')
+    if resume:
+        checkpoint.load()
+        checkpoint.recover(output_path)
+    elif os.path.exists(checkpoint.path):
+        os.remove(checkpoint.path)
+
+    # created here (before the workers start) so they can map it read-only
+    store = PersistentAnalysisStore(store_path, size_mb=store_size_mb) if store_path else None
+
+    written = 0
+    with open(output_path, 'a' if resume else 'w') as out, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                   initargs=(tt_size_mb, store_path)) as pool:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending, written
+            done, pending = concurrent.futures.wait(pending, return_when=return_when)
+            for future in done:
+                result = future.result()
+                out.write(json.dumps(result) + '\n')
+                written += 1
+                checkpoint.mark_done(result['index'])
+                if store is not None and result.get('best_move'):
+                    _record_in_store(store, result)
+            out.flush()
+            checkpoint.save()
+
+        for index, (position_id, fen) in enumerate(read_positions(input_path, min_ply)):
+            if checkpoint.is_done(index):
+                continue
+            pending.add(pool.submit(_analyse_position, (index, position_id, fen, max_depth, max_time,
+                                                           mate_moves)))
+            if len(pending) >= max_pending:
+                drain(concurrent.futures.FIRST_COMPLETED)
+
+        while pending:
+            drain(concurrent.futures.FIRST_COMPLETED)
+
+    if store is not None:
+        store.close()
+
+    return written
+
+
+def _record_in_store(store: PersistentAnalysisStore, result: Dict):
+    # the search's result is its last finished depth, stored as exact like the
+    # engine's own writes - depth 0 means a limit cut even depth 1 short
+    if not result['depth']:
+        return
+    board = ChessBoard.from_fen(result['fen'])
+    move = board.parse_move(result['best_move'])
+    if move is not None:
+        store.store(board.zobrist_key, result['depth'], result['score'], TranspositionTable.EXACT, move)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Analyse every position of an EPD or PGN file")
+    parser.add_argument('input', help="EPD or PGN file (.pgn is read as PGN)")
+    parser.add_argument('-o', '--output', required=True, help="JSONL output file")
+    parser.add_argument('--depth', type=int, default=4, help="max search depth per position")
+    parser.add_argument('--time', type=float, default=5.0, help="max seconds per position")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--tt-mb', type=int, default=64, help="transposition table size per worker")
+    parser.add_argument('--min-ply', type=int, default=0, help="skip the first plies of each PGN game")
+    parser.add_argument('--resume', action='store_true', help="continue from the checkpoint next to the output")
+    parser.add_argument('--store', default=None, help="persistent analysis store to reuse results across runs")
+    parser.add_argument('--mate', type=int, default=None, metavar='N',
+                        help="run the mate solver for a mate in at most N moves instead of a search")
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    written = run_batch(args.input, args.output, max_depth=args.depth, max_time=args.time,
+                        workers=args.workers, tt_size_mb=args.tt_mb, resume=args.resume,
+                        min_ply=args.min_ply, store_path=args.store, mate_moves=args.mate)
+    elapsed = time.time() - start_time
+    rate = written / elapsed if elapsed > 0 else 0
+    print(f"Analysed {written:,} positions in {elapsed:.1f}s ({rate:.1f} positions/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
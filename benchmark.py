@@ -0,0 +1,273 @@
+# Performance benchmarks for the engine
+# run: python benchmark.py [games.pgn] [net.nnue]
+
+import io
+import random
+import subprocess
+import sys
+import time
+from typing import Optional
+
+import pgn
+from chess_board import AttackMap, ChessBoard
+from chess_engine import ChessEngine
+from evaluation import Evaluator
+from nnue import NNUEEvaluator, NNUENetwork
+from search_limits import SearchLimits
+from smp import ParallelSearch, gil_disabled
+
+
+# Middlegame position with castling, pins and en passant chances ("kiwipete")
+BOARD_BENCH_FEN = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+# Positions a lazy evaluation must not get wrong: stalemate and mate with one side far ahead
+LAZY_EVAL_FENS = (
+    'k7/8/1Q6/8/8/8/8/2K5 b - - 0 1',
+    'k7/1Q6/1K6/8/8/8/8/8 b - - 0 1',
+    BOARD_BENCH_FEN,
+)
+
+
+class PerformanceBenchmark:
+
+    def __init__(self, depth: int = 4, time_limit: float = 30.0):
+        self.depth = depth
+        self.time_limit = time_limit
+
+    def _timed_rate(self, func, seconds: float = 0.5) -> float:
+        # calls per second, running func for roughly `seconds`
+        calls = 0
+        start_time = time.perf_counter()
+        while True:
+            for _ in range(100):
+                func()
+            calls += 100
+            elapsed = time.perf_counter() - start_time
+            if elapsed >= seconds:
+                return calls / elapsed
+
+    def benchmark_startup(self, runs: int = 5):
+        # what a worker pays before its first search: engine construction in a warm
+        # process, and a fresh interpreter importing the engine and building one
+        print("Startup benchmark")
+        construct_rate = self._timed_rate(lambda: ChessEngine(tt_size_mb=16), seconds=0.2)
+        print(f"  ChessEngine():   {1000 / construct_rate:.3f} ms")
+
+        script = 'import time; t = time.perf_counter(); import chess_engine; chess_engine.ChessEngine(); ' \
+                 'print(time.perf_counter() - t)'
+        warmups = [float(subprocess.run([sys.executable, '-c', script], capture_output=True,
+                                        text=True, check=True).stdout)
+                   for _ in range(runs)]
+        print(f"  process warm-up: {min(warmups) * 1000:.1f} ms (import + first engine, best of {runs})")
+        print()
+
+    def benchmark_board(self):
+        # board memory and raw move generation / attack check throughput
+        print("Board benchmark (kiwipete)")
+        board = ChessBoard.from_fen(BOARD_BENCH_FEN)
+        search_copy = board.copy()
+        board_bytes = sys.getsizeof(search_copy) + sys.getsizeof(search_copy.squares) + \
+            sys.getsizeof(search_copy.move_history)
+
+        print(f"  board size:     {board_bytes:,} bytes per copy")
+        print(f"  copy:           {self._timed_rate(board.copy):,.0f} copies/s")
+
+        def generate_fresh():
+            # a new position every call - no attack map or move list kept from the last one
+            board.attacks = None
+            board.generate_moves(ChessBoard.WHITE)
+
+        print(f"  generate_moves: {self._timed_rate(generate_fresh):,.0f} calls/s")
+        print(f"  attack checks:  "
+              f"{self._timed_rate(lambda: board.is_square_attacked(4, 4, ChessBoard.BLACK)):,.0f} calls/s")
+        sweep_rate = self._timed_rate(lambda: [board.is_square_attacked(row, col, color)
+                                               for row in range(8) for col in range(8)
+                                               for color in (ChessBoard.WHITE, ChessBoard.BLACK)])
+        print(f"  attack sweep:   {sweep_rate * 128:,.0f} checks/s (all squares, both colors)")
+        print(f"  attack map:     {self._timed_rate(lambda: AttackMap(board)):,.0f} maps/s (both colors, pins, checks)")
+        print()
+
+    def benchmark_search(self):
+        # iterative deepening from the starting position
+        print("Search benchmark (starting position)")
+        engine = ChessEngine(tt_size_mb=64)
+        board = ChessBoard()
+
+        start_time = time.time()
+        limits = SearchLimits(depth=self.depth, movetime=self.time_limit)
+        for info in engine.iter_search(board, limits):
+            print(f"  depth {info.depth}: score={info.score}, nodes={info.nodes:,}, "
+                  f"nps={info.nps:,.0f}, time={info.time:.2f}s")
+        elapsed = time.time() - start_time
+        stats = engine.get_statistics()
+
+        print(f"  total: {stats['nodes_searched']:,} nodes in {elapsed:.2f}s "
+              f"({stats['nodes_searched'] / elapsed:,.0f} nps)")
+        print(f"  cutoffs: {stats['cutoffs']:,}, TT hit rate: {stats['tt_stats']['hit_rate']:.1%}")
+        eval_stats = stats['eval_stats']
+        evaluations = eval_stats['evaluations'] or 1
+        print(f"  lazy eval: {eval_stats['evaluations']:,} evals, king safety skipped "
+              f"{eval_stats['skipped_king_safety'] / evaluations:.1%}, mobility skipped "
+              f"{eval_stats['skipped_mobility'] / evaluations:.1%}")
+        print()
+
+    def check_lazy_evaluation(self, windows=((-50, 50), (-1000, -900), (900, 1000))):
+        # a windowed evaluate must land on the same side of the window as the full one
+        print("Lazy evaluation check")
+        evaluator = Evaluator()
+        failures = 0
+        for fen in LAZY_EVAL_FENS:
+            full = evaluator.evaluate(ChessBoard.from_fen(fen))
+            for alpha, beta in windows:
+                lazy = evaluator.evaluate(ChessBoard.from_fen(fen), alpha, beta)
+                if (full <= alpha) != (lazy <= alpha) or (full >= beta) != (lazy >= beta):
+                    failures += 1
+                    print(f"  FAILED {fen} window ({alpha}, {beta}): full {full}, lazy {lazy}")
+        print(f"  {len(LAZY_EVAL_FENS) * len(windows) - failures}/{len(LAZY_EVAL_FENS) * len(windows)} ok")
+        print()
+        return failures == 0
+
+    def benchmark_threads(self, thread_counts=(1, 2, 4, 8, 16), depth: int = 4):
+        # time to a fixed depth with 1..16 parallel engines (threads without the GIL,
+        # processes splitting the root moves with it)
+        mode = "threads, GIL disabled" if gil_disabled() else "processes, GIL enabled"
+        print(f"Parallel search benchmark (kiwipete, depth {depth}, {mode})")
+        board = ChessBoard.from_fen(BOARD_BENCH_FEN)
+        base_time = None
+        for threads in thread_counts:
+            searcher = ParallelSearch(threads=threads, tt_size_mb=32)
+            searcher.search(board, SearchLimits(depth=1))  # start the workers
+
+            start_time = time.perf_counter()
+            searcher.search(board, SearchLimits(depth=depth))
+            elapsed = time.perf_counter() - start_time
+            searcher.close()
+
+            base_time = base_time or elapsed
+            print(f"  {threads:2d}: {elapsed:6.2f}s, {searcher.nodes_searched / elapsed:8,.0f} nps, "
+                  f"speedup {base_time / elapsed:.2f}x")
+        print()
+
+    def _random_games_pgn(self, games: int, max_plies: int = 80, seed: int = 1) -> str:
+        # synthetic PGN made of random legal games
+        rng = random.Random(seed)
+        out = io.StringIO()
+        writer = pgn.PGNWriter(out)
+        for _ in range(games):
+            board = ChessBoard()
+            moves = []
+            for _ in range(max_plies):
+                legal_moves = board.generate_moves(board.current_turn)
+                if not legal_moves:
+                    break
+                move = rng.choice(legal_moves)
+                moves.append(move)
+                board.make_move(move)
+            writer.write_game(moves)
+        return out.getvalue()
+
+    def benchmark_pgn(self, path: Optional[str] = None, games: int = 200):
+        # games per second for header/movetext parsing and full SAN decoding
+        print("PGN benchmark")
+        if path is None:
+            text = self._random_games_pgn(games)
+            open_source = lambda: io.StringIO(text)
+            print(f"  source: {games} random games ({len(text) / 1024:.0f} KB)")
+        else:
+            open_source = lambda: path
+            print(f"  source: {path}")
+
+        start_time = time.time()
+        parsed = sum(1 for _ in pgn.read_games(open_source()))
+        elapsed = time.time() - start_time
+        print(f"  parse:  {parsed:,} games in {elapsed:.2f}s ({parsed / elapsed:,.0f} games/s)")
+
+        start_time = time.time()
+        decoded = 0
+        plies = 0
+        for game in pgn.read_games(open_source()):
+            try:
+                plies += len(game.moves())
+                decoded += 1
+            except ValueError:
+                pass
+        elapsed = time.time() - start_time
+        print(f"  decode: {decoded:,} games ({plies:,} plies) in {elapsed:.2f}s "
+              f"({decoded / elapsed:,.0f} games/s, {plies / elapsed:,.0f} plies/s)")
+
+        if path is None:
+            games_moves = [game.moves() for game in pgn.read_games(open_source())]
+            start_time = time.time()
+            out = io.StringIO()
+            writer = pgn.PGNWriter(out)
+            for moves in games_moves:
+                writer.write_game(moves)
+            elapsed = time.time() - start_time
+            print(f"  write:  {len(games_moves):,} games in {elapsed:.2f}s "
+                  f"({len(games_moves) / elapsed:,.0f} games/s)")
+        print()
+
+    def benchmark_nnue(self, path: Optional[str] = None):
+        # evals per second of the NNUE evaluator against the hand-written one
+        print("NNUE benchmark (kiwipete + every child position)")
+        try:
+            network = NNUENetwork.load(path) if path else NNUENetwork.random()
+        except ImportError:
+            print("  skipped: numpy is not installed")
+            print()
+            return
+        print(f"  network: {path or 'random weights'} ({network.hidden} per side)")
+
+        board = ChessBoard.from_fen(BOARD_BENCH_FEN)
+        moves = board.generate_moves(ChessBoard.WHITE)
+        nnue_evaluator = NNUEEvaluator(network)
+        nnue_evaluator.prepare(board)
+        positions = []
+        for move in moves:
+            child = board.copy()
+            child.make_move(move)
+            positions.append(child)
+
+        def evals_per_second(evaluate):
+            return self._timed_rate(lambda: [evaluate(position) for position in positions]) * len(positions)
+
+        evaluator = Evaluator()
+        print(f"  Evaluator.evaluate:     {evals_per_second(evaluator.evaluate):,.0f} evals/s")
+        print(f"  NNUEEvaluator.evaluate: {evals_per_second(nnue_evaluator.evaluate):,.0f} evals/s")
+        print(f"  network only:           "
+              f"{evals_per_second(lambda p: network.forward(p.accumulator.white, p.accumulator.black)):,.0f} evals/s")
+
+        # what the accumulator adds to every make_move, against a from-scratch refresh
+        def make_all(root):
+            for move in moves:
+                root.copy().make_move(move)
+
+        plain = board.copy()
+        plain.accumulator = None
+        plain_rate = self._timed_rate(lambda: make_all(plain)) * len(moves)
+        nnue_rate = self._timed_rate(lambda: make_all(board)) * len(moves)
+        print(f"  copy + make_move:       {plain_rate:,.0f}/s plain, {nnue_rate:,.0f}/s with accumulator")
+        print(f"  full refresh:           {self._timed_rate(lambda: network.new_accumulator(board)):,.0f}/s")
+        print()
+
+    def run_full_benchmark_suite(self, pgn_path: Optional[str] = None, nnue_path: Optional[str] = None):
+        print("=" * 60)
+        print("   ENGINE BENCHMARKS")
+        print("=" * 60 + "\n")
+        self.benchmark_startup()
+        self.benchmark_board()
+        self.benchmark_search()
+        self.check_lazy_evaluation()
+        self.benchmark_threads()
+        self.benchmark_pgn(pgn_path)
+        self.benchmark_nnue(nnue_path)
+
+
+def main():
+    pgn_path = next((arg for arg in sys.argv[1:] if not arg.endswith('.nnue')), None)
+    nnue_path = next((arg for arg in sys.argv[1:] if arg.endswith('.nnue')), None)
+    PerformanceBenchmark().run_full_benchmark_suite(pgn_path, nnue_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,113 @@
 # Chess board and move generation
-# Basic board representation with 8x8 array
+# Compact board: 64 squares in a bytearray holding small-int piece codes
 
-import copy
+import random
 from typing import List, Tuple, Optional
 
 
+# Square index = row * 8 + col, row 0 is rank 8 (same layout as the old 8x8 array)
+SQUARE_COORDS = tuple((square // 8, square % 8) for square in range(64))
+
+# Piece codes: piece type in the low 3 bits, color in bit 3
+# white pawn..king = 1..6, black pawn..king = 9..14, 0 = empty
+COLOR_SHIFT = 3
+TYPE_MASK = 7
+
+# Offsets and ray directions as (drow, dcol)
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                  (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1),
+                (0, 1), (1, -1), (1, 0), (1, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+QUEEN_DIRECTIONS = KING_OFFSETS  # same rays, in the order the old movegen used
+
+
+def _on_board(row: int, col: int) -> bool:
+    return 0 <= row < 8 and 0 <= col < 8
+
+
+def _step_table(offsets: Tuple) -> Tuple:
+    # [square] -> target squares one step away, off-board steps left out
+    return tuple(tuple((row + drow) * 8 + col + dcol for drow, dcol in offsets
+                       if _on_board(row + drow, col + dcol))
+                 for row, col in SQUARE_COORDS)
+
+
+def _ray_table(directions: Tuple) -> Tuple:
+    # [square] -> one tuple of squares per direction, nearest first, empty rays left out
+    table = []
+    for row, col in SQUARE_COORDS:
+        rays = []
+        for drow, dcol in directions:
+            ray = []
+            new_row, new_col = row + drow, col + dcol
+            while _on_board(new_row, new_col):
+                ray.append(new_row * 8 + new_col)
+                new_row += drow
+                new_col += dcol
+            if ray:
+                rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return tuple(table)
+
+
+# Import-time attack tables - move generation and attack checks index these
+# instead of adding offsets and testing bounds on every step
+KNIGHT_TARGETS = _step_table(KNIGHT_OFFSETS)
+KING_TARGETS = _step_table(KING_OFFSETS)
+BISHOP_RAYS = _ray_table(BISHOP_DIRECTIONS)
+ROOK_RAYS = _ray_table(ROOK_DIRECTIONS)
+QUEEN_RAYS = _ray_table(QUEEN_DIRECTIONS)
+
+# [color][square] -> squares a pawn of that color on square attacks
+PAWN_ATTACKS = (_step_table(((-1, -1), (-1, 1))), _step_table(((1, -1), (1, 1))))
+
+# Castling right bits (same order as the old castling_rights list)
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING = 15
+
+# castling &= CASTLING_KEEP[square] for both squares of a move - moving the king
+# or a rook off its square, or capturing a rook on it, drops the right
+CASTLING_KEEP = [ALL_CASTLING] * 64
+CASTLING_KEEP[60] = ALL_CASTLING & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)  # e1
+CASTLING_KEEP[63] = ALL_CASTLING & ~WHITE_KINGSIDE                      # h1
+CASTLING_KEEP[56] = ALL_CASTLING & ~WHITE_QUEENSIDE                     # a1
+CASTLING_KEEP[4] = ALL_CASTLING & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)   # e8
+CASTLING_KEEP[7] = ALL_CASTLING & ~BLACK_KINGSIDE                       # h8
+CASTLING_KEEP[0] = ALL_CASTLING & ~BLACK_QUEENSIDE                      # a8
+
+# Moves are 16-bit ints: from square | to square << 6 | flags (bits 12-15), 0 = no move
+# flags are kept shifted so they can be or-ed straight into a move
+TO_SHIFT = 6
+SQUARE_MASK = 63
+FLAG_MASK = 0xF000
+QUIET = 0
+DOUBLE_PAWN_PUSH = 1 << 12
+KING_CASTLE = 2 << 12
+QUEEN_CASTLE = 3 << 12
+CAPTURE = 4 << 12
+EN_PASSANT = 5 << 12
+PROMOTION = 8 << 12  # | (promotion piece - KNIGHT) << 12, | CAPTURE for capture-promotions
+
+# Promotion flags for queen, rook, bishop, knight (piece types 5..2)
+PROMOTION_FLAGS = tuple(PROMOTION | (piece_type - 2) << 12 for piece_type in (5, 4, 3, 2))
+
+# Empty entry of ChessBoard.piece_squares
+NO_SQUARES = frozenset()
+
+
 class ChessBoard:
     # Chess board class - stores pieces and generates moves
     
+    __slots__ = ('squares', 'piece_squares', 'white_king_square', 'black_king_square', 'current_turn',
+                 'castling', 'en_passant_square', 'move_history', 'halfmove_clock',
+                 'fullmove_number', 'zobrist_key', 'key_stack', 'accumulator', 'position_score',
+                 'attacks')
+    
     # Piece constants
     EMPTY = 0
     PAWN = 1
@@ -23,17 +123,17 @@ class ChessBoard:
     
     def __init__(self):
         # setup board to starting position
-        # board[row][col] = (piece_type, color) or None
-        self.board = [[None for _ in range(8)] for _ in range(8)]
-        self.white_king_pos = (7, 4)
-        self.black_king_pos = (0, 4)
+        # squares[row * 8 + col] = piece code (0 = empty)
+        self.squares = bytearray(64)
+        self.white_king_square = 60
+        self.black_king_square = 4
         self.current_turn = self.WHITE
         
-        # Castling rights [white_kingside, white_queenside, black_kingside, black_queenside]
-        self.castling_rights = [True, True, True, True]
+        # Castling right bits (WHITE_KINGSIDE | WHITE_QUEENSIDE | ...)
+        self.castling = ALL_CASTLING
         
-        # En passant target square (row, col) or None
-        self.en_passant_target = None
+        # En passant target square index or -1
+        self.en_passant_square = -1
         
         # Move history for debugging and analysis
         self.move_history = []
@@ -41,408 +141,695 @@ class ChessBoard:
         # Halfmove clock for fifty-move rule
         self.halfmove_clock = 0
         
+        # Fullmove number (starts at 1, goes up after black moves)
+        self.fullmove_number = 1
+        
         # Initialize to starting position
         self._setup_initial_position()
+        
+        # piece_squares[piece code] = frozenset of the squares holding that piece
+        # the sets are never changed in place, so copies share them and make_move
+        # swaps in new ones for the few pieces that moved
+        self.piece_squares = [NO_SQUARES] * 16
+        for square, code in enumerate(self.squares):
+            if code:
+                self.piece_squares[code] |= {square}
+        
+        # Zobrist key of the current position, updated incrementally by make_move
+        self.zobrist_key = ZOBRIST.hash_position(self)
+        
+        # Keys of earlier positions as a linked stack (key, rest) - copies share it,
+        # and it's cleared on irreversible moves so it never outgrows halfmove_clock
+        self.key_stack = None
+        
+        # Optional incremental evaluator state (see nnue.py and evaluation.py), None when
+        # unused - make_move swaps each for an updated copy, so board copies can share them
+        self.accumulator = None
+        self.position_score = None
+        
+        # AttackMap of the current position, built on first use (see attack_map)
+        self.attacks = None
     
     def _setup_initial_position(self):
         # put pieces in starting positions
         # Black pieces (row 0 and 1)
-        back_rank = [self.ROOK, self.KNIGHT, self.BISHOP, self.QUEEN, 
+        back_rank = [self.ROOK, self.KNIGHT, self.BISHOP, self.QUEEN,
                      self.KING, self.BISHOP, self.KNIGHT, self.ROOK]
         
+        black = self.BLACK << COLOR_SHIFT
         for col in range(8):
-            self.board[0][col] = (back_rank[col], self.BLACK)
-            self.board[1][col] = (self.PAWN, self.BLACK)
+            self.squares[col] = back_rank[col] | black
+            self.squares[8 + col] = self.PAWN | black
         
         # White pieces (row 6 and 7)
         for col in range(8):
-            self.board[6][col] = (self.PAWN, self.WHITE)
-            self.board[7][col] = (back_rank[col], self.WHITE)
+            self.squares[48 + col] = self.PAWN
+            self.squares[56 + col] = back_rank[col]
+    
+    # (row, col) views of the compact state - for callers outside the hot loops
+    
+    @property
+    def white_king_pos(self) -> Tuple[int, int]:
+        return SQUARE_COORDS[self.white_king_square]
+    
+    @property
+    def black_king_pos(self) -> Tuple[int, int]:
+        return SQUARE_COORDS[self.black_king_square]
+    
+    @property
+    def castling_rights(self) -> List[bool]:
+        # [white_kingside, white_queenside, black_kingside, black_queenside]
+        return [bool(self.castling & (1 << i)) for i in range(4)]
+    
+    @castling_rights.setter
+    def castling_rights(self, rights: List[bool]):
+        self.castling = sum(1 << i for i, right in enumerate(rights) if right)
+    
+    @property
+    def en_passant_target(self) -> Optional[Tuple[int, int]]:
+        return SQUARE_COORDS[self.en_passant_square] if self.en_passant_square >= 0 else None
+    
+    @en_passant_target.setter
+    def en_passant_target(self, target: Optional[Tuple[int, int]]):
+        self.en_passant_square = target[0] * 8 + target[1] if target else -1
+    
+    @classmethod
+    def from_fen(cls, fen: str) -> 'ChessBoard':
+        # build a board from a FEN string
+        board = cls()
+        board.set_fen(fen)
+        return board
+    
+    def set_fen(self, fen: str):
+        # load a position from FEN (clocks are optional, like in EPD)
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        
+        placement, side, castling, en_passant = fields[:4]
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError(f"Invalid FEN placement: {placement!r}")
+        
+        self.squares = bytearray(64)
+        self.piece_squares = [NO_SQUARES] * 16
+        for row, rank in enumerate(ranks):
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                piece_type = FEN_PIECES.find(char.lower()) + 1
+                if piece_type == 0 or col > 7:
+                    raise ValueError(f"Invalid FEN placement: {placement!r}")
+                color = self.WHITE if char.isupper() else self.BLACK
+                self.set_piece(row, col, (piece_type, color))
+                col += 1
+            if col != 8:
+                raise ValueError(f"Invalid FEN placement: {placement!r}")
+        
+        if side not in ('w', 'b'):
+            raise ValueError(f"Invalid FEN side to move: {side!r}")
+        self.current_turn = self.WHITE if side == 'w' else self.BLACK
+        
+        self.castling_rights = [char in castling for char in 'KQkq']
+        self.en_passant_target = None if en_passant == '-' else parse_square(en_passant)
+        
+        try:
+            self.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            self.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Invalid FEN clocks: {fen!r}")
+        
+        self.move_history = []
+        self.zobrist_key = ZOBRIST.hash_position(self)
+        self.key_stack = None
+        self.accumulator = None
+        self.position_score = None
+        self.attacks = None
+    
+    def to_fen(self) -> str:
+        # current position as a FEN string
+        ranks = []
+        for row in range(8):
+            rank = ''
+            empty = 0
+            for col in range(8):
+                code = self.squares[row * 8 + col]
+                if not code:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                char = FEN_PIECES[(code & TYPE_MASK) - 1]
+                rank += char if code >> COLOR_SHIFT else char.upper()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        
+        castling = ''.join(char for char, right in zip('KQkq', self.castling_rights) if right)
+        en_passant = square_name(*self.en_passant_target) if self.en_passant_target else '-'
+        side = 'w' if self.current_turn == self.WHITE else 'b'
+        
+        return (f"{'/'.join(ranks)} {side} {castling or '-'} {en_passant} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
     
     def get_piece(self, row: int, col: int) -> Optional[Tuple[int, int]]:
+        # (piece_type, color) or None
         if 0 <= row < 8 and 0 <= col < 8:
-            return self.board[row][col]
+            code = self.squares[row * 8 + col]
+            if code:
+                return code & TYPE_MASK, code >> COLOR_SHIFT
         return None
     
     def set_piece(self, row: int, col: int, piece: Optional[Tuple[int, int]]):
-        self.board[row][col] = piece
+        # doesn't touch zobrist_key - meant for setting up positions
+        square = row * 8 + col
+        self.accumulator = None
+        self.position_score = None
+        self.attacks = None
+        piece_squares = self.piece_squares
+        old_code = self.squares[square]
+        if old_code:
+            piece_squares[old_code] -= {square}
+        code = piece_code(*piece) if piece else 0
+        self.squares[square] = code
+        if code:
+            piece_squares[code] |= {square}
         if piece and piece[0] == self.KING:
             if piece[1] == self.WHITE:
-                self.white_king_pos = (row, col)
+                self.white_king_square = square
             else:
-                self.black_king_pos = (row, col)
+                self.black_king_square = square
     
     def is_valid_square(self, row: int, col: int) -> bool:
         return 0 <= row < 8 and 0 <= col < 8
     
-    def generate_moves(self, color: int) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    def attack_map(self) -> 'AttackMap':
+        # attacks of both sides in this position, built once and reused until the next move
+        if self.attacks is None:
+            self.attacks = AttackMap(self)
+        return self.attacks
+    
+    def generate_moves(self, color: int) -> List[int]:
         # get all legal moves for the given color
-        # returns list of ((from_row, from_col), (to_row, to_col))
+        # returns a list of int moves (see encode_move)
+        # the list is kept on the attack map, so asking again in the same position is free
+        attacks = self.attack_map()
+        legal_moves = attacks.legal_moves[color]
+        if legal_moves is None:
+            legal_moves = attacks.legal_moves[color] = tuple(self._generate_legal_moves(color, attacks))
+        return list(legal_moves)
+    
+    def _generate_legal_moves(self, color: int, attacks: 'AttackMap') -> List[int]:
         pseudo_legal_moves = []
         
-        # Generate pseudo-legal moves for all pieces
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece and piece[1] == color:
-                    piece_type = piece[0]
-                    moves = self._generate_piece_moves(row, col, piece_type, color)
-                    pseudo_legal_moves.extend(moves)
+        # Generate pseudo-legal moves for all pieces, one piece type at a time
+        piece_squares = self.piece_squares
+        shift = color << COLOR_SHIFT
+        for square in piece_squares[self.PAWN | shift]:
+            self._generate_pawn_moves(square, color, pseudo_legal_moves)
+        for square in piece_squares[self.KNIGHT | shift]:
+            self._generate_step_moves(square, color, KNIGHT_TARGETS[square], pseudo_legal_moves)
+        for square in piece_squares[self.BISHOP | shift]:
+            self._generate_sliding_moves(square, color, BISHOP_RAYS[square], pseudo_legal_moves)
+        for square in piece_squares[self.ROOK | shift]:
+            self._generate_sliding_moves(square, color, ROOK_RAYS[square], pseudo_legal_moves)
+        for square in piece_squares[self.QUEEN | shift]:
+            self._generate_sliding_moves(square, color, QUEEN_RAYS[square], pseudo_legal_moves)
+        for square in piece_squares[self.KING | shift]:
+            self._generate_king_moves(square, color, pseudo_legal_moves)
         
         # Filter out moves that leave king in check
+        if not piece_squares[self.KING | shift]:
+            return [move for move in pseudo_legal_moves if self._is_legal_move(move, color)]
+        
+        # With the attack map that's a set lookup per move instead of an attack scan
+        king = self.king_square(color)
+        enemy_attacks = attacks.counts[1 - color]
+        escapes_blocked = attacks.escapes_blocked[color]
+        pins = attacks.pins[color]
+        check_blocks = attacks.check_blocks[color]
+        double_check = len(attacks.checkers[color]) > 1
+        
         legal_moves = []
         for move in pseudo_legal_moves:
-            if self._is_legal_move(move, color):
-                legal_moves.append(move)
-        
+            from_square = move & 63
+            to_square = move >> 6 & 63
+            if from_square == king:
+                # castling already checked its squares in _can_castle_*
+                if enemy_attacks[to_square] or to_square in escapes_blocked:
+                    continue
+            elif double_check:
+                continue
+            elif move & FLAG_MASK == EN_PASSANT:
+                # two pawns leave the rank at once - just try it
+                if not self._is_legal_move(move, color):
+                    continue
+            elif ((check_blocks is not None and to_square not in check_blocks)
+                  or (from_square in pins and to_square not in pins[from_square])):
+                continue
+            legal_moves.append(move)
         return legal_moves
     
-    def _generate_piece_moves(self, row: int, col: int, piece_type: int, color: int) -> List:
-        # generate moves based on piece type
+    def _generate_piece_moves(self, square: int, piece_type: int, color: int, moves: List[int]):
+        # append moves for one piece based on its type
         if piece_type == self.PAWN:
-            return self._generate_pawn_moves(row, col, color)
+            self._generate_pawn_moves(square, color, moves)
         elif piece_type == self.KNIGHT:
-            return self._generate_knight_moves(row, col, color)
+            self._generate_step_moves(square, color, KNIGHT_TARGETS[square], moves)
         elif piece_type == self.BISHOP:
-            return self._generate_bishop_moves(row, col, color)
+            self._generate_sliding_moves(square, color, BISHOP_RAYS[square], moves)
         elif piece_type == self.ROOK:
-            return self._generate_rook_moves(row, col, color)
+            self._generate_sliding_moves(square, color, ROOK_RAYS[square], moves)
         elif piece_type == self.QUEEN:
-            return self._generate_queen_moves(row, col, color)
+            self._generate_sliding_moves(square, color, QUEEN_RAYS[square], moves)
         elif piece_type == self.KING:
-            return self._generate_king_moves(row, col, color)
-        return []
+            self._generate_king_moves(square, color, moves)
     
-    def _generate_pawn_moves(self, row: int, col: int, color: int) -> List:
-        # pawn moves - forward, double move, captures, en passant
-        moves = []
-        direction = -1 if color == self.WHITE else 1
-        start_row = 6 if color == self.WHITE else 1
+    def _generate_pawn_moves(self, square: int, color: int, moves: List[int]):
+        # pawn moves - forward, double move, captures, en passant, promotions
+        squares = self.squares
+        row = square >> 3
+        if color == self.WHITE:
+            step, start_row, last_row = -8, 6, 1
+        else:
+            step, start_row, last_row = 8, 1, 6
         
         # Forward move
-        new_row = row + direction
-        if self.is_valid_square(new_row, col) and self.board[new_row][col] is None:
-            moves.append(((row, col), (new_row, col)))
-            
-            # Double move from starting position
-            if row == start_row:
-                new_row2 = row + 2 * direction
-                if self.board[new_row2][col] is None:
-                    moves.append(((row, col), (new_row2, col)))
-        
-        # Captures
-        for dcol in [-1, 1]:
-            new_col = col + dcol
-            new_row = row + direction
-            if self.is_valid_square(new_row, new_col):
-                target = self.board[new_row][new_col]
-                if target and target[1] != color:
-                    moves.append(((row, col), (new_row, new_col)))
+        forward = square + step
+        if not 0 <= forward < 64:
+            return
+        if not squares[forward]:
+            if row == last_row:
+                for flags in PROMOTION_FLAGS:
+                    moves.append(square | forward << 6 | flags)
+            else:
+                moves.append(square | forward << 6)
                 
-                # En passant
-                if self.en_passant_target == (new_row, new_col):
-                    moves.append(((row, col), (new_row, new_col)))
+                # Double move from starting position
+                if row == start_row and not squares[forward + step]:
+                    moves.append(square | (forward + step) << 6 | DOUBLE_PAWN_PUSH)
         
-        return moves
+        # Captures
+        for target_square in PAWN_ATTACKS[color][square]:
+            target = squares[target_square]
+            if target and target >> COLOR_SHIFT != color:
+                if row == last_row:
+                    for flags in PROMOTION_FLAGS:
+                        moves.append(square | target_square << 6 | flags | CAPTURE)
+                else:
+                    moves.append(square | target_square << 6 | CAPTURE)
+            
+            # En passant
+            elif target_square == self.en_passant_square:
+                moves.append(square | target_square << 6 | EN_PASSANT)
     
-    def _generate_knight_moves(self, row: int, col: int, color: int) -> List:
-        moves = []
-        knight_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                       (1, -2), (1, 2), (2, -1), (2, 1)]
-        
-        for drow, dcol in knight_moves:
-            new_row, new_col = row + drow, col + dcol
-            if self.is_valid_square(new_row, new_col):
-                target = self.board[new_row][new_col]
-                if target is None or target[1] != color:
-                    moves.append(((row, col), (new_row, new_col)))
+    def _generate_step_moves(self, square: int, color: int, targets: Tuple, moves: List[int]):
+        # knights and kings - one step to each target square (from KNIGHT/KING_TARGETS)
+        squares = self.squares
         
-        return moves
+        for target_square in targets:
+            target = squares[target_square]
+            if not target:
+                moves.append(square | target_square << 6)
+            elif target >> COLOR_SHIFT != color:
+                moves.append(square | target_square << 6 | CAPTURE)
     
-    def _generate_sliding_moves(self, row: int, col: int, color: int, directions: List) -> List:
-        # sliding pieces - keep going until hit edge or piece
-        moves = []
+    def _generate_sliding_moves(self, square: int, color: int, rays: Tuple, moves: List[int]):
+        # sliding pieces - walk each ray (from the *_RAYS tables) until hit a piece
+        squares = self.squares
         
-        for drow, dcol in directions:
-            new_row, new_col = row + drow, col + dcol
-            
-            while self.is_valid_square(new_row, new_col):
-                target = self.board[new_row][new_col]
+        for ray in rays:
+            for target_square in ray:
+                target = squares[target_square]
                 
-                if target is None:
-                    moves.append(((row, col), (new_row, new_col)))
-                elif target[1] != color:
-                    moves.append(((row, col), (new_row, new_col)))
-                    break
+                if not target:
+                    moves.append(square | target_square << 6)
                 else:
+                    if target >> COLOR_SHIFT != color:
+                        moves.append(square | target_square << 6 | CAPTURE)
                     break
-                
-                new_row += drow
-                new_col += dcol
-        
-        return moves
-    
-    def _generate_bishop_moves(self, row: int, col: int, color: int) -> List:
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-        return self._generate_sliding_moves(row, col, color, directions)
-    
-    def _generate_rook_moves(self, row: int, col: int, color: int) -> List:
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-        return self._generate_sliding_moves(row, col, color, directions)
     
-    def _generate_queen_moves(self, row: int, col: int, color: int) -> List:
-        directions = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
-                     (0, 1), (1, -1), (1, 0), (1, 1)]
-        return self._generate_sliding_moves(row, col, color, directions)
-    
-    def _generate_king_moves(self, row: int, col: int, color: int) -> List:
+    def _generate_king_moves(self, square: int, color: int, moves: List[int]):
         # king moves + castling
-        moves = []
-        
-        # Normal king moves
-        for drow in [-1, 0, 1]:
-            for dcol in [-1, 0, 1]:
-                if drow == 0 and dcol == 0:
-                    continue
-                new_row, new_col = row + drow, col + dcol
-                if self.is_valid_square(new_row, new_col):
-                    target = self.board[new_row][new_col]
-                    if target is None or target[1] != color:
-                        moves.append(((row, col), (new_row, new_col)))
+        self._generate_step_moves(square, color, KING_TARGETS[square], moves)
         
         # Castling
         if color == self.WHITE:
-            back_rank = 7
-            # Kingside castling
-            if self.castling_rights[0] and self._can_castle_kingside(color):
-                moves.append(((row, col), (back_rank, 6)))
-            # Queenside castling
-            if self.castling_rights[1] and self._can_castle_queenside(color):
-                moves.append(((row, col), (back_rank, 2)))
+            if self.castling & WHITE_KINGSIDE and self._can_castle_kingside(color):
+                moves.append(square | 62 << 6 | KING_CASTLE)
+            if self.castling & WHITE_QUEENSIDE and self._can_castle_queenside(color):
+                moves.append(square | 58 << 6 | QUEEN_CASTLE)
         else:
-            back_rank = 0
-            # Kingside castling
-            if self.castling_rights[2] and self._can_castle_kingside(color):
-                moves.append(((row, col), (back_rank, 6)))
-            # Queenside castling
-            if self.castling_rights[3] and self._can_castle_queenside(color):
-                moves.append(((row, col), (back_rank, 2)))
-        
-        return moves
+            if self.castling & BLACK_KINGSIDE and self._can_castle_kingside(color):
+                moves.append(square | 6 << 6 | KING_CASTLE)
+            if self.castling & BLACK_QUEENSIDE and self._can_castle_queenside(color):
+                moves.append(square | 2 << 6 | QUEEN_CASTLE)
     
     def _can_castle_kingside(self, color: int) -> bool:
-        back_rank = 7 if color == self.WHITE else 0
+        base = 56 if color == self.WHITE else 0
+        squares = self.squares
         
         # Check if squares between king and rook are empty
-        if self.board[back_rank][5] is not None or self.board[back_rank][6] is not None:
+        if squares[base + 5] or squares[base + 6]:
             return False
         
         # Check if king is in check or passes through check
-        if self.is_square_attacked(back_rank, 4, 1 - color):
-            return False
-        if self.is_square_attacked(back_rank, 5, 1 - color):
-            return False
-        if self.is_square_attacked(back_rank, 6, 1 - color):
-            return False
-        
-        return True
+        enemy_attacks = self.attack_map().counts[1 - color]
+        return not (enemy_attacks[base + 4] or enemy_attacks[base + 5] or enemy_attacks[base + 6])
     
     def _can_castle_queenside(self, color: int) -> bool:
-        back_rank = 7 if color == self.WHITE else 0
+        base = 56 if color == self.WHITE else 0
+        squares = self.squares
         
         # Check if squares between king and rook are empty
-        if (self.board[back_rank][1] is not None or 
-            self.board[back_rank][2] is not None or 
-            self.board[back_rank][3] is not None):
+        if squares[base + 1] or squares[base + 2] or squares[base + 3]:
             return False
         
         # Check if king is in check or passes through check
-        if self.is_square_attacked(back_rank, 4, 1 - color):
-            return False
-        if self.is_square_attacked(back_rank, 3, 1 - color):
-            return False
-        if self.is_square_attacked(back_rank, 2, 1 - color):
-            return False
-        
-        return True
+        enemy_attacks = self.attack_map().counts[1 - color]
+        return not (enemy_attacks[base + 4] or enemy_attacks[base + 3] or enemy_attacks[base + 2])
     
     def is_square_attacked(self, row: int, col: int, by_color: int) -> bool:
         # check if square is under attack
-        # Check pawn attacks
-        pawn_direction = 1 if by_color == self.WHITE else -1
-        for dcol in [-1, 1]:
-            attack_row = row + pawn_direction
-            attack_col = col + dcol
-            if self.is_valid_square(attack_row, attack_col):
-                piece = self.board[attack_row][attack_col]
-                if piece and piece == (self.PAWN, by_color):
-                    return True
+        return self._square_attacked(row * 8 + col, by_color)
+    
+    def _square_attacked(self, square: int, by_color: int) -> bool:
+        # same as is_square_attacked but takes a square index
+        # compares piece codes only, nothing gets allocated
+        squares = self.squares
+        shift = by_color << COLOR_SHIFT
+        
+        # Check pawn attacks - the squares a pawn of ours here would attack
+        pawn = self.PAWN | shift
+        for attacker in PAWN_ATTACKS[1 - by_color][square]:
+            if squares[attacker] == pawn:
+                return True
         
         # Check knight attacks
-        knight_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                       (1, -2), (1, 2), (2, -1), (2, 1)]
-        for drow, dcol in knight_moves:
-            new_row, new_col = row + drow, col + dcol
-            if self.is_valid_square(new_row, new_col):
-                piece = self.board[new_row][new_col]
-                if piece and piece == (self.KNIGHT, by_color):
-                    return True
+        knight = self.KNIGHT | shift
+        for attacker in KNIGHT_TARGETS[square]:
+            if squares[attacker] == knight:
+                return True
         
         # Check sliding piece attacks
+        queen = self.QUEEN | shift
+        
         # Bishop/Queen diagonal attacks
-        for drow, dcol in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
-            new_row, new_col = row + drow, col + dcol
-            while self.is_valid_square(new_row, new_col):
-                piece = self.board[new_row][new_col]
+        bishop = self.BISHOP | shift
+        for ray in BISHOP_RAYS[square]:
+            for attacker in ray:
+                piece = squares[attacker]
                 if piece:
-                    if piece[1] == by_color and piece[0] in [self.BISHOP, self.QUEEN]:
+                    if piece == bishop or piece == queen:
                         return True
                     break
-                new_row += drow
-                new_col += dcol
         
         # Rook/Queen straight attacks
-        for drow, dcol in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            new_row, new_col = row + drow, col + dcol
-            while self.is_valid_square(new_row, new_col):
-                piece = self.board[new_row][new_col]
+        rook = self.ROOK | shift
+        for ray in ROOK_RAYS[square]:
+            for attacker in ray:
+                piece = squares[attacker]
                 if piece:
-                    if piece[1] == by_color and piece[0] in [self.ROOK, self.QUEEN]:
+                    if piece == rook or piece == queen:
                         return True
                     break
-                new_row += drow
-                new_col += dcol
         
         # Check king attacks
-        for drow in [-1, 0, 1]:
-            for dcol in [-1, 0, 1]:
-                if drow == 0 and dcol == 0:
-                    continue
-                new_row, new_col = row + drow, col + dcol
-                if self.is_valid_square(new_row, new_col):
-                    piece = self.board[new_row][new_col]
-                    if piece and piece == (self.KING, by_color):
-                        return True
+        king = self.KING | shift
+        for attacker in KING_TARGETS[square]:
+            if squares[attacker] == king:
+                return True
         
         return False
     
-    def _is_legal_move(self, move: Tuple, color: int) -> bool:
+    def king_square(self, color: int) -> int:
+        return self.white_king_square if color == self.WHITE else self.black_king_square
+    
+    def in_check(self, color: int) -> bool:
+        # one attack scan, unless the attack map is already there
+        if self.attacks is not None:
+            return self.attacks.counts[1 - color][self.king_square(color)] > 0
+        return self._square_attacked(self.king_square(color), 1 - color)
+    
+    def _is_legal_move(self, move: int, color: int) -> bool:
         # check if move is legal (king not in check after move)
         # Make the move temporarily
-        from_pos, to_pos = move
-        original_piece = self.board[to_pos[0]][to_pos[1]]
-        moving_piece = self.board[from_pos[0]][from_pos[1]]
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        squares = self.squares
         
-        self.board[to_pos[0]][to_pos[1]] = moving_piece
-        self.board[from_pos[0]][from_pos[1]] = None
+        moving_piece = squares[from_square]
+        original_piece = squares[to_square]
+        squares[to_square] = moving_piece
+        squares[from_square] = 0
         
-        # Update king position if king is moving
-        if moving_piece[0] == self.KING:
-            if color == self.WHITE:
-                old_king_pos = self.white_king_pos
-                self.white_king_pos = to_pos
-            else:
-                old_king_pos = self.black_king_pos
-                self.black_king_pos = to_pos
+        # En passant also takes a pawn off the board
+        en_passant_square = -1
+        if move & FLAG_MASK == EN_PASSANT:
+            en_passant_square = to_square + (8 if color == self.WHITE else -8)
+            en_passant_piece = squares[en_passant_square]
+            squares[en_passant_square] = 0
         
         # Check if king is in check
-        king_pos = self.white_king_pos if color == self.WHITE else self.black_king_pos
-        is_legal = not self.is_square_attacked(king_pos[0], king_pos[1], 1 - color)
+        if moving_piece & TYPE_MASK == self.KING:
+            king_square = to_square
+        else:
+            king_square = self.white_king_square if color == self.WHITE else self.black_king_square
+        is_legal = not self._square_attacked(king_square, 1 - color)
         
         # Undo the move
-        self.board[from_pos[0]][from_pos[1]] = moving_piece
-        self.board[to_pos[0]][to_pos[1]] = original_piece
-        
-        if moving_piece[0] == self.KING:
-            if color == self.WHITE:
-                self.white_king_pos = old_king_pos
-            else:
-                self.black_king_pos = old_king_pos
+        squares[from_square] = moving_piece
+        squares[to_square] = original_piece
+        if en_passant_square >= 0:
+            squares[en_passant_square] = en_passant_piece
         
         return is_legal
     
-    def make_move(self, move: Tuple) -> bool:
+    def make_move(self, move: int) -> bool:
         # actually make the move on the board
-        from_pos, to_pos = move
-        from_row, from_col = from_pos
-        to_row, to_col = to_pos
+        # the flags decide castling / en passant / promotion, so the move
+        # should come from generate_moves, parse_move or encode_move with flags
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        flags = move & FLAG_MASK
+        squares = self.squares
         
-        moving_piece = self.board[from_row][from_col]
+        moving_piece = squares[from_square]
         if not moving_piece:
             return False
+        self.attacks = None
+        
+        piece_type = moving_piece & TYPE_MASK
+        color = moving_piece >> COLOR_SHIFT
+        captured_piece = squares[to_square]
+        
+        # Promotions put a different piece on the target square
+        placed_piece = moving_piece
+        if flags & PROMOTION:
+            placed_piece = ((flags >> 12 & 3) + self.KNIGHT) | (color << COLOR_SHIFT)
         
-        captured_piece = self.board[to_row][to_col]
+        # Take the old castling/en passant state out of the key, put it back at the end
+        zobrist = ZOBRIST
+        keys = zobrist.square_keys
+        previous_key = self.zobrist_key
+        h = previous_key ^ zobrist.state_key(self)
+        h ^= keys[moving_piece][from_square] ^ keys[placed_piece][to_square]
+        if captured_piece:
+            h ^= keys[captured_piece][to_square]
         
         # Handle en passant capture
-        en_passant_capture = None
-        if moving_piece[0] == self.PAWN and self.en_passant_target == to_pos:
-            capture_row = to_row + (1 if moving_piece[1] == self.WHITE else -1)
-            en_passant_capture = self.board[capture_row][to_col]
-            self.board[capture_row][to_col] = None
+        piece_squares = self.piece_squares
+        en_passant_capture = 0
+        if flags == EN_PASSANT:
+            capture_square = to_square + (8 if color == self.WHITE else -8)
+            en_passant_capture = squares[capture_square]
+            squares[capture_square] = 0
+            if en_passant_capture:
+                h ^= keys[en_passant_capture][capture_square]
+                piece_squares[en_passant_capture] -= {capture_square}
         
         # Make the move
-        self.board[to_row][to_col] = moving_piece
-        self.board[from_row][from_col] = None
-        
-        # Handle castling
-        if moving_piece[0] == self.KING and abs(to_col - from_col) == 2:
-            # Kingside castling
-            if to_col == 6:
-                rook = self.board[to_row][7]
-                self.board[to_row][5] = rook
-                self.board[to_row][7] = None
-            # Queenside castling
-            elif to_col == 2:
-                rook = self.board[to_row][0]
-                self.board[to_row][3] = rook
-                self.board[to_row][0] = None
+        squares[to_square] = placed_piece
+        squares[from_square] = 0
+        if captured_piece:
+            piece_squares[captured_piece] -= {to_square}
+        if placed_piece == moving_piece:
+            # from is in the set and to isn't, so one symmetric difference does both
+            piece_squares[moving_piece] ^= {from_square, to_square}
+        else:
+            piece_squares[moving_piece] -= {from_square}
+            piece_squares[placed_piece] |= {to_square}
         
-        # Update castling rights
-        if moving_piece[0] == self.KING:
-            if moving_piece[1] == self.WHITE:
-                self.castling_rights[0] = False
-                self.castling_rights[1] = False
-            else:
-                self.castling_rights[2] = False
-                self.castling_rights[3] = False
-        
-        if moving_piece[0] == self.ROOK:
-            if moving_piece[1] == self.WHITE:
-                if from_pos == (7, 0):
-                    self.castling_rights[1] = False
-                elif from_pos == (7, 7):
-                    self.castling_rights[0] = False
+        if piece_type == self.KING:
+            if color == self.WHITE:
+                self.white_king_square = to_square
             else:
-                if from_pos == (0, 0):
-                    self.castling_rights[3] = False
-                elif from_pos == (0, 7):
-                    self.castling_rights[2] = False
+                self.black_king_square = to_square
+            
+            # Handle castling - move the rook too
+            if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+                if flags == KING_CASTLE:
+                    rook_from, rook_to = to_square + 1, to_square - 1
+                else:
+                    rook_from, rook_to = to_square - 2, to_square + 1
+                rook = squares[rook_from]
+                squares[rook_to] = rook
+                squares[rook_from] = 0
+                if rook:
+                    h ^= keys[rook][rook_from] ^ keys[rook][rook_to]
+                    piece_squares[rook] ^= {rook_from, rook_to}
+        
+        # Update castling rights
+        self.castling &= CASTLING_KEEP[from_square] & CASTLING_KEEP[to_square]
         
         # Set en passant target
-        self.en_passant_target = None
-        if moving_piece[0] == self.PAWN and abs(to_row - from_row) == 2:
-            self.en_passant_target = ((from_row + to_row) // 2, from_col)
+        self.en_passant_square = -1
+        if flags == DOUBLE_PAWN_PUSH:
+            self.en_passant_square = (from_square + to_square) // 2
         
         # Update halfmove clock
-        if moving_piece[0] == self.PAWN or captured_piece or en_passant_capture:
+        if piece_type == self.PAWN or captured_piece or en_passant_capture:
             self.halfmove_clock = 0
         else:
             self.halfmove_clock += 1
         
+        if self.current_turn == self.BLACK:
+            self.fullmove_number += 1
+        
         # Switch turn
         self.current_turn = 1 - self.current_turn
+        self.zobrist_key = h ^ zobrist.side_to_move ^ zobrist.state_key(self)
+        
+        # Remember the position we left; after an irreversible move it can't repeat
+        if self.halfmove_clock == 0:
+            self.key_stack = None
+        else:
+            self.key_stack = (previous_key, self.key_stack)
         
-        # Add to move history
+        # Add to move history (captures as piece codes, 0 = none)
         self.move_history.append((move, captured_piece, en_passant_capture))
         
+        if self.accumulator is not None:
+            self.accumulator = self.accumulator.updated(self, move, moving_piece, placed_piece,
+                                                        captured_piece or en_passant_capture)
+        if self.position_score is not None:
+            self.position_score = self.position_score.updated(self, move, moving_piece, placed_piece,
+                                                              captured_piece or en_passant_capture)
+        
         return True
     
+    def move_from_squares(self, from_square: int, to_square: int, promotion: int = 0) -> int:
+        # build the move for from -> to in this position, with the right flags
+        # promotion is a piece type; pawn moves to the last rank default to a queen
+        squares = self.squares
+        piece_type = squares[from_square] & TYPE_MASK
+        flags = CAPTURE if squares[to_square] else QUIET
+        
+        if piece_type == self.PAWN:
+            if to_square == self.en_passant_square and not squares[to_square]:
+                flags = EN_PASSANT
+            elif to_square - from_square == 16 or from_square - to_square == 16:
+                flags = DOUBLE_PAWN_PUSH
+            elif to_square < 8 or to_square >= 56:
+                flags |= PROMOTION | ((promotion or self.QUEEN) - self.KNIGHT) << 12
+        elif piece_type == self.KING:
+            if to_square - from_square == 2:
+                flags = KING_CASTLE
+            elif from_square - to_square == 2:
+                flags = QUEEN_CASTLE
+        
+        return from_square | to_square << 6 | flags
+    
+    def parse_move(self, move_str: str) -> Optional[int]:
+        # 'e2e4' / 'e7e8q' -> legal move in this position, or None
+        parsed = parse_notation(move_str)
+        if parsed is None:
+            return None
+        move = self.move_from_squares(*parsed)
+        if move in self.generate_moves(self.current_turn):
+            return move
+        return None
+    
+    def repetition_count(self) -> int:
+        # how many times the current position occurred before
+        # only positions since the last irreversible move can match, and only
+        # every second ply has the same side to move
+        count = 0
+        node = self.key_stack
+        ply = 1
+        while node is not None and ply <= self.halfmove_clock:
+            if ply % 2 == 0 and node[0] == self.zobrist_key:
+                count += 1
+            node = node[1]
+            ply += 1
+        return count
+    
+    def is_repetition(self) -> bool:
+        # twofold repetition - good enough to call a draw inside the search
+        return self.repetition_count() >= 1
+    
+    def is_threefold_repetition(self) -> bool:
+        # threefold repetition - the actual game rule
+        return self.repetition_count() >= 2
+    
+    def is_fifty_move_draw(self) -> bool:
+        # 50 moves by each side without a capture or pawn move
+        # a mate delivered on the 100th halfmove still wins (checked only past the limit)
+        return self.halfmove_clock >= 100 and not self.is_checkmate(self.current_turn)
+    
+    def has_insufficient_material(self) -> bool:
+        # nobody can mate: K vs K, K+minor vs K, or K+B vs K+B with same-colored bishops
+        piece_squares = self.piece_squares
+        for code in _MATING_MATERIAL:
+            if piece_squares[code]:
+                return False
+        
+        knights = len(piece_squares[_WHITE_KNIGHT]) + len(piece_squares[_BLACK_KNIGHT])
+        white_bishops = len(piece_squares[_WHITE_BISHOP])
+        black_bishops = len(piece_squares[_BLACK_BISHOP])
+        
+        if knights + white_bishops + black_bishops <= 1:
+            return True
+        
+        if knights == 0 and white_bishops == 1 and black_bishops == 1:
+            white_row, white_col = SQUARE_COORDS[next(iter(piece_squares[_WHITE_BISHOP]))]
+            black_row, black_col = SQUARE_COORDS[next(iter(piece_squares[_BLACK_BISHOP]))]
+            return (white_row + white_col) % 2 == (black_row + black_col) % 2
+        
+        return False
+    
+    def has_legal_move(self, color: int) -> bool:
+        # stops at the first legal move - much cheaper than generate_moves when
+        # the attack map isn't built yet (lazy evaluation's mate/stalemate test)
+        if self.attacks is not None:
+            return bool(self.generate_moves(color))
+        
+        shift = color << COLOR_SHIFT
+        piece_squares = self.piece_squares
+        moves = []
+        for piece_type in (self.PAWN, self.KNIGHT, self.BISHOP, self.ROOK, self.QUEEN):
+            for square in piece_squares[piece_type | shift]:
+                self._generate_piece_moves(square, piece_type, color, moves)
+                for move in moves:
+                    if self._is_legal_move(move, color):
+                        return True
+                moves.clear()
+        # castling is left out - when it's legal, so is the king's step towards the rook
+        for square in piece_squares[self.KING | shift]:
+            self._generate_step_moves(square, color, KING_TARGETS[square], moves)
+            for move in moves:
+                if self._is_legal_move(move, color):
+                    return True
+            moves.clear()
+        return False
+    
     def is_checkmate(self, color: int) -> bool:
         # checkmate = in check and no legal moves
-        king_pos = self.white_king_pos if color == self.WHITE else self.black_king_pos
-        
         # Must be in check
-        if not self.is_square_attacked(king_pos[0], king_pos[1], 1 - color):
+        if not self.in_check(color):
             return False
         
         # No legal moves available
@@ -451,56 +838,355 @@ class ChessBoard:
     
     def is_stalemate(self, color: int) -> bool:
         # stalemate = not in check but no legal moves
-        king_pos = self.white_king_pos if color == self.WHITE else self.black_king_pos
-        
         # Must NOT be in check
-        if self.is_square_attacked(king_pos[0], king_pos[1], 1 - color):
+        if self.in_check(color):
             return False
         
         # No legal moves available
         legal_moves = self.generate_moves(color)
         return len(legal_moves) == 0
     
+    def perft(self, depth: int) -> int:
+        # count the leaf positions depth plies down - checks move generation
+        if depth == 0:
+            return 1
+        moves = self.generate_moves(self.current_turn)
+        if depth == 1:
+            return len(moves)
+    
+        nodes = 0
+        for move in moves:
+            child = self.copy()
+            child.make_move(move)
+            nodes += child.perft(depth - 1)
+        return nodes
+    
     def copy(self):
         # make a copy of the board for searching
         new_board = ChessBoard.__new__(ChessBoard)
-        new_board.board = [row[:] for row in self.board]
-        new_board.white_king_pos = self.white_king_pos
-        new_board.black_king_pos = self.black_king_pos
+        new_board.squares = self.squares[:]
+        new_board.piece_squares = self.piece_squares[:]  # the sets themselves are shared
+        new_board.white_king_square = self.white_king_square
+        new_board.black_king_square = self.black_king_square
         new_board.current_turn = self.current_turn
-        new_board.castling_rights = self.castling_rights[:]
-        new_board.en_passant_target = self.en_passant_target
-        new_board.move_history = self.move_history[:]
+        new_board.castling = self.castling
+        new_board.en_passant_square = self.en_passant_square
+        # Search copies don't get the move list - the shared key stack is all
+        # they need for repetition detection, and it's O(1) to share
+        new_board.move_history = []
         new_board.halfmove_clock = self.halfmove_clock
+        new_board.fullmove_number = self.fullmove_number
+        new_board.zobrist_key = self.zobrist_key
+        new_board.key_stack = self.key_stack
+        new_board.accumulator = self.accumulator
+        new_board.position_score = self.position_score
+        new_board.attacks = self.attacks  # same position, so the same map
         return new_board
     
     def __str__(self):
         # print the board nicely
-        piece_symbols = {
-            (self.PAWN, self.WHITE): '♙',
-            (self.KNIGHT, self.WHITE): '♘',
-            (self.BISHOP, self.WHITE): '♗',
-            (self.ROOK, self.WHITE): '♖',
-            (self.QUEEN, self.WHITE): '♕',
-            (self.KING, self.WHITE): '♔',
-            (self.PAWN, self.BLACK): '♟',
-            (self.KNIGHT, self.BLACK): '♞',
-            (self.BISHOP, self.BLACK): '♝',
-            (self.ROOK, self.BLACK): '♜',
-            (self.QUEEN, self.BLACK): '♛',
-            (self.KING, self.BLACK): '♚',
-        }
-        
         lines = []
         lines.append("  a b c d e f g h")
         for row in range(8):
             line = f"{8-row} "
             for col in range(8):
-                piece = self.board[row][col]
-                if piece:
-                    line += piece_symbols[piece] + " "
+                code = self.squares[row * 8 + col]
+                if code:
+                    line += PIECE_SYMBOLS[code] + " "
                 else:
                     line += ". "
             lines.append(line + f"{8-row}")
         lines.append("  a b c d e f g h")
         return "\n".join(lines)
+
+
+class AttackMap:
+    # Who attacks what in one position, for both sides, built in one pass
+    # ChessBoard.attack_map() builds it once per position and keeps it until the
+    # next make_move, so legality, castling, check tests and the evaluator share it
+    #
+    #   counts[color][square]  how many pieces of color attack square
+    #   checkers[color]        squares of the pieces giving check to color's king
+    #   check_blocks[color]    squares a non-king move must land on to answer a
+    #                          single check (the checker and the squares between), else None
+    #   pins[color]            pinned piece square -> squares it may still move to
+    #   escapes_blocked[color] squares behind color's king on a slider's check line
+    
+    __slots__ = ('counts', 'checkers', 'check_blocks', 'pins', 'escapes_blocked', 'legal_moves')
+    
+    def __init__(self, board: ChessBoard):
+        squares = board.squares
+        piece_squares = board.piece_squares
+        self.counts = (self._attack_counts(squares, piece_squares, ChessBoard.WHITE),
+                       self._attack_counts(squares, piece_squares, ChessBoard.BLACK))
+        self.checkers = [(), ()]
+        self.check_blocks = [None, None]
+        self.pins = [{}, {}]
+        self.escapes_blocked = [(), ()]
+        for color in (ChessBoard.WHITE, ChessBoard.BLACK):
+            if piece_squares[ChessBoard.KING | color << COLOR_SHIFT]:
+                self._king_lines(squares, board.king_square(color), color)
+        
+        # legal move lists per color, filled in by ChessBoard.generate_moves
+        self.legal_moves = [None, None]
+    
+    @staticmethod
+    def _attack_counts(squares: bytearray, piece_squares: List, color: int) -> bytearray:
+        counts = bytearray(64)
+        shift = color << COLOR_SHIFT
+        for square in piece_squares[ChessBoard.PAWN | shift]:
+            for target in PAWN_ATTACKS[color][square]:
+                counts[target] += 1
+        for square in piece_squares[ChessBoard.KNIGHT | shift]:
+            for target in KNIGHT_TARGETS[square]:
+                counts[target] += 1
+        for code, rays_table in ((ChessBoard.BISHOP | shift, BISHOP_RAYS), (ChessBoard.ROOK | shift, ROOK_RAYS),
+                                 (ChessBoard.QUEEN | shift, QUEEN_RAYS)):
+            for square in piece_squares[code]:
+                for ray in rays_table[square]:
+                    for target in ray:
+                        counts[target] += 1
+                        if squares[target]:
+                            break
+        for square in piece_squares[ChessBoard.KING | shift]:
+            for target in KING_TARGETS[square]:
+                counts[target] += 1
+        return counts
+    
+    def _king_lines(self, squares: bytearray, king: int, color: int):
+        # checkers, pins and the squares a checking slider x-rays through the king
+        shift = (1 - color) << COLOR_SHIFT
+        checkers = []
+        blocks = None
+        pins = self.pins[color]
+        escapes_blocked = []
+        
+        pawn = ChessBoard.PAWN | shift
+        for square in PAWN_ATTACKS[color][king]:
+            if squares[square] == pawn:
+                checkers.append(square)
+                blocks = (square,)
+        knight = ChessBoard.KNIGHT | shift
+        for square in KNIGHT_TARGETS[king]:
+            if squares[square] == knight:
+                checkers.append(square)
+                blocks = (square,)
+        
+        queen = ChessBoard.QUEEN | shift
+        king_row, king_col = SQUARE_COORDS[king]
+        for rays, slider in ((BISHOP_RAYS[king], ChessBoard.BISHOP | shift), (ROOK_RAYS[king], ChessBoard.ROOK | shift)):
+            for ray in rays:
+                pinned = -1
+                for index, square in enumerate(ray):
+                    piece = squares[square]
+                    if not piece:
+                        continue
+                    if piece != slider and piece != queen:
+                        if pinned >= 0 or piece >> COLOR_SHIFT != color:
+                            break
+                        pinned = square  # first own piece - pinned if a slider is behind it
+                        continue
+                    if pinned >= 0:
+                        pins[pinned] = frozenset(ray[:index + 1])
+                    else:
+                        checkers.append(square)
+                        blocks = ray[:index + 1]
+                        # stepping back along the line doesn't leave it
+                        row, col = SQUARE_COORDS[ray[0]]
+                        behind_row, behind_col = 2 * king_row - row, 2 * king_col - col
+                        if _on_board(behind_row, behind_col):
+                            escapes_blocked.append(behind_row * 8 + behind_col)
+                    break
+        
+        self.checkers[color] = tuple(checkers)
+        if len(checkers) == 1:
+            self.check_blocks[color] = frozenset(blocks)
+        self.escapes_blocked[color] = tuple(escapes_blocked)
+    
+    def is_attacked(self, square: int, by_color: int) -> bool:
+        return self.counts[by_color][square] > 0
+    
+    def in_check(self, color: int) -> bool:
+        return bool(self.checkers[color])
+    
+    def king_zone_attacks(self, board: ChessBoard, color: int) -> int:
+        # attacks by the other side on color's king and the squares around it
+        king = board.king_square(color)
+        counts = self.counts[1 - color]
+        return counts[king] + sum(counts[square] for square in KING_TARGETS[king])
+
+
+def piece_code(piece_type: int, color: int) -> int:
+    # (piece_type, color) -> code stored in ChessBoard.squares
+    return piece_type | (color << COLOR_SHIFT)
+
+
+PIECE_SYMBOLS = {
+    piece_code(ChessBoard.PAWN, ChessBoard.WHITE): '♙',
+    piece_code(ChessBoard.KNIGHT, ChessBoard.WHITE): '♘',
+    piece_code(ChessBoard.BISHOP, ChessBoard.WHITE): '♗',
+    piece_code(ChessBoard.ROOK, ChessBoard.WHITE): '♖',
+    piece_code(ChessBoard.QUEEN, ChessBoard.WHITE): '♕',
+    piece_code(ChessBoard.KING, ChessBoard.WHITE): '♔',
+    piece_code(ChessBoard.PAWN, ChessBoard.BLACK): '♟',
+    piece_code(ChessBoard.KNIGHT, ChessBoard.BLACK): '♞',
+    piece_code(ChessBoard.BISHOP, ChessBoard.BLACK): '♝',
+    piece_code(ChessBoard.ROOK, ChessBoard.BLACK): '♜',
+    piece_code(ChessBoard.QUEEN, ChessBoard.BLACK): '♛',
+    piece_code(ChessBoard.KING, ChessBoard.BLACK): '♚',
+}
+
+# Piece codes used by has_insufficient_material
+_MATING_MATERIAL = tuple(piece_code(piece_type, color)
+                         for piece_type in (ChessBoard.PAWN, ChessBoard.ROOK, ChessBoard.QUEEN)
+                         for color in (ChessBoard.WHITE, ChessBoard.BLACK))
+_WHITE_KNIGHT = piece_code(ChessBoard.KNIGHT, ChessBoard.WHITE)
+_BLACK_KNIGHT = piece_code(ChessBoard.KNIGHT, ChessBoard.BLACK)
+_WHITE_BISHOP = piece_code(ChessBoard.BISHOP, ChessBoard.WHITE)
+_BLACK_BISHOP = piece_code(ChessBoard.BISHOP, ChessBoard.BLACK)
+
+# FEN letters in piece constant order (PAWN=1 ... KING=6)
+FEN_PIECES = 'pnbrqk'
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+
+def square_name(row: int, col: int) -> str:
+    # (6, 4) -> 'e2'
+    return chr(ord('a') + col) + str(8 - row)
+
+
+def parse_square(name: str) -> Tuple[int, int]:
+    # 'e2' -> (6, 4)
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise ValueError(f"Invalid square: {name!r}")
+    return 8 - int(name[1]), ord(name[0]) - ord('a')
+
+
+def encode_move(from_square: int, to_square: int, flags: int = QUIET) -> int:
+    return from_square | to_square << TO_SHIFT | flags
+
+
+def move_from(move: int) -> int:
+    return move & SQUARE_MASK
+
+
+def move_to(move: int) -> int:
+    return move >> TO_SHIFT & SQUARE_MASK
+
+
+def move_flags(move: int) -> int:
+    return move & FLAG_MASK
+
+
+def is_capture(move: int) -> bool:
+    return bool(move & CAPTURE)
+
+
+def promotion_piece(move: int) -> int:
+    # promoted piece type, or 0 if the move isn't a promotion
+    if move & PROMOTION:
+        return (move >> 12 & 3) + ChessBoard.KNIGHT
+    return 0
+
+
+def move_to_notation(move: int) -> str:
+    # e2e4, e7e8q for promotions
+    notation = (square_name(*SQUARE_COORDS[move & SQUARE_MASK]) +
+                square_name(*SQUARE_COORDS[move >> TO_SHIFT & SQUARE_MASK]))
+    promotion = promotion_piece(move)
+    if promotion:
+        notation += FEN_PIECES[promotion - 1]
+    return notation
+
+
+def parse_notation(move_str: str) -> Optional[Tuple[int, int, int]]:
+    # 'e7e8q' -> (from_square, to_square, promotion piece type or 0)
+    # None if it isn't a coordinate move; ChessBoard.parse_move turns it into a move
+    move_str = move_str.strip().lower()
+    if len(move_str) not in (4, 5):
+        return None
+    promotion = 0
+    if len(move_str) == 5:
+        promotion = FEN_PIECES.find(move_str[4]) + 1
+        if promotion not in (ChessBoard.KNIGHT, ChessBoard.BISHOP, ChessBoard.ROOK, ChessBoard.QUEEN):
+            return None
+    try:
+        from_row, from_col = parse_square(move_str[:2])
+        to_row, to_col = parse_square(move_str[2:4])
+    except ValueError:
+        return None
+    return from_row * 8 + from_col, to_row * 8 + to_col, promotion
+
+
+class ZobristHash:
+    # Hash positions so we can store them in transposition table
+    # build it once per process - ZOBRIST below is the instance everything shares
+    
+    # Fixed seed so keys (and persisted analysis) match across runs
+    SEED = 42
+    
+    def __init__(self, seed: int = SEED):
+        # private generator - the global random state is left alone
+        rng = random.Random(seed)
+        
+        # Hash values for pieces on squares
+        # [piece_type][color][row][col]
+        self.piece_keys = tuple(tuple(tuple(tuple(rng.getrandbits(64) for _ in range(8))
+                                            for _ in range(8))
+                                      for _ in range(2))
+                                for _ in range(7))  # 7 piece types (including EMPTY)
+        
+        # Same keys as [piece_code][square] for the flat board
+        square_keys = [(0,) * 64] * 16
+        for piece_type in range(7):
+            for color in range(2):
+                square_keys[piece_code(piece_type, color)] = tuple(
+                    self.piece_keys[piece_type][color][row][col] for row, col in SQUARE_COORDS)
+        self.square_keys = tuple(square_keys)
+        
+        # Hash for side to move
+        self.side_to_move = rng.getrandbits(64)
+        
+        # Hash for castling rights [4 rights]
+        self.castling_keys = tuple(rng.getrandbits(64) for _ in range(4))
+        
+        # Hash for en passant file [8 files]
+        self.en_passant_keys = tuple(rng.getrandbits(64) for _ in range(8))
+        
+        # Combined castling key for each of the 16 castling masks
+        castling_mask_keys = [0] * 16
+        for mask in range(16):
+            for i in range(4):
+                if mask & (1 << i):
+                    castling_mask_keys[mask] ^= self.castling_keys[i]
+        self.castling_mask_keys = tuple(castling_mask_keys)
+    
+    def hash_position(self, board: ChessBoard) -> int:
+        # compute hash for the position from scratch
+        h = 0
+        
+        # Hash all pieces on the board
+        square_keys = self.square_keys
+        for code, piece_squares in enumerate(board.piece_squares):
+            keys = square_keys[code]
+            for square in piece_squares:
+                h ^= keys[square]
+        
+        # Hash side to move
+        if board.current_turn == ChessBoard.BLACK:
+            h ^= self.side_to_move
+        
+        return h ^ self.state_key(board)
+    
+    def state_key(self, board: ChessBoard) -> int:
+        # castling rights and en passant part of the hash
+        h = self.castling_mask_keys[board.castling]
+        if board.en_passant_square >= 0:
+            h ^= self.en_passant_keys[board.en_passant_square & 7]
+        return h
+
+
+# Keys used by ChessBoard for its incremental hash, built once at import and
+# shared read-only (forked worker processes inherit them as they are)
+ZOBRIST = ZobristHash()
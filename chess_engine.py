@@ -2,62 +2,31 @@
 # Uses minimax with alpha-beta pruning
 # Zobrist hashing for transposition table
 
-import random
+import threading
 import time
-from typing import Optional, Tuple, List
-from chess_board import ChessBoard
+from typing import Iterator, NamedTuple, Optional, Tuple, List
+from chess_board import ChessBoard, ZOBRIST
 from evaluation import Evaluator
+from mate_search import MateSearch
+from search_limits import SearchLimits, StopToken
 
 
-class ZobristHash:
-    # Hash positions so we can store them in transposition table
-    
-    def __init__(self):
-        random.seed(42)  # for testing
-        
-        # Hash values for pieces on squares
-        # [piece_type][color][row][col]
-        self.piece_keys = [[[[random.getrandbits(64) for _ in range(8)]
-                             for _ in range(8)]
-                            for _ in range(2)]
-                           for _ in range(7)]  # 7 piece types (including EMPTY)
-        
-        # Hash for side to move
-        self.side_to_move = random.getrandbits(64)
-        
-        # Hash for castling rights [4 rights]
-        self.castling_keys = [random.getrandbits(64) for _ in range(4)]
-        
-        # Hash for en passant file [8 files]
-        self.en_passant_keys = [random.getrandbits(64) for _ in range(8)]
-    
-    def hash_position(self, board: ChessBoard) -> int:
-        # compute hash for the position
-        h = 0
-        
-        # Hash all pieces on the board
-        for row in range(8):
-            for col in range(8):
-                piece = board.board[row][col]
-                if piece:
-                    piece_type, color = piece
-                    h ^= self.piece_keys[piece_type][color][row][col]
-        
-        # Hash side to move
-        if board.current_turn == ChessBoard.BLACK:
-            h ^= self.side_to_move
-        
-        # Hash castling rights
-        for i, right in enumerate(board.castling_rights):
-            if right:
-                h ^= self.castling_keys[i]
-        
-        # Hash en passant
-        if board.en_passant_target:
-            _, col = board.en_passant_target
-            h ^= self.en_passant_keys[col]
-        
-        return h
+class SearchInfo(NamedTuple):
+    # One iterative deepening result, yielded by ChessEngine.iter_search
+    depth: int
+    score: int
+    best_move: int
+    pv: Tuple[int, ...]
+    nodes: int  # since the search started
+    nps: float
+    time: float
+    tt_usage: float  # fraction of the transposition table filled
+    # MultiPV (move, score, pv) lines, best first - the ones a limit kept from
+    # being redone are the previous depth's, after this depth's
+    lines: Tuple[Tuple[int, int, Tuple[int, ...]], ...]
+    # False only when a limit cut even the first depth short - best_move is
+    # then the best of the root moves it got to
+    complete: bool
 
 
 class TranspositionTable:
@@ -75,25 +44,42 @@ class TranspositionTable:
         self.table = {}
         self.hits = 0
         self.misses = 0
+        
+        # Optional SearchTelemetry, set by the engine
+        self.telemetry = None
     
-    def store(self, zobrist_hash: int, depth: int, score: int, flag: int, best_move: Optional[tuple] = None):
+    def store(self, zobrist_hash: int, depth: int, score: int, flag: int, best_move: int = 0):
         # store position in table
-        if zobrist_hash not in self.table or self.table[zobrist_hash][1] <= depth:
+        # entries are (score, depth, flag, move) with the move as a 16-bit int, 0 = none
+        existing = self.table.get(zobrist_hash)
+        if existing is None or existing[1] <= depth:
             self.table[zobrist_hash] = (score, depth, flag, best_move)
             
+            telemetry = self.telemetry
+            if telemetry is not None:
+                telemetry.tt_stores[flag] += 1
+                if existing is not None:
+                    telemetry.tt_overwrites += 1
+            
             # Limit table size (simple replacement scheme)
             if len(self.table) > self.max_entries:
                 # Remove a random entry (better schemes exist but this is simple)
                 self.table.pop(next(iter(self.table)))
     
-    def probe(self, zobrist_hash: int, depth: int, alpha: int, beta: int) -> Optional[Tuple[int, Optional[tuple]]]:
+    def probe(self, zobrist_hash: int, depth: int, alpha: int, beta: int) -> Optional[Tuple[Optional[int], int]]:
         # look up position in table
+        telemetry = self.telemetry
+        if telemetry is not None:
+            telemetry.tt_probes += 1
+        
         if zobrist_hash in self.table:
             score, stored_depth, flag, best_move = self.table[zobrist_hash]
             
             # Only use if stored depth is sufficient
             if stored_depth >= depth:
                 self.hits += 1
+                if telemetry is not None:
+                    telemetry.tt_hits += 1
                 
                 if flag == self.EXACT:
                     return (score, best_move)
@@ -109,6 +95,15 @@ class TranspositionTable:
         self.misses += 1
         return None
     
+    def get_move(self, zobrist_hash: int) -> int:
+        # stored best move regardless of depth (for PV extraction), 0 = none
+        entry = self.table.get(zobrist_hash)
+        return entry[3] if entry else 0
+    
+    def get_entry(self, zobrist_hash: int) -> Optional[Tuple[int, int, int, int]]:
+        # (score, depth, flag, move) without the probe bookkeeping, or None
+        return self.table.get(zobrist_hash)
+    
     def clear(self):
         self.table.clear()
         self.hits = 0
@@ -130,10 +125,24 @@ class TranspositionTable:
 class ChessEngine:
     # main engine - searches for best move
     
-    def __init__(self, tt_size_mb: int = 64):
-        self.evaluator = Evaluator()
-        self.zobrist = ZobristHash()
-        self.transposition_table = TranspositionTable(tt_size_mb)
+    # Only nodes at least this deep go to/from the persistent analysis store
+    STORE_MIN_DEPTH = 2
+    
+    # Nodes between clock / stop signal checks (the node limit is checked on every node)
+    POLL_INTERVAL = 128
+    
+    def __init__(self, tt_size_mb: int = 64, analysis_store=None, evaluator=None,
+                 transposition_table=None):
+        # evaluator: anything with Evaluator's methods, e.g. nnue.NNUEEvaluator
+        # transposition_table: anything with TranspositionTable's methods, e.g. a
+        # smp.SharedTranspositionTable several engines search into at once
+        self.evaluator = evaluator if evaluator is not None else Evaluator()
+        self.zobrist = ZOBRIST
+        self.transposition_table = (transposition_table if transposition_table is not None
+                                    else TranspositionTable(tt_size_mb))
+        
+        # Optional PersistentAnalysisStore shared across runs (see analysis_store.py)
+        self.analysis_store = analysis_store
         
         # Search statistics
         self.nodes_searched = 0
@@ -141,63 +150,366 @@ class ChessEngine:
         self.tt_hits = 0
         self.search_start_time = 0
         self.max_time = 0
+        self.max_nodes = None
+        self.next_poll = 0
+        self.completed_depth = 0
+        self.search_stopped = False
+        
+        # Iterative deepening starts here (smp.py helper threads start deeper)
+        self.start_depth = 1
+        
+        # Root moves to consider (SearchLimits.searchmoves), None = all
+        self.root_moves = None
+        
+        # Optional callable polled with the time check - returns True to stop early
+        # (e.g. a cancel flag shared with the process that asked for the search)
+        self.stop_check = None
+        
+        # stop() sets the engine's own token; search() can also take one per call
+        self.stop_token = StopToken()
+        self.search_token = None
+        
+        # Optional SearchTelemetry - None keeps the search loop lean
+        self.telemetry = None
+        
+        # Pondering - a search on the opponent's time in a background thread
+        # the clock doesn't run while pondering is set (see ponder_hit)
+        self.pondering = False
+        self.ponder_thread = None
+        self.ponder_result = None
+        
+        # df-pn mate solver, created on first use (see solve_mate)
+        self.mate_search = None
+    
+    def set_telemetry(self, telemetry):
+        # attach (or detach with None) a SearchTelemetry collector
+        self.telemetry = telemetry
+        self.transposition_table.telemetry = telemetry
     
-    def search(self, board: ChessBoard, max_depth: int = 5, max_time: float = 10.0) -> Tuple[Optional[tuple], int]:
+    def search(self, board: ChessBoard, max_depth: int = 5, max_time: float = 10.0, multipv: int = 1,
+               max_nodes: Optional[int] = None, ponder: bool = False,
+               limits: Optional[SearchLimits] = None, stop_token: Optional[StopToken] = None):
         # search for best move with iterative deepening
+        # returns (best_move, score), or with multipv > 1 a list of
+        # (move, score, pv) for the best multipv root moves, best first
+        # limits (a SearchLimits) replaces max_depth/max_time/max_nodes when given;
+        # a node limit without a time limit gives exactly reproducible searches
+        # stop_token: a StopToken another thread can set to end the search
+        # ponder: called from start_ponder, which already set up the stop/ponder flags
+        # runs iter_search to the end - use that directly to see each depth as it finishes
+        if limits is None:
+            limits = SearchLimits.from_args(max_depth, max_time, max_nodes)
+        
+        result = None
+        for result in self.iter_search(board, limits, multipv=multipv, stop_token=stop_token, ponder=ponder):
+            pass
+        
+        if multipv > 1:
+            return [(move, score, list(pv)) for move, score, pv in result.lines] if result is not None else []
+        if result is None:
+            return None, float('-inf')
+        return result.best_move, result.score
+    
+    def iter_search(self, board: ChessBoard, limits: Optional[SearchLimits] = None, multipv: int = 1,
+                    stop_token: Optional[StopToken] = None, ponder: bool = False) -> Iterator[SearchInfo]:
+        # iterative deepening as a generator - yields a SearchInfo for every
+        # finished depth, the last one is the search's result
+        # the caller can stop iterating at any point and keep the last info it got
+        # no limits = search until stopped (by the caller, stop() or stop_token)
+        if limits is None:
+            limits = SearchLimits()
+        max_depth = limits.max_depth()
+        if not ponder:
+            # one search at a time - a ponder search left running would share the
+            # TT, stop token and counters with this one
+            self.stop_ponder()
+            self.pondering = False
+            self.stop_token.reset()
+        self.search_token = stop_token
         self.nodes_searched = 0
         self.cutoffs = 0
         self.tt_hits = 0
+        self.evaluator.reset_stats()
         self.search_start_time = time.time()
-        self.max_time = max_time
-        
-        best_move = None
-        best_score = float('-inf')
-        
-        # Iterative deepening: search at increasing depths
-        # start shallow, go deeper each iteration
-        for depth in range(1, max_depth + 1):
-            # Check time limit
-            if time.time() - self.search_start_time >= self.max_time:
-                break
-            
-            current_best_move, current_score = self._search_root(board, depth)
-            
-            # Update best move if we completed the search at this depth
-            if current_best_move:
-                best_move = current_best_move
-                best_score = current_score
+        self.max_time = limits.max_time()
+        self.max_nodes = limits.max_nodes()
+        self.root_moves = set(limits.searchmoves) if limits.searchmoves else None
+        self.next_poll = self.POLL_INTERVAL
+        self.search_stopped = False
+        
+        lines = []
+        completed_depth = 0
+        self.completed_depth = 0
+        
+        # Last iteration that finished without hitting a limit (safe to persist)
+        clean_result = None
+        
+        first_depth = min(self.start_depth, max_depth)
+        
+        # Pick up where an earlier run left off
+        # (only whole-position single-line searches - restricted ones aren't the position's result)
+        use_store = self.analysis_store is not None and multipv == 1 and self.root_moves is None
+        if use_store:
+            stored = self._load_root_from_store(board)
+            if stored is not None:
+                best_move, best_score, completed_depth = stored
+                self.completed_depth = completed_depth
+                lines = [(best_move, best_score)]
+                yield self._search_info(board, completed_depth, best_move, best_score, lines, True)
+                if completed_depth >= max_depth:
+                    return
+                first_depth = completed_depth + 1
+        
+        self.evaluator.prepare(board)
+        
+        telemetry = self.telemetry
+        if telemetry is not None:
+            telemetry.begin_search()
+        
+        try:
+            # Iterative deepening: search at increasing depths
+            # start shallow, go deeper each iteration
+            for depth in range(first_depth, max_depth + 1):
+                # Check time limit
+                if self._out_of_budget(poll=True):
+                    break
                 
-                # Log progress (useful for debugging and analysis)
-                elapsed = time.time() - self.search_start_time
-                nps = self.nodes_searched / elapsed if elapsed > 0 else 0
-                print(f"Depth {depth}: score={current_score}, "
-                      f"nodes={self.nodes_searched}, nps={nps:.0f}, "
-                      f"time={elapsed:.2f}s")
-            
-            # Stop if we found a forced checkmate
-            if abs(current_score) > 90000:
+                if telemetry is not None:
+                    telemetry.begin_iteration(depth)
+                    iteration_start_nodes = self.nodes_searched
+                
+                current_best_move, current_score = self._search_root(board, depth)
+                # a limit cut the depth short - its move is only the best of those it got to
+                stopped = self.search_stopped
+                
+                # MultiPV: search again without the moves already found
+                # the TT is warm from the first pass so these are much cheaper
+                current_lines = [(current_best_move, current_score)] if current_best_move else []
+                excluded_moves = [current_best_move]
+                while current_lines and len(current_lines) < multipv:
+                    if self._out_of_budget(poll=True):
+                        break
+                    move, score = self._search_root(board, depth, excluded_moves)
+                    # a cut-short re-search only compared some of the moves - not a line
+                    if not move or self.search_stopped:
+                        break
+                    excluded_moves.append(move)
+                    current_lines.append((move, score))
+                
+                if telemetry is not None:
+                    telemetry.end_iteration(depth, current_score, current_best_move,
+                                            self.nodes_searched - iteration_start_nodes)
+                
+                if stopped or not current_best_move:
+                    # the last finished depth stays the result - unless there is none,
+                    # then a partial first depth's move is better than no move at all
+                    if stopped and current_best_move and not lines:
+                        yield self._search_info(board, depth, current_best_move, current_score,
+                                                current_lines, False)
+                    break
+                
+                # Lines a limit kept from being redone stay at the previous depth
+                found = {move for move, _ in current_lines}
+                current_lines += [line for line in lines if line[0] not in found][:multipv - len(current_lines)]
+                lines = current_lines
+                completed_depth = depth
+                self.completed_depth = depth
+                clean_result = (depth, current_best_move, current_score)
+                yield self._search_info(board, depth, current_best_move, current_score, lines, True)
+                
+                # Stop if we found a forced checkmate
+                if abs(current_score) > 90000:
+                    break
+        finally:
+            # also when the caller stops early - what was searched cleanly is still good
+            if use_store and not self.analysis_store.readonly and clean_result is not None:
+                self._save_to_store(board, *clean_result)
+    
+    def _search_info(self, board: ChessBoard, depth: int, best_move: int, score: int,
+                     lines: List[Tuple[int, int]], complete: bool) -> SearchInfo:
+        # lines are the MultiPV (move, score) pairs, best first
+        elapsed = time.time() - self.search_start_time
+        tt_stats = self.transposition_table.get_stats()
+        return SearchInfo(
+            depth=depth,
+            score=score,
+            best_move=best_move,
+            pv=tuple(self._extract_pv(board, best_move, depth)),
+            nodes=self.nodes_searched,
+            nps=self.nodes_searched / elapsed if elapsed > 0 else 0.0,
+            time=elapsed,
+            tt_usage=tt_stats['entries'] / tt_stats['max_entries'] if tt_stats['max_entries'] else 0.0,
+            lines=tuple((move, line_score, tuple(self._extract_pv(board, move, self.completed_depth)))
+                        for move, line_score in lines),
+            complete=complete,
+        )
+    
+    def _load_root_from_store(self, board: ChessBoard) -> Optional[Tuple[int, int, int]]:
+        # (best_move, score, depth) of an exact root result from an earlier run
+        stored = self.analysis_store.probe(board.zobrist_key)
+        if stored is None:
+            return None
+        score, depth, flag, move = stored
+        if flag != TranspositionTable.EXACT or not move:
+            return None
+        if move not in board.generate_moves(board.current_turn):
+            return None  # hash collision
+        self.transposition_table.store(board.zobrist_key, depth, score, flag, move)
+        return move, score, depth
+    
+    def _save_to_store(self, board: ChessBoard, depth: int, best_move: int, score: int):
+        # root result, plus the TT entries along the PV if nothing was cut short
+        store = self.analysis_store
+        store.store(board.zobrist_key, depth, score, TranspositionTable.EXACT, best_move)
+        
+        if self.search_stopped:
+            return
+        
+        current = board.copy()
+        for move in self._extract_pv(board, best_move, depth)[:-1]:
+            current.make_move(move)
+            entry = self.transposition_table.get_entry(current.zobrist_key)
+            if entry is None:
                 break
+            entry_score, entry_depth, flag, entry_move = entry
+            if entry_depth >= self.STORE_MIN_DEPTH:
+                store.store(current.zobrist_key, entry_depth, entry_score, flag, entry_move)
+    
+    def solve_mate(self, board: ChessBoard, max_moves: int = 5, max_nodes: Optional[int] = None,
+                   max_time: Optional[float] = None) -> dict:
+        # proof-number mate solver - much faster than search() for mate-in-N puzzles
+        # returns {'status', 'mate_in', 'line', 'nodes', 'time'}, see MateSearch.solve
+        if self.mate_search is None:
+            self.mate_search = MateSearch()
+        self.mate_search.stop_check = self.stop_check
+        return self.mate_search.solve(board, max_moves=max_moves, max_nodes=max_nodes, max_time=max_time)
+    
+    # Pondering
+    # start_ponder searches the position after the expected reply while the
+    # opponent thinks. If they play it, ponder_hit starts the real clock and
+    # waits for the result; otherwise stop_ponder aborts and the TT stays warm.
+    
+    def ponder_move(self, board: ChessBoard, best_move: int) -> int:
+        # expected reply to best_move (second move of the PV), 0 = none
+        pv = self._extract_pv(board, best_move, 2)
+        return pv[1] if len(pv) > 1 else 0
+    
+    def start_ponder(self, board: ChessBoard, move: int, max_depth: int = 64, max_time: float = 10.0,
+                     max_nodes: Optional[int] = None, limits: Optional[SearchLimits] = None):
+        # search the position after move (the opponent's expected reply) in the background
+        # max_time (or limits.movetime) is the budget once ponder_hit starts the clock
+        self.stop_ponder()
+        ponder_board = board.copy()
+        ponder_board.make_move(move)
+        
+        self.pondering = True
+        self.stop_token.reset()
+        self.ponder_result = None
+        
+        def run():
+            self.ponder_result = self.search(ponder_board, max_depth=max_depth, max_time=max_time,
+                                             max_nodes=max_nodes, ponder=True, limits=limits)
+        
+        self.ponder_thread = threading.Thread(target=run, name='ponder', daemon=True)
+        self.ponder_thread.start()
+    
+    def ponder_hit(self):
+        # the opponent played the expected move - keep searching under the real clock
+        # returns the search result like search() does
+        self.search_start_time = time.time()
+        self.pondering = False
+        thread = self.ponder_thread
+        if thread is not None:
+            thread.join()
+            self.ponder_thread = None
+        return self.ponder_result
+    
+    def stop_ponder(self):
+        # the opponent played something else - abort and discard the result
+        thread = self.ponder_thread
+        if thread is None:
+            return
+        self.stop_token.stop()
+        thread.join()
+        self.ponder_thread = None
+        self.ponder_result = None
+        self.pondering = False
+    
+    def stop(self):
+        # ask the current search to return as soon as possible (safe from another thread)
+        self.stop_token.stop()
+    
+    def is_pondering(self) -> bool:
+        return self.ponder_thread is not None and self.pondering
+    
+    def _out_of_budget(self, poll: bool = False) -> bool:
+        # node limit on every call; time and stop signals only every POLL_INTERVAL
+        # nodes (or when poll is set), since reading the clock costs as much as a node
+        if self.search_stopped:
+            return True
+        nodes = self.nodes_searched
+        if self.max_nodes is not None and nodes >= self.max_nodes:
+            self.search_stopped = True
+        elif poll or nodes >= self.next_poll:
+            self.next_poll = nodes + self.POLL_INTERVAL
+            if self.stop_token.is_set():
+                self.search_stopped = True
+            elif self.search_token is not None and self.search_token.is_set():
+                self.search_stopped = True
+            elif not self.pondering and time.time() - self.search_start_time >= self.max_time:
+                self.search_stopped = True
+            elif self.stop_check is not None and self.stop_check():
+                self.search_stopped = True
+        return self.search_stopped
+    
+    def _extract_pv(self, board: ChessBoard, first_move: int, max_length: int) -> List[int]:
+        # follow TT best moves from the position after first_move
+        pv = [first_move]
+        current = board.copy()
+        current.make_move(first_move)
+        seen = {current.zobrist_key}
+        
+        while len(pv) < max_length:
+            move = self.transposition_table.get_move(current.zobrist_key)
+            if not move or move not in current.generate_moves(current.current_turn):
+                break
+            current.make_move(move)
+            # stop on repetitions so a cycle in the TT can't loop forever
+            if current.zobrist_key in seen:
+                break
+            seen.add(current.zobrist_key)
+            pv.append(move)
         
-        return best_move, best_score
+        return pv
     
-    def _search_root(self, board: ChessBoard, depth: int) -> Tuple[Optional[tuple], int]:
+    def _search_root(self, board: ChessBoard, depth: int, excluded_moves: Optional[List[int]] = None) -> Tuple[int, int]:
         # search from root position
+        # excluded_moves are skipped (used for MultiPV)
         legal_moves = board.generate_moves(board.current_turn)
+        if self.telemetry is not None:
+            self.telemetry.movegen_calls += 1
+        
+        if excluded_moves:
+            legal_moves = [move for move in legal_moves if move not in excluded_moves]
+        if self.root_moves is not None:
+            legal_moves = [move for move in legal_moves if move in self.root_moves]
         
         if not legal_moves:
-            return None, 0
+            return 0, 0
         
-        # Order moves for better pruning
-        legal_moves = self._order_moves(board, legal_moves, depth)
+        # Order moves for better pruning - the previous depth's best move first,
+        # so a depth cut short has at least searched that one
+        hash_move = self.transposition_table.get_move(board.zobrist_key)
+        legal_moves = self._order_moves(board, legal_moves, depth, hash_move)
         
-        best_move = None
+        best_move = 0
         best_score = float('-inf')
         alpha = float('-inf')
         beta = float('inf')
         
         for move in legal_moves:
             # Check time limit
-            if time.time() - self.search_start_time >= self.max_time:
+            if self._out_of_budget(poll=True):
                 break
             
             # Make move
@@ -207,6 +519,10 @@ class ChessEngine:
             # Search this position
             score = -self._alpha_beta(board_copy, depth - 1, -beta, -alpha, 1 - board.current_turn)
             
+            # An interrupted subtree has no real score - keep what was fully searched
+            if self.search_stopped:
+                break
+            
             # Update best move
             if score > best_score:
                 best_score = score
@@ -215,12 +531,14 @@ class ChessEngine:
             # Update alpha
             alpha = max(alpha, score)
         
-        # Store in transposition table
-        zobrist_hash = self.zobrist.hash_position(board)
-        self.transposition_table.store(
-            zobrist_hash, depth, best_score, 
-            TranspositionTable.EXACT, best_move
-        )
+        # Store in transposition table (not for MultiPV re-searches - their
+        # best move isn't the best move of the position, nor for unfinished iterations)
+        if not excluded_moves and not self.search_stopped:
+            zobrist_hash = board.zobrist_key
+            self.transposition_table.store(
+                zobrist_hash, depth, best_score, 
+                TranspositionTable.EXACT, best_move
+            )
         
         return best_move, best_score
     
@@ -230,24 +548,47 @@ class ChessEngine:
         self.nodes_searched += 1
         
         # Check time limit
-        if time.time() - self.search_start_time >= self.max_time:
+        if self._out_of_budget():
+            return 0
+        
+        # Draws - checked before the TT since repetitions depend on the path
+        if (board.is_fifty_move_draw() or board.is_repetition()
+                or board.has_insufficient_material()):
             return 0
         
         # Probe transposition table
-        zobrist_hash = self.zobrist.hash_position(board)
+        zobrist_hash = board.zobrist_key
         tt_entry = self.transposition_table.probe(zobrist_hash, depth, alpha, beta)
+        
+        # Fall back to the persistent store for deeper nodes
+        if tt_entry is None and self.analysis_store is not None and depth >= self.STORE_MIN_DEPTH:
+            stored = self.analysis_store.probe(zobrist_hash)
+            if stored is not None:
+                stored_score, stored_depth, stored_flag, stored_move = stored
+                self.transposition_table.store(zobrist_hash, stored_depth, stored_score, stored_flag, stored_move)
+                tt_entry = self.transposition_table.probe(zobrist_hash, depth, alpha, beta)
+        
         if tt_entry and tt_entry[0] is not None:
             self.tt_hits += 1
             return tt_entry[0]
         
+        telemetry = self.telemetry
+        
         # Terminal node: evaluate position
         if depth == 0:
-            eval_score = self.evaluator.evaluate(board)
+            if telemetry is not None:
+                telemetry.eval_calls += 1
+            # the evaluator scores for white, so black's window is flipped -
+            # outside the window it can return a bound without the costly terms
             # Return from perspective of current color
-            return eval_score if color == ChessBoard.WHITE else -eval_score
+            if color == ChessBoard.WHITE:
+                return self.evaluator.evaluate(board, alpha, beta)
+            return -self.evaluator.evaluate(board, -beta, -alpha)
         
         # Generate legal moves
         legal_moves = board.generate_moves(color)
+        if telemetry is not None:
+            telemetry.movegen_calls += 1
         
         # Terminal node: checkmate or stalemate
         if not legal_moves:
@@ -257,15 +598,15 @@ class ChessEngine:
                 return 0  # Stalemate
         
         # Order moves for better pruning
-        hash_move = tt_entry[1] if tt_entry else None
+        hash_move = tt_entry[1] if tt_entry else 0
         legal_moves = self._order_moves(board, legal_moves, depth, hash_move)
         
         best_score = float('-inf')
-        best_move = None
+        best_move = 0
         original_alpha = alpha
         
         # Search all moves
-        for move in legal_moves:
+        for move_index, move in enumerate(legal_moves):
             # Make move
             board_copy = board.copy()
             board_copy.make_move(move)
@@ -273,6 +614,10 @@ class ChessEngine:
             # Recursive search
             score = -self._alpha_beta(board_copy, depth - 1, -beta, -alpha, 1 - color)
             
+            # Out of budget - unwind without storing a made-up score
+            if self.search_stopped:
+                return 0
+            
             if score > best_score:
                 best_score = score
                 best_move = move
@@ -281,6 +626,10 @@ class ChessEngine:
             alpha = max(alpha, score)
             if alpha >= beta:
                 self.cutoffs += 1
+                if telemetry is not None:
+                    telemetry.cutoffs += 1
+                    if move_index == 0:
+                        telemetry.first_move_cutoffs += 1
                 break  # cutoff - don't need to search more
         
         # Store in transposition table
@@ -291,11 +640,20 @@ class ChessEngine:
         else:
             flag = TranspositionTable.EXACT
         
+        # Node type follows from the result: fail-low = all node, fail-high = cut node
+        if telemetry is not None:
+            if flag == TranspositionTable.EXACT:
+                telemetry.pv_nodes += 1
+            elif flag == TranspositionTable.LOWER_BOUND:
+                telemetry.cut_nodes += 1
+            else:
+                telemetry.all_nodes += 1
+        
         self.transposition_table.store(zobrist_hash, depth, best_score, flag, best_move)
         
         return best_score
     
-    def _order_moves(self, board: ChessBoard, moves: List[tuple], depth: int, hash_move: Optional[tuple] = None) -> List[tuple]:
+    def _order_moves(self, board: ChessBoard, moves: List[int], depth: int, hash_move: int = 0) -> List[int]:
         # order moves - search good moves first for better pruning
         # Assign priority to each move
         move_priorities = []
@@ -304,7 +662,7 @@ class ChessEngine:
             priority = self.evaluator.evaluate_move_priority(board, move)
             
             # Bonus for hash move
-            if hash_move and move == hash_move:
+            if move == hash_move:
                 priority += 1000000
             
             move_priorities.append((move, priority))
@@ -318,14 +676,21 @@ class ChessEngine:
         elapsed = time.time() - self.search_start_time
         nps = self.nodes_searched / elapsed if elapsed > 0 else 0
         
-        return {
+        stats = {
             'nodes_searched': self.nodes_searched,
             'nodes_per_second': nps,
+            'depth': self.completed_depth,
             'cutoffs': self.cutoffs,
             'tt_hits': self.tt_hits,
             'time_elapsed': elapsed,
-            'tt_stats': self.transposition_table.get_stats()
+            'tt_stats': self.transposition_table.get_stats(),
+            'eval_stats': self.evaluator.lazy_stats()
         }
+        
+        if self.telemetry is not None:
+            stats['telemetry'] = self.telemetry.totals()
+        
+        return stats
     
     def clear_transposition_table(self):
         self.transposition_table.clear()
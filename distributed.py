@@ -0,0 +1,508 @@
+# Distributed analysis - one coordinator, any number of worker processes over TCP
+# the coordinator cuts a position file (or a perft job) into chunks and hands
+# them out; results stream back into a single JSONL file
+#
+#   python distributed.py coordinator positions.epd -o results.jsonl --depth 6 --port 9100
+#   python distributed.py worker --host 10.0.0.5 --port 9100        # on every machine
+#
+#   # whole cluster on one box: the coordinator starts 4 local workers itself
+#   python distributed.py coordinator games.pgn -o results.jsonl --spawn 4
+#   python distributed.py coordinator --perft 6 -o perft.jsonl --split 2 --spawn 4
+#
+# Worker -> coordinator (one JSON object per line):
+#   {"op": "hello", "name": "host:pid"}
+#   {"op": "next"}                              ready for a chunk, the last one is finished
+#   {"op": "record", "chunk": 3, "record": {"index": 17, ...}}
+#   {"op": "heartbeat"}
+#
+# Coordinator -> worker:
+#   {"type": "welcome", "job": {"kind": "analyse", "depth": 6, ...}, "heartbeat": 1.0}
+#   {"type": "chunk", "chunk": 3, "items": [{"index": 17, "id": "...", "fen": "..."}, ...]}
+#   {"type": "steal", "chunk": 3, "keep": 5}    only do the first 5 items, the rest went elsewhere
+#   {"type": "done"}
+#
+# A worker that goes quiet for longer than the timeout is dropped and the
+# unfinished items of its chunk are queued again. When the queue runs dry an idle
+# worker steals the back half of the unstarted items of the busiest chunk.
+# Records are deduplicated on "index", so an item done twice is written once.
+
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from batch_analysis import read_positions
+from chess_board import ChessBoard, move_to_notation
+from chess_engine import ChessEngine
+from search_limits import SearchLimits
+
+
+# Jobs - every item is {"index", "id", "fen"}, the job says what to do with it
+
+def position_items(path: str, min_ply: int = 0) -> Iterator[Dict]:
+    for index, (position_id, fen) in enumerate(read_positions(path, min_ply)):
+        yield {'index': index, 'id': position_id, 'fen': fen}
+
+
+def perft_items(fen: str, split: int = 1) -> Iterator[Dict]:
+    # the positions split plies below fen, id is the move path that reaches them
+    # the perft depth of the job is counted from these, not from fen
+    index = itertools.count()
+
+    def walk(board: ChessBoard, path: List[str], plies: int):
+        if plies == 0:
+            yield {'index': next(index), 'id': ' '.join(path), 'fen': board.to_fen()}
+            return
+        for move in board.generate_moves(board.current_turn):
+            child = board.copy()
+            child.make_move(move)
+            yield from walk(child, path + [move_to_notation(move)], plies - 1)
+
+    return walk(ChessBoard.from_fen(fen), [], split)
+
+
+# Coordinator
+
+class Chunk:
+    # A run of items handed to one worker - items[:limit] are still its to do
+
+    def __init__(self, chunk_id: int, items: List[Dict]):
+        self.chunk_id = chunk_id
+        self.items = items
+        self.limit = len(items)
+        self.progress = 0  # records received, the worker goes through items in order
+
+    def unstarted(self) -> int:
+        # the item after the last record is assumed to be in progress
+        return max(0, self.limit - self.progress - 1)
+
+
+class WorkerConnection:
+    # Coordinator-side handle of one connected worker
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.name = '?'
+        self.chunk: Optional[Chunk] = None
+        self.last_seen = time.monotonic()
+        self.dropped = False
+        self.task = None  # handler task, so close() can wait for it
+
+    def send(self, message: Dict):
+        if not self.dropped:
+            self.writer.write((json.dumps(message) + '\n').encode())
+
+
+class Coordinator:
+    # Serves chunks of items to workers and writes their records to out
+
+    def __init__(self, items: Iterator[Dict], out, job: Dict, chunk_size: int = 16,
+                 heartbeat: float = 1.0, timeout: float = 5.0):
+        self.items = iter(items)
+        self.out = out
+        self.job = job
+        self.chunk_size = chunk_size
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+
+        self.chunk_ids = itertools.count()
+        self.exhausted = False
+        self.requeued = collections.deque()  # chunks taken back from dropped workers
+        self.workers = set()
+        self.waiting = collections.deque()   # idle workers, nothing to give them yet
+        self.finished = set()                # item indices already written
+        self.server = None
+        self.monitor = None
+        self.done = None
+        self.port = None
+
+        self.written = 0
+        self.duplicates = 0
+        self.steals = 0
+        self.requeues = 0
+        self.lost_workers = 0
+        self.perft_nodes = 0
+
+    async def start(self, host: str = '127.0.0.1', port: int = 9100):
+        # port 0 picks a free one, see self.port
+        self.done = asyncio.Event()
+        self.server = await asyncio.start_server(self._handle_worker, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.monitor = asyncio.ensure_future(self._monitor())
+
+    async def wait(self):
+        # until every item has a record
+        await self.done.wait()
+
+    async def close(self):
+        self.monitor.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+        # closing the sockets ends each handler at its next read
+        workers = list(self.workers)
+        for worker in workers:
+            worker.writer.close()
+        await asyncio.gather(*(worker.task for worker in workers), return_exceptions=True)
+
+    # Worker protocol
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = WorkerConnection(writer)
+        worker.task = asyncio.current_task()
+        self.workers.add(worker)
+        worker.send({'type': 'welcome', 'job': self.job, 'heartbeat': self.heartbeat})
+        try:
+            while not worker.dropped:
+                line = await reader.readline()
+                if not line:
+                    break
+                worker.last_seen = time.monotonic()
+                line = line.strip()
+                if line:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError("message is not a JSON object")
+                    self._handle_message(worker, message)
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass  # a worker sending garbage is treated like a dead one - its chunk is queued again
+        finally:
+            self._drop(worker)
+
+    def _handle_message(self, worker: WorkerConnection, message: Dict):
+        op = message.get('op')
+        if op == 'hello':
+            worker.name = str(message.get('name'))
+        elif op == 'record':
+            record = message.get('record')
+            if not isinstance(record, dict) or not isinstance(record.get('index'), int):
+                raise ValueError("record without an index")
+            self._record(worker, message.get('chunk'), record)
+        elif op == 'next':
+            worker.chunk = None
+            self._assign(worker)
+        # heartbeats only refresh last_seen
+
+    def _record(self, worker: WorkerConnection, chunk_id, record: Dict):
+        if worker.chunk is not None and worker.chunk.chunk_id == chunk_id:
+            worker.chunk.progress += 1
+        index = record['index']
+        if index in self.finished:
+            self.duplicates += 1
+            return
+        self.finished.add(index)
+        self.out.write(json.dumps(record) + '\n')
+        self.out.flush()
+        self.written += 1
+        if record.get('nodes') is not None and self.job['kind'] == 'perft':
+            self.perft_nodes += record['nodes']
+
+    # Scheduling
+
+    def _assign(self, worker: WorkerConnection):
+        chunk = self._next_chunk() or self._steal()
+        if chunk is not None:
+            worker.chunk = chunk
+            worker.send({'type': 'chunk', 'chunk': chunk.chunk_id, 'items': chunk.items})
+        elif self._all_done():
+            self._finish()
+        else:
+            # others are still busy - one of them may die or be worth stealing from later
+            self.waiting.append(worker)
+
+    def _next_chunk(self) -> Optional[Chunk]:
+        if self.requeued:
+            return self.requeued.popleft()
+        if self.exhausted:
+            return None
+        items = list(itertools.islice(self.items, self.chunk_size))
+        if not items:
+            self.exhausted = True
+            return None
+        return Chunk(next(self.chunk_ids), items)
+
+    def _steal(self) -> Optional[Chunk]:
+        # back half of the unstarted items of the chunk with the most left
+        busy = [worker for worker in self.workers if worker.chunk is not None]
+        victim = max(busy, key=lambda worker: worker.chunk.unstarted(), default=None)
+        if victim is None or victim.chunk.unstarted() == 0:
+            return None
+        chunk = victim.chunk
+        keep = chunk.limit - (chunk.unstarted() + 1) // 2
+        items = [item for item in chunk.items[keep:chunk.limit] if item['index'] not in self.finished]
+        chunk.limit = keep
+        victim.send({'type': 'steal', 'chunk': chunk.chunk_id, 'keep': keep})
+        if not items:
+            return None
+        self.steals += 1
+        return Chunk(next(self.chunk_ids), items)
+
+    def _wake_waiting(self):
+        # _assign puts back the ones there's still nothing for
+        waiting = list(self.waiting)
+        self.waiting.clear()
+        for worker in waiting:
+            if self.done.is_set():
+                break
+            self._assign(worker)
+
+    def _all_done(self) -> bool:
+        return (self.exhausted and not self.requeued
+                and all(worker.chunk is None for worker in self.workers))
+
+    def _finish(self):
+        for worker in self.workers:
+            worker.send({'type': 'done'})
+        self.done.set()
+
+    # Failure handling
+
+    def _drop(self, worker: WorkerConnection):
+        # connection closed or heartbeat timed out - give its chunk to someone else
+        if worker.dropped:
+            return
+        worker.dropped = True
+        self.workers.discard(worker)
+        if worker in self.waiting:
+            self.waiting.remove(worker)
+        worker.writer.close()
+
+        chunk = worker.chunk
+        worker.chunk = None
+        if chunk is not None:
+            self.lost_workers += 1
+            items = [item for item in chunk.items[:chunk.limit] if item['index'] not in self.finished]
+            if items:
+                self.requeues += 1
+                self.requeued.append(Chunk(next(self.chunk_ids), items))
+                print(f"worker {worker.name} lost, {len(items)} items queued again", file=sys.stderr)
+        if not self.done.is_set():
+            if self._all_done():
+                self._finish()
+            else:
+                self._wake_waiting()
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            deadline = time.monotonic() - self.timeout
+            for worker in list(self.workers):
+                if worker.last_seen < deadline:
+                    # abort so the handler's readline ends now, not at the next TCP timeout
+                    worker.writer.transport.abort()
+                    self._drop(worker)
+
+    def get_stats(self) -> Dict:
+        return {
+            'written': self.written,
+            'duplicates': self.duplicates,
+            'steals': self.steals,
+            'requeues': self.requeues,
+            'lost_workers': self.lost_workers,
+            'workers': len(self.workers),
+        }
+
+
+# Worker
+
+class DistributedWorker:
+    # Connects to a coordinator and runs its chunks on one ChessEngine
+    # a reader thread takes messages off the socket and a heartbeat thread keeps
+    # the connection alive, so the search itself runs undisturbed in the caller
+
+    def __init__(self, host: str, port: int, tt_size_mb: int = 64, name: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.engine = ChessEngine(tt_size_mb=tt_size_mb)
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.inbox = queue.Queue()
+        self.limits = {}  # chunk id -> items to do, lowered by steal messages
+        self.stopped = threading.Event()
+        self.items_done = 0
+
+    def run(self) -> int:
+        # work until the coordinator says done or goes away, returns items done
+        self.sock = socket.create_connection((self.host, self.port))
+        threading.Thread(target=self._read_messages, name='coordinator-reader', daemon=True).start()
+        try:
+            welcome = self.inbox.get()
+            if welcome is None:
+                return 0
+            job = welcome['job']
+            threading.Thread(target=self._send_heartbeats, args=(welcome['heartbeat'],),
+                             name='heartbeat', daemon=True).start()
+
+            self._send({'op': 'hello', 'name': self.name})
+            self._send({'op': 'next'})
+            while True:
+                message = self.inbox.get()
+                if message is None:
+                    break
+                self._run_chunk(job, message['chunk'], message['items'])
+                self._send({'op': 'next'})
+        except OSError:
+            pass  # coordinator gone - nothing left to report to
+        finally:
+            self.stopped.set()
+            self.sock.close()
+        return self.items_done
+
+    def _run_chunk(self, job: Dict, chunk_id: int, items: List[Dict]):
+        self.limits[chunk_id] = len(items)
+        position = 0
+        while position < self.limits[chunk_id]:
+            record = self._run_item(job, items[position])
+            self._send({'op': 'record', 'chunk': chunk_id, 'record': record})
+            self.items_done += 1
+            position += 1
+        del self.limits[chunk_id]
+
+    def _run_item(self, job: Dict, item: Dict) -> Dict:
+        start_time = time.time()
+        board = ChessBoard.from_fen(item['fen'])
+        record = dict(item)
+        if job['kind'] == 'perft':
+            record['nodes'] = board.perft(job['depth'])
+        else:
+            limits = SearchLimits(depth=job.get('depth'), nodes=job.get('nodes'), movetime=job.get('time'))
+            best_move, score = self.engine.search(board, limits=limits)
+            record['best_move'] = move_to_notation(best_move) if best_move else None
+            record['score'] = score if best_move else None
+            record['depth'] = self.engine.completed_depth
+            record['nodes'] = self.engine.nodes_searched
+        record['time'] = round(time.time() - start_time, 4)
+        record['worker'] = self.name
+        return record
+
+    def _send(self, message: Dict):
+        data = (json.dumps(message) + '\n').encode()
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def _read_messages(self):
+        # steal messages are applied here so they land while a chunk is running
+        try:
+            for line in self.sock.makefile('rb'):
+                message = json.loads(line)
+                kind = message.get('type')
+                if kind == 'steal':
+                    chunk_id = message['chunk']
+                    if chunk_id in self.limits:
+                        self.limits[chunk_id] = min(self.limits[chunk_id], message['keep'])
+                elif kind == 'done':
+                    break
+                else:
+                    self.inbox.put(message)
+        except (OSError, ValueError):
+            pass
+        self.inbox.put(None)
+
+    def _send_heartbeats(self, interval: float):
+        while not self.stopped.wait(interval):
+            try:
+                self._send({'op': 'heartbeat'})
+            except OSError:
+                return
+
+
+# Command line
+
+def spawn_local_workers(count: int, port: int, tt_size_mb: int) -> List[subprocess.Popen]:
+    # workers on this machine, for running the whole cluster on one box
+    command = [sys.executable, os.path.abspath(__file__), 'worker', '--host', '127.0.0.1',
+               '--port', str(port), '--tt-mb', str(tt_size_mb)]
+    return [subprocess.Popen(command) for _ in range(count)]
+
+
+async def _coordinate(args) -> Coordinator:
+    if args.perft:
+        job = {'kind': 'perft', 'depth': args.perft - args.split}
+        items = perft_items(args.fen, args.split)
+    else:
+        job = {'kind': 'analyse', 'depth': args.depth, 'time': args.time, 'nodes': args.nodes}
+        items = position_items(args.input, args.min_ply)
+
+    with open(args.output, 'w') as out:
+        coordinator = Coordinator(items, out, job, chunk_size=args.chunk_size,
+                                  heartbeat=args.heartbeat, timeout=args.timeout)
+        await coordinator.start(args.host, args.port)
+        print(f"Coordinator on {args.host}:{coordinator.port}", file=sys.stderr)
+        workers = spawn_local_workers(args.spawn, coordinator.port, args.tt_mb)
+        try:
+            await coordinator.wait()
+        finally:
+            await coordinator.close()
+            for process in workers:
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.terminate()
+    return coordinator
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Spread analysis or perft over workers on many machines")
+    roles = parser.add_subparsers(dest='role', required=True)
+
+    coordinator_parser = roles.add_parser('coordinator', help="hand out the job and collect the results")
+    coordinator_parser.add_argument('input', nargs='?', help="EPD or PGN file (.pgn is read as PGN)")
+    coordinator_parser.add_argument('-o', '--output', required=True, help="JSONL output file")
+    coordinator_parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    coordinator_parser.add_argument('--port', type=int, default=9100, help="TCP port (0 picks a free one)")
+    coordinator_parser.add_argument('--depth', type=int, default=4, help="max search depth per position")
+    coordinator_parser.add_argument('--time', type=float, default=5.0, help="max seconds per position")
+    coordinator_parser.add_argument('--nodes', type=int, default=None, help="max nodes per position")
+    coordinator_parser.add_argument('--min-ply', type=int, default=0, help="skip the first plies of each PGN game")
+    coordinator_parser.add_argument('--perft', type=int, default=None, metavar='DEPTH',
+                                    help="count perft to DEPTH instead of analysing positions")
+    coordinator_parser.add_argument('--fen', default=None, help="root position for --perft (default: start)")
+    coordinator_parser.add_argument('--split', type=int, default=1,
+                                    help="plies the perft root is split into work items")
+    coordinator_parser.add_argument('--chunk-size', type=int, default=16, help="items handed out at a time")
+    coordinator_parser.add_argument('--heartbeat', type=float, default=1.0, help="seconds between worker heartbeats")
+    coordinator_parser.add_argument('--timeout', type=float, default=5.0,
+                                    help="drop a worker silent for this many seconds")
+    coordinator_parser.add_argument('--spawn', type=int, default=0, help="start this many local workers")
+    coordinator_parser.add_argument('--tt-mb', type=int, default=64, help="transposition table size per spawned worker")
+
+    worker_parser = roles.add_parser('worker', help="run chunks for a coordinator")
+    worker_parser.add_argument('--host', default='127.0.0.1', help="coordinator address")
+    worker_parser.add_argument('--port', type=int, default=9100, help="coordinator port")
+    worker_parser.add_argument('--tt-mb', type=int, default=64, help="transposition table size")
+    args = parser.parse_args(argv)
+
+    if args.role == 'worker':
+        DistributedWorker(args.host, args.port, tt_size_mb=args.tt_mb).run()
+        return
+
+    if args.perft:
+        args.fen = args.fen or ChessBoard().to_fen()
+        args.split = max(0, min(args.split, args.perft))
+    elif args.input is None:
+        parser.error("an input file is needed unless --perft is given")
+
+    start_time = time.time()
+    coordinator = asyncio.run(_coordinate(args))
+    elapsed = time.time() - start_time
+    stats = coordinator.get_stats()
+    if args.perft:
+        print(f"perft {args.perft}: {coordinator.perft_nodes:,} nodes in {elapsed:.1f}s", file=sys.stderr)
+    else:
+        print(f"Analysed {stats['written']:,} positions in {elapsed:.1f}s", file=sys.stderr)
+    print(f"{stats['steals']} steals, {stats['requeues']} requeues, {stats['lost_workers']} lost workers, "
+          f"{stats['duplicates']} duplicate results", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
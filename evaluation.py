@@ -1,7 +1,22 @@
 # Position evaluation - score how good a position is
 # positive = white better, negative = black better
 
-from chess_board import ChessBoard
+import json
+from typing import Optional
+
+from chess_board import (ChessBoard, COLOR_SHIFT, EN_PASSANT, FLAG_MASK, KING_CASTLE, QUEEN_CASTLE,
+                         SQUARE_COORDS, TYPE_MASK, piece_code, promotion_piece)
+
+WHITE_PAWN = piece_code(ChessBoard.PAWN, ChessBoard.WHITE)
+BLACK_PAWN = piece_code(ChessBoard.PAWN, ChessBoard.BLACK)
+WHITE_QUEEN = piece_code(ChessBoard.QUEEN, ChessBoard.WHITE)
+BLACK_QUEEN = piece_code(ChessBoard.QUEEN, ChessBoard.BLACK)
+
+CENTER_SQUARES = (27, 28, 35, 36)  # d5, e5, d4, e4
+
+# Names used in weight files (see texel.py), in piece type order
+PIECE_NAMES = ('pawn', 'knight', 'bishop', 'rook', 'queen')
+TABLE_NAMES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king_middle', 'king_end')
 
 
 class Evaluator:
@@ -103,8 +118,62 @@ class Evaluator:
         [-50,-30,-30,-30,-30,-30,-30,-50]
     ]
     
-    def __init__(self):
-        self.piece_square_tables = {
+    # Centipawns per move of mobility difference
+    MOBILITY_WEIGHT = 1
+    
+    # Per pawn in front of a king on its back rank
+    PAWN_SHIELD_BONUS = 10
+    
+    # Per enemy attack on a king's square or the squares next to it - off by default:
+    # at 2 it lost 43 +/- 33 Elo to 0 (match.py, 400 games at 1500 nodes), so it waits
+    # for a weight fitted by texel.py
+    KING_ZONE_ATTACK = 0
+    
+    # Lazy evaluation - the king zone attack and mobility differences the early
+    # exits allow for; the margins are these times the weights
+    # these are not true maxima (a side can have 200+ moves more than the other),
+    # they cover the positions a search meets - past them an early exit can return
+    # a bound on the wrong side of the window, trading a little accuracy for speed
+    LAZY_KING_ZONE_ATTACKS = 10
+    LAZY_MOBILITY_MOVES = 50
+    
+    def __init__(self, weights_path: Optional[str] = None):
+        # weights_path: JSON weights written by texel.py, replacing the built-in ones
+        self.reset_stats()
+        if weights_path is not None:
+            self.set_weights(self.read_weights(weights_path))
+            return
+        # the built-in weights' tables are built once per class and shared
+        cls = type(self)
+        tables = cls.__dict__.get('_shared_tables')
+        if tables is None:
+            tables = cls._shared_tables = self._make_tables()
+        self.piece_square_tables, self.square_scores, self.end_square_scores = tables
+    
+    def reset_stats(self):
+        # evaluate() counters: calls, and exits before the king safety / mobility tiers
+        self.evaluations = 0
+        self.exits_before_king_safety = 0
+        self.exits_before_mobility = 0
+    
+    def lazy_stats(self) -> dict:
+        # how often each tier was skipped by the lazy exits
+        skipped_mobility = self.exits_before_king_safety + self.exits_before_mobility
+        return {
+            'evaluations': self.evaluations,
+            'skipped_king_safety': self.exits_before_king_safety,
+            'skipped_mobility': skipped_mobility,
+            'full': self.evaluations - skipped_mobility,
+        }
+    
+    def _build_tables(self):
+        self.piece_square_tables, self.square_scores, self.end_square_scores = self._make_tables()
+    
+    def _make_tables(self):
+        # piece_square_tables: piece type -> 8x8 table (king on the middlegame one)
+        # square_scores / end_square_scores: [piece code][square] -> material plus
+        # position, negative for black - middlegame and endgame king tables
+        piece_square_tables = {
             ChessBoard.PAWN: self.PAWN_TABLE,
             ChessBoard.KNIGHT: self.KNIGHT_TABLE,
             ChessBoard.BISHOP: self.BISHOP_TABLE,
@@ -112,61 +181,146 @@ class Evaluator:
             ChessBoard.QUEEN: self.QUEEN_TABLE,
             ChessBoard.KING: self.KING_MIDDLE_TABLE
         }
+        
+        def flatten(king_table):
+            scores = [(0,) * 64] * 16
+            for piece_type, table in piece_square_tables.items():
+                if piece_type == ChessBoard.KING:
+                    table = king_table
+                value = self.PIECE_VALUES[piece_type]
+                scores[piece_code(piece_type, ChessBoard.WHITE)] = tuple(
+                    value + table[row][col] for row, col in SQUARE_COORDS)
+                scores[piece_code(piece_type, ChessBoard.BLACK)] = tuple(
+                    -(value + table[7 - row][col]) for row, col in SQUARE_COORDS)
+            return tuple(scores)
+        
+        return piece_square_tables, flatten(self.KING_MIDDLE_TABLE), flatten(self.KING_END_TABLE)
     
-    def evaluate(self, board: ChessBoard) -> int:
-        # evaluate position and return score
-        # Quick checkmate detection
-        if board.is_checkmate(ChessBoard.WHITE):
-            return -100000
-        if board.is_checkmate(ChessBoard.BLACK):
-            return 100000
-        
-        # Stalemate is a draw
-        if board.is_stalemate(ChessBoard.WHITE) or board.is_stalemate(ChessBoard.BLACK):
-            return 0
+    # Weights as plain data - what texel.py tunes and writes back
+    
+    def get_weights(self) -> dict:
+        tables = (self.PAWN_TABLE, self.KNIGHT_TABLE, self.BISHOP_TABLE, self.ROOK_TABLE,
+                  self.QUEEN_TABLE, self.KING_MIDDLE_TABLE, self.KING_END_TABLE)
+        return {
+            'piece_values': {name: self.PIECE_VALUES[piece_type]
+                             for piece_type, name in enumerate(PIECE_NAMES, ChessBoard.PAWN)},
+            'tables': {name: [list(row) for row in table] for name, table in zip(TABLE_NAMES, tables)},
+            'mobility': self.MOBILITY_WEIGHT,
+            'pawn_shield': self.PAWN_SHIELD_BONUS,
+            'king_zone': self.KING_ZONE_ATTACK,
+        }
+    
+    def set_weights(self, weights: dict):
+        # instance attributes shadow the class defaults, so other evaluators are untouched
+        piece_values = dict(self.PIECE_VALUES)
+        for piece_type, name in enumerate(PIECE_NAMES, ChessBoard.PAWN):
+            piece_values[piece_type] = weights['piece_values'][name]
+        self.PIECE_VALUES = piece_values
         
-        score = 0
+        tables = weights['tables']
+        self.PAWN_TABLE = tables['pawn']
+        self.KNIGHT_TABLE = tables['knight']
+        self.BISHOP_TABLE = tables['bishop']
+        self.ROOK_TABLE = tables['rook']
+        self.QUEEN_TABLE = tables['queen']
+        self.KING_MIDDLE_TABLE = tables['king_middle']
+        self.KING_END_TABLE = tables['king_end']
+        self.MOBILITY_WEIGHT = weights['mobility']
+        self.PAWN_SHIELD_BONUS = weights['pawn_shield']
+        # older weight files don't have it
+        self.KING_ZONE_ATTACK = weights.get('king_zone', self.KING_ZONE_ATTACK)
+        self._build_tables()
+    
+    @staticmethod
+    def read_weights(path: str) -> dict:
+        with open(path) as f:
+            weights = json.load(f)
+        for name in TABLE_NAMES:
+            table = weights['tables'][name]
+            if len(table) != 8 or any(len(row) != 8 for row in table):
+                raise ValueError(f"{path}: table {name!r} is not 8x8")
+        return weights
+    
+    def save_weights(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.get_weights(), f, indent=1)
+    
+    def prepare(self, board: ChessBoard):
+        # called with the root board before a search - evaluators that keep
+        # incremental state on the board (here and in nnue.py) set it up here
+        # the material + position totals: copies and make_move carry them from the root
+        position_score = board.position_score
+        if position_score is None or position_score.middle_scores is not self.square_scores:
+            board.position_score = PositionScore(self.square_scores, self.end_square_scores,
+                                                 self._sum_scores(board, self.square_scores),
+                                                 self._sum_scores(board, self.end_square_scores))
+    
+    def evaluate(self, board: ChessBoard, alpha: Optional[int] = None, beta: Optional[int] = None) -> int:
+        # evaluate position and return score
+        # alpha/beta: the search window, from white's side like the score - the
+        # cheap terms come first, and when they plus a margin for the rest can't
+        # reach the window the bound is returned without the rest (lazy evaluation)
+        # mate, stalemate and mobility all come from the board's attack map and
+        # the two legal move lists kept on it, so each is generated once
+        self.evaluations += 1
         
         # Material and positional evaluation
-        score += self._evaluate_material_and_position(board)
+        score = self._evaluate_material_and_position(board)
         
-        # Mobility bonus
-        score += self._evaluate_mobility(board)
+        # a side to move without moves is mated or stalemated - the terminal scores
+        # below have to win over any bound, so that's ruled out before exiting early
+        lazy = alpha is not None and board.has_legal_move(board.current_turn)
+        if lazy:
+            mobility_margin = self.LAZY_MOBILITY_MOVES * self.MOBILITY_WEIGHT
+            margin = (mobility_margin + 3 * self.PAWN_SHIELD_BONUS
+                      + self.LAZY_KING_ZONE_ATTACKS * self.KING_ZONE_ATTACK)
+            if score + margin <= alpha:
+                self.exits_before_king_safety += 1
+                return score + margin
+            if score - margin >= beta:
+                self.exits_before_king_safety += 1
+                return score - margin
         
         # King safety
         score += self._evaluate_king_safety(board)
         
-        return score
+        if lazy:
+            if score + mobility_margin <= alpha:
+                self.exits_before_mobility += 1
+                return score + mobility_margin
+            if score - mobility_margin >= beta:
+                self.exits_before_mobility += 1
+                return score - mobility_margin
+        
+        # Checkmate / stalemate of the side to move
+        turn = board.current_turn
+        if not board.generate_moves(turn):
+            if board.attack_map().in_check(turn):
+                return -100000 if turn == ChessBoard.WHITE else 100000
+            return 0
+        
+        return score + self._evaluate_mobility(board)
     
     def _evaluate_material_and_position(self, board: ChessBoard) -> int:
-        score = 0
+        # kept up to date by make_move (see PositionScore), computed here for
+        # boards that didn't come from a prepared root
+        position_score = board.position_score
+        if position_score is None or position_score.middle_scores is not self.square_scores:
+            Evaluator.prepare(self, board)
+            position_score = board.position_score
         
         # Determine if we're in endgame (for king PST selection)
-        is_endgame = self._is_endgame(board)
-        
-        for row in range(8):
-            for col in range(8):
-                piece = board.board[row][col]
-                if piece:
-                    piece_type, color = piece
-                    
-                    # Material value
-                    material_value = self.PIECE_VALUES[piece_type]
-                    
-                    # Positional value from piece-square tables
-                    if piece_type == ChessBoard.KING:
-                        pst = self.KING_END_TABLE if is_endgame else self.KING_MIDDLE_TABLE
-                    else:
-                        pst = self.piece_square_tables[piece_type]
-                    
-                    # For black pieces, flip the board vertically
-                    if color == ChessBoard.WHITE:
-                        positional_value = pst[row][col]
-                        score += material_value + positional_value
-                    else:
-                        positional_value = pst[7 - row][col]
-                        score -= material_value + positional_value
-        
+        return position_score.end if self._is_endgame(board) else position_score.middle
+    
+    @staticmethod
+    def _sum_scores(board: ChessBoard, scores) -> int:
+        # material and position come premixed, black flipped and negated
+        score = 0
+        for code, squares in enumerate(board.piece_squares):
+            if squares:
+                code_scores = scores[code]
+                for square in squares:
+                    score += code_scores[square]
         return score
     
     def _evaluate_mobility(self, board: ChessBoard) -> int:
@@ -174,72 +328,112 @@ class Evaluator:
         white_moves = len(board.generate_moves(ChessBoard.WHITE))
         black_moves = len(board.generate_moves(ChessBoard.BLACK))
         
-        # Small bonus for mobility (0.1 centipawn per move)
-        return (white_moves - black_moves) * 10 // 10
+        # Small bonus for mobility
+        return (white_moves - black_moves) * self.MOBILITY_WEIGHT
     
     def _evaluate_king_safety(self, board: ChessBoard) -> int:
-        # king safety - pawns in front are good
+        # king safety - pawns in front are good, enemy attacks around the king are bad
         score = 0
         
+        attacks = board.attack_map()
+        score -= attacks.king_zone_attacks(board, ChessBoard.WHITE) * self.KING_ZONE_ATTACK
+        score += attacks.king_zone_attacks(board, ChessBoard.BLACK) * self.KING_ZONE_ATTACK
+        
         # Check pawn shield for white king
         white_king_row, white_king_col = board.white_king_pos
         if white_king_row == 7:  # King on back rank
             for col in [white_king_col - 1, white_king_col, white_king_col + 1]:
                 if 0 <= col < 8:
-                    piece = board.board[6][col]
-                    if piece and piece == (ChessBoard.PAWN, ChessBoard.WHITE):
-                        score += 10  # Bonus for pawn shield
+                    if board.squares[48 + col] == WHITE_PAWN:
+                        score += self.PAWN_SHIELD_BONUS  # Bonus for pawn shield
         
         # Check pawn shield for black king
         black_king_row, black_king_col = board.black_king_pos
         if black_king_row == 0:  # King on back rank
             for col in [black_king_col - 1, black_king_col, black_king_col + 1]:
                 if 0 <= col < 8:
-                    piece = board.board[1][col]
-                    if piece and piece == (ChessBoard.PAWN, ChessBoard.BLACK):
-                        score -= 10  # Penalty for black's pawn shield
+                    if board.squares[8 + col] == BLACK_PAWN:
+                        score -= self.PAWN_SHIELD_BONUS  # Penalty for black's pawn shield
         
         return score
     
     def _is_endgame(self, board: ChessBoard) -> bool:
         # endgame if few pieces left
-        piece_count = 0
-        queen_count = 0
-        
-        for row in range(8):
-            for col in range(8):
-                piece = board.board[row][col]
-                if piece and piece[0] != ChessBoard.KING:
-                    piece_count += 1
-                    if piece[0] == ChessBoard.QUEEN:
-                        queen_count += 1
+        piece_squares = board.piece_squares
+        piece_count = 62 - board.squares.count(0)  # not counting the kings
+        queen_count = len(piece_squares[WHITE_QUEEN]) + len(piece_squares[BLACK_QUEEN])
         
         # Endgame if no queens and few pieces, or very few pieces total
         return (queen_count == 0 and piece_count <= 6) or piece_count <= 4
     
-    def evaluate_move_priority(self, board: ChessBoard, move: tuple) -> int:
+    def evaluate_move_priority(self, board: ChessBoard, move: int) -> int:
         # give moves a priority for ordering
-        from_pos, to_pos = move
-        moving_piece = board.board[from_pos[0]][from_pos[1]]
-        captured_piece = board.board[to_pos[0]][to_pos[1]]
+        squares = board.squares
+        to_square = move >> 6 & 63
+        moving_piece = squares[move & 63]
+        captured_piece = squares[to_square]
         
         score = 0
         
         # Captures are prioritized (MVV-LVA: Most Valuable Victim - Least Valuable Attacker)
         if captured_piece:
-            victim_value = self.PIECE_VALUES[captured_piece[0]]
-            attacker_value = self.PIECE_VALUES[moving_piece[0]]
+            victim_value = self.PIECE_VALUES[captured_piece & TYPE_MASK]
+            attacker_value = self.PIECE_VALUES[moving_piece & TYPE_MASK]
             score += 10 * victim_value - attacker_value
         
-        # Promotions are very valuable
-        if moving_piece[0] == ChessBoard.PAWN:
-            if (moving_piece[1] == ChessBoard.WHITE and to_pos[0] == 0) or \
-               (moving_piece[1] == ChessBoard.BLACK and to_pos[0] == 7):
-                score += 9000  # Queen promotion
+        # Promotions are very valuable (a queen promotion gets 9000)
+        promotion = promotion_piece(move)
+        if promotion:
+            score += 10 * self.PIECE_VALUES[promotion]
         
         # Center control bonus
-        center_squares = [(3, 3), (3, 4), (4, 3), (4, 4)]
-        if to_pos in center_squares:
+        if to_square in CENTER_SQUARES:
             score += 50
         
         return score
+
+
+
+class PositionScore:
+    # Material plus position totals with both king tables, kept on the board -
+    # make_move swaps it for an updated one, so board copies can share it
+    
+    __slots__ = ('middle_scores', 'end_scores', 'middle', 'end')
+    
+    def __init__(self, middle_scores, end_scores, middle: int, end: int):
+        self.middle_scores = middle_scores
+        self.end_scores = end_scores
+        self.middle = middle
+        self.end = end
+    
+    def updated(self, board: ChessBoard, move: int, moving_piece: int, placed_piece: int,
+                captured_piece: int) -> 'PositionScore':
+        # called by make_move with the board already in the new position
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        flags = move & FLAG_MASK
+        middle_scores = self.middle_scores
+        end_scores = self.end_scores
+        
+        middle = (self.middle - middle_scores[moving_piece][from_square]
+                  + middle_scores[placed_piece][to_square])
+        end = self.end - end_scores[moving_piece][from_square] + end_scores[placed_piece][to_square]
+        
+        if captured_piece:
+            capture_square = to_square
+            if flags == EN_PASSANT:
+                capture_square += 8 if moving_piece >> COLOR_SHIFT == ChessBoard.WHITE else -8
+            middle -= middle_scores[captured_piece][capture_square]
+            end -= end_scores[captured_piece][capture_square]
+        elif flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rook_from, rook_to = (to_square + 1, to_square - 1) if flags == KING_CASTLE \
+                else (to_square - 2, to_square + 1)
+            rook = board.squares[rook_to]
+            middle += middle_scores[rook][rook_to] - middle_scores[rook][rook_from]
+            end += end_scores[rook][rook_to] - end_scores[rook][rook_from]
+        
+        return PositionScore(middle_scores, end_scores, middle, end)
+
+
+# Built-in tables made at import, so forked worker processes inherit them
+Evaluator._shared_tables = Evaluator._make_tables(Evaluator)
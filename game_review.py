@@ -0,0 +1,201 @@
+# Game review - search every position of a finished game and flag the bad moves
+# the positions are searched from the last move back to the first with one
+# engine, so each search starts with the table the later positions filled in:
+# the game's continuation is already in there when the move before it is looked at
+#
+#   review = review_game(['e2e4', 'e7e5', 'g1f3', ...], max_depth=6, max_time=2.0)
+#   print(format_review(review))
+#
+#   python game_review.py game.pgn --depth 6 --time 2
+#   python game_review.py --moves "e2e4 e7e5 d1h5 b8c6 f1c4 g8f6 h5f7" --depth 5
+#
+# A move's loss is the best score in its position minus the score after the move
+# that was played, both for the side that moved. The labels come from LABELS.
+
+import argparse
+import json
+import time
+from typing import Dict, List, Optional, Sequence, Union
+
+import pgn
+from chess_board import ChessBoard, move_to_notation
+from chess_engine import ChessEngine
+from search_limits import SearchLimits
+
+# Centipawns lost -> label, worst first
+LABELS = (('blunder', 200), ('mistake', 100), ('inaccuracy', 50))
+
+MATE_SCORE = 100000
+
+# Scores beyond this are mates (the engine scores them 100000 + depth)
+MATE_THRESHOLD = 90000
+
+
+def _label(loss: int) -> Optional[str]:
+    for label, threshold in LABELS:
+        if loss >= threshold:
+            return label
+    return None
+
+
+def game_boards(moves: Sequence[Union[int, str]], start_fen: Optional[str] = None):
+    # (boards, moves) - boards[i] is the position before moves[i], plus the final one
+    # moves can be ints or coordinate notation like ChessCLI.move_history_notation
+    board = ChessBoard.from_fen(start_fen) if start_fen else ChessBoard()
+    boards = [board]
+    int_moves = []
+    for ply, move in enumerate(moves):
+        if isinstance(move, str):
+            move = board.parse_move(move)
+        if not move or move not in board.generate_moves(board.current_turn):
+            raise ValueError(f"illegal move {moves[ply]!r} at ply {ply + 1}")
+        # copies keep the key stack, so repetitions earlier in the game still count
+        board = board.copy()
+        board.make_move(move)
+        boards.append(board)
+        int_moves.append(move)
+    return boards, int_moves
+
+
+def review_game(moves: Sequence[Union[int, str]], engine: Optional[ChessEngine] = None,
+                start_fen: Optional[str] = None, max_depth: int = 6, max_time: Optional[float] = 5.0,
+                max_nodes: Optional[int] = None, backwards: bool = True) -> Dict:
+    # {'moves': [one dict per move], 'time', 'nodes'} - see format_review
+    # backwards=False searches in game order, for comparing the cost
+    engine = engine or ChessEngine()
+    boards, moves = game_boards(moves, start_fen)
+    limits = SearchLimits(depth=max_depth, nodes=max_nodes, movetime=max_time)
+
+    start_time = time.time()
+    searches = [None] * len(boards)
+    order = range(len(boards) - 1, -1, -1) if backwards else range(len(boards))
+    for index in order:
+        searches[index] = _search_position(engine, boards[index], limits)
+    elapsed = time.time() - start_time
+
+    entries = []
+    for ply, move in enumerate(moves):
+        board = boards[ply]
+        search = searches[ply]
+        # the reply's score is for the opponent - negate it for the side that moved
+        played_score = -searches[ply + 1]['score']
+        if move == search['best_move']:
+            loss = 0
+        else:
+            loss = max(0, search['score'] - played_score)
+        white_to_move = board.current_turn == ChessBoard.WHITE
+        entries.append({
+            'ply': ply + 1,
+            'side': 'white' if white_to_move else 'black',
+            'move': move_to_notation(move),
+            'san': pgn.encode_san(board, move),
+            'best_move': move_to_notation(search['best_move']) if search['best_move'] else None,
+            'best_san': pgn.encode_san(board, search['best_move']) if search['best_move'] else None,
+            'best_score': search['score'],
+            'played_score': played_score,
+            'eval': played_score if white_to_move else -played_score,  # for white, after the move
+            'loss': loss,
+            'label': _label(loss),
+            'depth': search['depth'],
+            'nodes': search['nodes'],
+            'time': round(search['time'], 4),
+        })
+
+    return {
+        'moves': entries,
+        'time': round(elapsed, 4),
+        'nodes': sum(search['nodes'] for search in searches),
+    }
+
+
+def _search_position(engine: ChessEngine, board: ChessBoard, limits: SearchLimits) -> Dict:
+    start_time = time.time()
+    if not board.generate_moves(board.current_turn):
+        # the game ended here - nothing to search
+        score = -MATE_SCORE if board.in_check(board.current_turn) else 0
+        return {'best_move': 0, 'score': score, 'depth': 0, 'nodes': 0, 'time': 0.0}
+    best_move, score = engine.search(board, limits=limits)
+    return {
+        'best_move': best_move or 0,
+        'score': score,
+        'depth': engine.completed_depth,
+        'nodes': engine.nodes_searched,
+        'time': time.time() - start_time,
+    }
+
+
+def summarize(review: Dict) -> Dict:
+    # per side: labelled move counts and average centipawn loss (mates capped at 1000)
+    summary = {}
+    for side in ('white', 'black'):
+        entries = [entry for entry in review['moves'] if entry['side'] == side]
+        side_summary = {label: sum(1 for entry in entries if entry['label'] == label) for label, _ in LABELS}
+        side_summary['average_loss'] = (round(sum(min(entry['loss'], 1000) for entry in entries) / len(entries))
+                                        if entries else 0)
+        summary[side] = side_summary
+    return summary
+
+
+def _format_score(score: int) -> str:
+    if abs(score) > MATE_THRESHOLD:
+        return '+mate' if score > 0 else '-mate'
+    return f"{score:+d}"
+
+
+def format_review(review: Dict) -> str:
+    lines = []
+    for entry in review['moves']:
+        number = (entry['ply'] + 1) // 2
+        prefix = f"{number}." if entry['side'] == 'white' else f"{number}..."
+        line = f"{prefix:>6} {entry['san']:<8} {_format_score(entry['eval']):>7}"
+        if entry['label']:
+            loss = 'mate' if entry['loss'] > MATE_THRESHOLD else f"-{entry['loss']}"
+            line += f"  {entry['label']} ({loss}), best {entry['best_san']}"
+        lines.append(f"{line:<60} d{entry['depth']} {entry['nodes']:>8,} nodes {entry['time']:6.2f}s")
+
+    for side, side_summary in summarize(review).items():
+        counts = ', '.join(f"{label} {side_summary[label]}" for label, _ in LABELS)
+        lines.append(f"{side.capitalize()}: {counts}, average loss {side_summary['average_loss']} cp")
+    lines.append(f"Reviewed {len(review['moves'])} moves: {review['nodes']:,} nodes in {review['time']:.1f}s")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Review a finished game move by move")
+    parser.add_argument('pgn', nargs='?', help="PGN file (the first game, or --game N)")
+    parser.add_argument('--game', type=int, default=1, help="which game of the PGN file to review")
+    parser.add_argument('--moves', default=None, help="moves in coordinate notation instead of a PGN file")
+    parser.add_argument('--fen', default=None, help="starting position for --moves")
+    parser.add_argument('--depth', type=int, default=6, help="max search depth per position")
+    parser.add_argument('--time', type=float, default=5.0, help="max seconds per position")
+    parser.add_argument('--nodes', type=int, default=None, help="max nodes per position")
+    parser.add_argument('--tt-mb', type=int, default=128, help="transposition table size")
+    parser.add_argument('--forwards', action='store_true', help="search in game order (for comparison)")
+    parser.add_argument('--json', default=None, help="also write the per-move results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.moves is not None:
+        moves, start_fen = args.moves.split(), args.fen
+    elif args.pgn is not None:
+        game = next((game for number, game in enumerate(pgn.read_games(args.pgn), 1) if number == args.game), None)
+        if game is None:
+            parser.error(f"{args.pgn} has no game {args.game}")
+        moves, start_fen = game.moves(), game.headers.get('FEN')
+    else:
+        parser.error("give a PGN file or --moves")
+
+    try:
+        review = review_game(moves, ChessEngine(tt_size_mb=args.tt_mb), start_fen=start_fen,
+                             max_depth=args.depth, max_time=args.time, max_nodes=args.nodes,
+                             backwards=not args.forwards)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(format_review(review))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(review, summary=summarize(review)), f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
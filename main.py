@@ -3,18 +3,28 @@
 
 import sys
 import time
-from chess_board import ChessBoard
+from chess_board import ChessBoard, move_to_notation, parse_notation
 from chess_engine import ChessEngine
 from evaluation import Evaluator
+from game_review import format_review, review_game
+from pgn import game_to_pgn
+from search_limits import SearchLimits
 
 
 class ChessCLI:
     
-    def __init__(self):
+    def __init__(self, ponder: bool = True):
         self.board = ChessBoard()
         self.engine = ChessEngine(tt_size_mb=128)
+        
+        # Pondering - think on the player's time about the reply we expect
+        self.ponder = ponder
+        self.ponder_move = 0
+        self.ponder_limits = None  # (depth, time_limit) of the engine's searches
         self.evaluator = Evaluator()
         self.game_over = False
+        self.game_result = '*'
+        self.move_history = []
         self.move_history_notation = []
     
     def print_banner(self):
@@ -39,43 +49,43 @@ class ChessCLI:
             winner = "Black" if self.board.current_turn == ChessBoard.WHITE else "White"
             print(f"\n*** CHECKMATE! {winner} wins! ***\n")
             self.game_over = True
+            self.game_result = '0-1' if winner == "Black" else '1-0'
         elif self.board.is_stalemate(self.board.current_turn):
             print(f"\n*** STALEMATE! Game is a draw. ***\n")
             self.game_over = True
-        elif self.board.halfmove_clock >= 50:
+            self.game_result = '1/2-1/2'
+        elif self.board.is_fifty_move_draw():
             print(f"\n*** FIFTY-MOVE RULE! Game is a draw. ***\n")
             self.game_over = True
+            self.game_result = '1/2-1/2'
+        elif self.board.is_threefold_repetition():
+            print(f"\n*** THREEFOLD REPETITION! Game is a draw. ***\n")
+            self.game_over = True
+            self.game_result = '1/2-1/2'
+        elif self.board.has_insufficient_material():
+            print(f"\n*** INSUFFICIENT MATERIAL! Game is a draw. ***\n")
+            self.game_over = True
+            self.game_result = '1/2-1/2'
     
     def parse_move(self, move_str: str):
-        # convert e2e4 notation to coordinates
-        move_str = move_str.strip().lower()
-        
-        if len(move_str) != 4:
-            return None
-        
-        try:
-            from_col = ord(move_str[0]) - ord('a')
-            from_row = 8 - int(move_str[1])
-            to_col = ord(move_str[2]) - ord('a')
-            to_row = 8 - int(move_str[3])
-            
-            if not (0 <= from_row < 8 and 0 <= from_col < 8 and 
-                   0 <= to_row < 8 and 0 <= to_col < 8):
-                return None
-            
-            return ((from_row, from_col), (to_row, to_col))
-        except:
+        # convert e2e4 / e7e8q notation to a move in the current position
+        parsed = parse_notation(move_str)
+        if parsed is None:
             return None
+        return self.board.move_from_squares(*parsed)
     
-    def move_to_notation(self, move: tuple) -> str:
-        from_pos, to_pos = move
-        from_row, from_col = from_pos
-        to_row, to_col = to_pos
-        
-        from_square = chr(ord('a') + from_col) + str(8 - from_row)
-        to_square = chr(ord('a') + to_col) + str(8 - to_row)
-        
-        return from_square + to_square
+    def move_to_notation(self, move: int) -> str:
+        return move_to_notation(move)
+    
+    def game_pgn(self, white: str, black: str) -> str:
+        # the game so far as PGN
+        headers = {
+            'Event': 'Casual game',
+            'Date': time.strftime('%Y.%m.%d'),
+            'White': white,
+            'Black': black,
+        }
+        return game_to_pgn(self.move_history, headers, self.game_result)
     
     def get_player_move(self):
         legal_moves = self.board.generate_moves(self.board.current_turn)
@@ -83,11 +93,17 @@ class ChessCLI:
         if not legal_moves:
             return None
         
+        # Search the expected move's position while the player is thinking
+        if self.ponder and self.ponder_move in legal_moves and self.ponder_limits:
+            depth, time_limit = self.ponder_limits
+            self.engine.start_ponder(self.board, self.ponder_move, max_depth=depth, max_time=time_limit)
+        
         while True:
             print("\nEnter your move (e.g., e2e4), 'legal' to see legal moves, or 'quit' to exit:")
             user_input = input("> ").strip().lower()
             
             if user_input == 'quit':
+                self.engine.stop_ponder()
                 print("\nThanks for playing!")
                 sys.exit(0)
             
@@ -105,24 +121,37 @@ class ChessCLI:
             move = self.parse_move(user_input)
             
             if move is None:
-                print("Invalid move format. Use algebraic notation (e.g., e2e4).")
+                print("Invalid move format. Use algebraic notation (e.g., e2e4, e7e8q).")
                 continue
             
             if move not in legal_moves:
                 print("Illegal move. Try again or type 'legal' to see valid moves.")
                 continue
             
+            # ponder miss - the search was for a different position
+            if move != self.ponder_move:
+                self.engine.stop_ponder()
             return move
     
     def get_engine_move(self, depth: int = 5, time_limit: float = 5.0):
         print(f"\nEngine thinking (depth={depth}, max_time={time_limit}s)...")
         
         start_time = time.time()
-        best_move, score = self.engine.search(self.board, max_depth=depth, max_time=time_limit)
+        result = None
+        if self.engine.ponder_thread is not None:
+            # ponder hit - the search has been running since the player's turn started
+            print("Ponder hit!")
+            result = self.engine.ponder_hit()
+        if not result or not result[0]:
+            result = self.stream_search(depth, time_limit)
+        best_move, score = result
         elapsed = time.time() - start_time
         
         stats = self.engine.get_statistics()
         
+        self.ponder_limits = (depth, time_limit)
+        self.ponder_move = self.engine.ponder_move(self.board, best_move) if best_move else 0
+        
         if best_move:
             print(f"Engine move: {self.move_to_notation(best_move)}")
             print(f"Evaluation: {score:+d} centipawns")
@@ -133,6 +162,24 @@ class ChessCLI:
         
         return best_move
     
+    def stream_search(self, depth: int, time_limit: float):
+        # search with a line per finished depth, returns (best_move, score) like engine.search
+        info = None
+        for info in self.engine.iter_search(self.board, SearchLimits(depth=depth, movetime=time_limit)):
+            pv = ' '.join(self.move_to_notation(move) for move in info.pv)
+            print(f"  depth {info.depth}: {info.score:+d}  {pv}  "
+                  f"({info.nodes:,} nodes, {info.time:.2f}s)")
+        return (info.best_move, info.score) if info is not None else (None, float('-inf'))
+    
+    def review(self, depth: int = 5, time_limit: float = 2.0):
+        # search the game from the last move back and print the blunders
+        if not self.move_history:
+            return
+        self.engine.stop_ponder()  # the review searches with the same engine
+        print(f"\nReviewing {len(self.move_history)} moves (depth={depth}, max_time={time_limit}s)...")
+        result = review_game(self.move_history_notation, self.engine, max_depth=depth, max_time=time_limit)
+        print(format_review(result))
+    
     def play_human_vs_engine(self):
         self.print_banner()
         
@@ -194,13 +241,22 @@ class ChessCLI:
                     break
             
             # Make the move
+            self.move_history.append(move)
             self.move_history_notation.append(self.move_to_notation(move))
             self.board.make_move(move)
             self.print_board()
         
-        # Game over
+        # Game over - a player move that ended the game leaves the ponder search running
+        self.engine.stop_ponder()
         print("\nGame Over!")
         print(f"Moves played: {', '.join(self.move_history_notation)}")
+        
+        white, black = ("Player", "Engine") if player_color == ChessBoard.WHITE else ("Engine", "Player")
+        print("\n" + self.game_pgn(white, black))
+        
+        print("\nReview the game? (y/n)")
+        if input("> ").strip().lower().startswith('y'):
+            self.review(depth=engine_depth, time_limit=engine_time)
     
     def play_engine_vs_engine(self):
         self.print_banner()
@@ -240,6 +296,7 @@ class ChessCLI:
                 print("Engine couldn't find a move.")
                 break
             
+            self.move_history.append(move)
             self.move_history_notation.append(self.move_to_notation(move))
             self.board.make_move(move)
             self.print_board()
@@ -250,6 +307,7 @@ class ChessCLI:
         print("\nGame Over!")
         print(f"Total moves: {move_count}")
         print(f"Move history: {', '.join(self.move_history_notation)}")
+        print("\n" + self.game_pgn("Engine", "Engine"))
     
     def run(self):
         self.print_banner()
@@ -0,0 +1,395 @@
+# Self-play match runner - engine A vs engine B over many games
+# games run in parallel on a process pool, each opening is played with
+# both colors, and an SPRT decides whether A is stronger than B
+#
+#   python match.py --a "name=new,nodes=20000" --b "name=base,nodes=20000" \
+#       --games 2000 --workers 8 --openings openings.epd --elo0 0 --elo1 5
+
+import argparse
+import concurrent.futures
+import importlib
+import math
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from chess_board import ChessBoard, move_to_notation
+from chess_engine import ChessEngine
+from evaluation import Evaluator
+from nnue import NNUEEvaluator
+
+
+# A few balanced positions a couple of moves into common openings
+DEFAULT_OPENINGS = [
+    'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pppp1ppp/4p3/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pp1ppppp/2p5/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkb1r/pppppppp/5n2/8/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 1 2',
+    'rnbqkbnr/pppppppp/8/8/2P5/8/PP1PPPPP/RNBQKBNR b KQkq - 0 1',
+    'rnbqkbnr/pppppppp/8/8/8/5N2/PPPPPPPP/RNBQKB1R b KQkq - 1 1',
+    'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3',
+    'rnbqkb1r/pppp1ppp/5n2/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3',
+    'rnbqkbnr/ppp2ppp/4p3/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3',
+    'rnbqkbnr/pp2pppp/2p5/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3',
+    'rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq - 0 2',
+    'rnbqkb1r/pppppp1p/5np1/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3',
+    'rnbqkbnr/ppp1pppp/8/3p4/8/5NP1/PPPPPP1P/RNBQKB1R b KQkq - 0 2',
+    'rnbqkbnr/pppppp1p/6p1/8/3PP3/8/PPP2PPP/RNBQKBNR b KQkq - 0 2',
+]
+
+
+class EngineConfig:
+    # One side of the match: search limits plus how to build the engine
+    # factory is an optional "module:callable" returning a ChessEngine,
+    # which is how a changed search or evaluation gets tested
+    # nnue is an optional network file for nnue.NNUEEvaluator
+    # weights is an optional JSON weights file from texel.py for Evaluator
+
+    def __init__(self, name: str = 'engine', max_depth: int = 64, max_time: float = 0.1,
+                 max_nodes: Optional[int] = None, tt_size_mb: int = 16, factory: Optional[str] = None,
+                 nnue: Optional[str] = None, weights: Optional[str] = None):
+        self.name = name
+        self.max_depth = max_depth
+        self.max_time = max_time
+        self.max_nodes = max_nodes
+        self.tt_size_mb = tt_size_mb
+        self.factory = factory
+        self.nnue = nnue
+        self.weights = weights
+
+    @classmethod
+    def parse(cls, spec: str) -> 'EngineConfig':
+        # "name=base,depth=5,time=0.2,nodes=20000,tt=16,factory=mymodule:make_engine,nnue=net.nnue,weights=tuned.json"
+        config = cls()
+        for item in filter(None, spec.split(',')):
+            key, _, value = item.partition('=')
+            key = key.strip()
+            value = value.strip()
+            if key == 'name':
+                config.name = value
+            elif key == 'depth':
+                config.max_depth = int(value)
+            elif key == 'time':
+                config.max_time = float(value)
+            elif key == 'nodes':
+                config.max_nodes = int(value)
+            elif key == 'tt':
+                config.tt_size_mb = int(value)
+            elif key == 'factory':
+                config.factory = value
+            elif key == 'nnue':
+                config.nnue = value
+            elif key == 'weights':
+                config.weights = value
+            else:
+                raise ValueError(f"Unknown engine option: {key!r}")
+        # with a node limit the clock shouldn't be what stops the search
+        if config.max_nodes is not None and 'time=' not in spec:
+            config.max_time = float('inf')
+        return config
+
+    def build(self) -> ChessEngine:
+        if self.factory:
+            module_name, _, attribute = self.factory.partition(':')
+            return getattr(importlib.import_module(module_name), attribute)()
+        evaluator = None
+        if self.nnue:
+            evaluator = NNUEEvaluator.load(self.nnue)
+        elif self.weights:
+            evaluator = Evaluator(self.weights)
+        return ChessEngine(tt_size_mb=self.tt_size_mb, evaluator=evaluator)
+
+
+def read_openings(path: Optional[str]) -> List[str]:
+    # FENs/EPDs from a file (one per line), or the built-in list
+    if path is None:
+        return list(DEFAULT_OPENINGS)
+    openings = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 4 and not line.startswith('#'):
+                openings.append(' '.join(fields[:6] if len(fields) >= 6 and fields[4].isdigit() else fields[:4]))
+    return openings
+
+
+class Adjudicator:
+    # Decides when a game is over - rules first, then optional score adjudication
+
+    def __init__(self, max_plies: int = 400, resign_score: Optional[int] = 1000,
+                 resign_moves: int = 4):
+        self.max_plies = max_plies
+        self.resign_score = resign_score
+        self.resign_moves = resign_moves
+
+    def rules_result(self, board: ChessBoard) -> Optional[Tuple[str, str]]:
+        # (result, reason) if the game is over by the rules, else None
+        color = board.current_turn
+        if not board.generate_moves(color):
+            if board.is_checkmate(color):
+                return ('0-1' if color == ChessBoard.WHITE else '1-0'), 'checkmate'
+            return '1/2-1/2', 'stalemate'
+        if board.is_threefold_repetition():
+            return '1/2-1/2', 'repetition'
+        if board.is_fifty_move_draw():
+            return '1/2-1/2', 'fifty moves'
+        if board.has_insufficient_material():
+            return '1/2-1/2', 'insufficient material'
+        return None
+
+    def score_result(self, scores: List[int], board: ChessBoard) -> Optional[Tuple[str, str]]:
+        # both engines agree one side is winning big for several moves
+        # scores are from the point of view of the side that searched
+        if self.resign_score is None or len(scores) < 2 * self.resign_moves:
+            return None
+
+        # flip the alternating scores to white's point of view
+        white_view = []
+        color = 1 - board.current_turn  # side that played the last move
+        for score in reversed(scores[-2 * self.resign_moves:]):
+            white_view.append(score if color == ChessBoard.WHITE else -score)
+            color = 1 - color
+
+        if all(score >= self.resign_score for score in white_view):
+            return '1-0', 'adjudication'
+        if all(score <= -self.resign_score for score in white_view):
+            return '0-1', 'adjudication'
+        return None
+
+
+_worker_engines: Dict[str, ChessEngine] = {}
+_worker_configs: Tuple[EngineConfig, EngineConfig] = None
+_worker_adjudicator: Adjudicator = None
+
+
+def _init_worker(config_a: EngineConfig, config_b: EngineConfig, adjudicator: Adjudicator):
+    global _worker_configs, _worker_adjudicator
+    _worker_configs = (config_a, config_b)
+    _worker_adjudicator = adjudicator
+    _worker_engines['a'] = config_a.build()
+    _worker_engines['b'] = config_b.build()
+
+
+def _play_game(task: Tuple[int, str, bool]) -> Dict:
+    # play one game, returns the result from engine A's point of view
+    game_index, fen, a_is_white = task
+    config_a, config_b = _worker_configs
+    board = ChessBoard.from_fen(fen)
+
+    engine_a, engine_b = _worker_engines['a'], _worker_engines['b']
+    # fresh tables each game so games are independent
+    engine_a.clear_transposition_table()
+    engine_b.clear_transposition_table()
+
+    white = (engine_a, config_a) if a_is_white else (engine_b, config_b)
+    black = (engine_b, config_b) if a_is_white else (engine_a, config_a)
+
+    moves = []
+    scores = []
+    outcome = None
+    while outcome is None:
+        outcome = _worker_adjudicator.rules_result(board)
+        if outcome is not None:
+            break
+        if len(moves) >= _worker_adjudicator.max_plies:
+            outcome = ('1/2-1/2', 'max plies')
+            break
+
+        engine, config = white if board.current_turn == ChessBoard.WHITE else black
+        move, score = engine.search(board, max_depth=config.max_depth, max_time=config.max_time,
+                                    max_nodes=config.max_nodes)
+        if move is None:
+            outcome = ('1/2-1/2', 'no move')
+            break
+
+        board.make_move(move)
+        moves.append(move_to_notation(move))
+        scores.append(score)
+        outcome = _worker_adjudicator.score_result(scores, board)
+
+    result, reason = outcome
+    if result == '1/2-1/2':
+        points = 0.5
+    else:
+        white_won = result == '1-0'
+        points = 1.0 if white_won == a_is_white else 0.0
+
+    return {
+        'game': game_index,
+        'fen': fen,
+        'a_is_white': a_is_white,
+        'result': result,
+        'reason': reason,
+        'points': points,
+        'plies': len(moves),
+        'moves': moves,
+    }
+
+
+def elo_from_score(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400.0 * math.log10(1.0 / score - 1.0)
+
+
+def score_from_elo(elo: float) -> float:
+    return 1.0 / (1.0 + 10.0 ** (-elo / 400.0))
+
+
+class MatchStats:
+    # Running W/D/L from engine A's point of view, Elo with error bars and SPRT
+
+    def __init__(self, elo0: float = 0.0, elo1: float = 5.0, alpha: float = 0.05, beta: float = 0.05):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower_bound = math.log(beta / (1 - alpha))
+        self.upper_bound = math.log((1 - beta) / alpha)
+
+    def add(self, points: float):
+        if points == 1.0:
+            self.wins += 1
+        elif points == 0.0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def _score_and_variance(self) -> Tuple[float, float]:
+        n = self.games
+        score = (self.wins + 0.5 * self.draws) / n
+        # per-game variance of the trinomial result
+        variance = (self.wins * (1 - score) ** 2 + self.draws * (0.5 - score) ** 2
+                    + self.losses * score ** 2) / n
+        return score, variance
+
+    def elo(self) -> Tuple[float, float]:
+        # (elo, 95% error margin)
+        if self.games == 0:
+            return 0.0, 0.0
+        score, variance = self._score_and_variance()
+        margin = 1.96 * math.sqrt(variance / self.games)
+        low = elo_from_score(score - margin)
+        high = elo_from_score(score + margin)
+        return elo_from_score(score), (high - low) / 2
+
+    def llr(self) -> float:
+        # log likelihood ratio of H1 (elo1) vs H0 (elo0), normal approximation
+        if self.wins == 0 or self.losses == 0 or self.games < 2:
+            return 0.0
+        score, variance = self._score_and_variance()
+        if variance <= 0:
+            return 0.0
+        s0 = score_from_elo(self.elo0)
+        s1 = score_from_elo(self.elo1)
+        return (s1 - s0) * (2 * score - s0 - s1) / (2 * variance / self.games)
+
+    def verdict(self) -> Optional[str]:
+        llr = self.llr()
+        if llr >= self.upper_bound:
+            return 'H1 accepted'
+        if llr <= self.lower_bound:
+            return 'H0 accepted'
+        return None
+
+    def summary(self) -> str:
+        elo, margin = self.elo()
+        return (f"Games {self.games}: +{self.wins} ={self.draws} -{self.losses}  "
+                f"Elo {elo:+.1f} +/- {margin:.1f}  "
+                f"LLR {self.llr():.2f} [{self.lower_bound:.2f}, {self.upper_bound:.2f}]")
+
+
+def game_tasks(openings: List[str], games: int) -> Iterator[Tuple[int, str, bool]]:
+    # each opening twice, A as white then as black, cycling through the suite
+    for game_index in range(games):
+        fen = openings[(game_index // 2) % len(openings)]
+        yield game_index, fen, game_index % 2 == 0
+
+
+def run_match(config_a: EngineConfig, config_b: EngineConfig, games: int = 100,
+              workers: Optional[int] = None, openings: Optional[List[str]] = None,
+              adjudicator: Optional[Adjudicator] = None, stats: Optional[MatchStats] = None,
+              stop_on_verdict: bool = True, on_game=None) -> MatchStats:
+    # play the match, calling on_game(result, stats) after every finished game
+    workers = workers or os.cpu_count() or 1
+    openings = openings or list(DEFAULT_OPENINGS)
+    adjudicator = adjudicator or Adjudicator()
+    stats = stats or MatchStats()
+
+    tasks = game_tasks(openings, games)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(config_a, config_b, adjudicator)) as pool:
+        pending = set()
+        for task in tasks:
+            pending.add(pool.submit(_play_game, task))
+            if len(pending) >= workers * 2:
+                break
+
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                stats.add(result['points'])
+                if on_game is not None:
+                    on_game(result, stats)
+
+            if stop_on_verdict and stats.verdict() is not None:
+                for future in pending:
+                    future.cancel()
+                break
+
+            # keep the pool fed without queueing the whole match up front
+            for task in tasks:
+                pending.add(pool.submit(_play_game, task))
+                if len(pending) >= workers * 2:
+                    break
+
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Play a self-play match between two engine configurations")
+    parser.add_argument('--a', default='name=A', help="engine A, e.g. 'name=new,nodes=20000'")
+    parser.add_argument('--b', default='name=B', help="engine B, e.g. 'name=base,time=0.1'")
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--openings', default=None, help="EPD/FEN file, one opening per line")
+    parser.add_argument('--max-plies', type=int, default=400, help="adjudicate a draw after this many plies")
+    parser.add_argument('--elo0', type=float, default=0.0, help="SPRT H0 Elo")
+    parser.add_argument('--elo1', type=float, default=5.0, help="SPRT H1 Elo")
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--no-sprt-stop', action='store_true', help="play all games even after an SPRT verdict")
+    args = parser.parse_args(argv)
+
+    config_a = EngineConfig.parse(args.a)
+    config_b = EngineConfig.parse(args.b)
+    stats = MatchStats(args.elo0, args.elo1, args.alpha, args.beta)
+
+    print(f"{config_a.name} vs {config_b.name}, {args.games} games, "
+          f"SPRT elo0={args.elo0} elo1={args.elo1} alpha={args.alpha} beta={args.beta}")
+
+    start_time = time.time()
+
+    def report(result, stats):
+        print(f"[{time.time() - start_time:7.0f}s] game {result['game']}: {result['result']} "
+              f"({result['reason']})  {stats.summary()}", flush=True)
+
+    run_match(config_a, config_b, games=args.games, workers=args.workers,
+              openings=read_openings(args.openings),
+              adjudicator=Adjudicator(max_plies=args.max_plies), stats=stats,
+              stop_on_verdict=not args.no_sprt_stop, on_game=report)
+
+    print()
+    print(stats.summary())
+    print(f"SPRT: {stats.verdict() or 'inconclusive'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# Mate solver - depth-first proof-number search (df-pn)
+# proves or disproves "the side to move mates within N moves" without a full
+# width search: it always expands the node that is cheapest to prove or disprove
+#
+#   from mate_search import MateSearch
+#   result = MateSearch().solve(board, max_moves=5)
+#   result['line']  ->  mating line as moves, [] if no mate was proven
+#
+# Numbers are kept as (phi, delta) from the side to move's point of view:
+# phi is what it costs to prove the side to move wins, delta to prove it loses.
+# "Wins" means mates for the attacker and avoids mate for the defender.
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+from chess_board import ChessBoard
+
+INFINITY = 10 ** 9
+
+# Values of decided nodes
+WON = (0, INFINITY)
+LOST = (INFINITY, 0)
+
+# Table entry of a child that isn't in the table (never searched, or evicted)
+UNKNOWN = (1, 1, 0)
+
+
+class MateSearch:
+
+    def __init__(self, tt_size_mb: int = 64):
+        # entries are [phi, delta, plies to mate] keyed by (zobrist key, plies left)
+        # roughly 100 bytes each with the key tuple
+        self.max_entries = (tt_size_mb * 1024 * 1024) // 100
+        self.table = {}
+        self.nodes = 0
+        self.max_nodes = None
+        self.deadline = float('inf')
+        self.stopped = False
+
+        # Optional callable polled with the budget check - returns True to stop early
+        self.stop_check = None
+
+    def solve(self, board: ChessBoard, max_moves: int = 5, max_nodes: Optional[int] = None,
+              max_time: Optional[float] = None) -> Dict:
+        # look for a mate by the side to move in at most max_moves moves
+        # tries mate in 1, 2, ... so the line found is the shortest one
+        # status is 'mate', 'no_mate' (disproven up to max_moves) or 'unknown' (out of budget)
+        start_time = time.time()
+        self.nodes = 0
+        self.max_nodes = max_nodes
+        self.deadline = start_time + max_time if max_time is not None else float('inf')
+        self.stopped = False
+
+        status = 'no_mate'
+        line = []
+        mate_in = None
+        for moves in range(1, max_moves + 1):
+            plies = 2 * moves - 1
+            phi, delta = self._search_root(board, plies)
+            if phi == 0:
+                status = 'mate'
+                mate_in = moves
+                line = self._extract_line(board, plies)
+                break
+            if delta != 0:
+                status = 'unknown'
+                break
+
+        return {
+            'status': status,
+            'mate_in': mate_in,
+            'line': line,
+            'nodes': self.nodes,
+            'time': time.time() - start_time,
+        }
+
+    def clear(self):
+        self.table.clear()
+
+    def _search_root(self, board: ChessBoard, plies: int) -> Tuple[int, int]:
+        # one call with infinite thresholds runs until the root is decided or the budget is gone
+        self._mid(board, plies, INFINITY, INFINITY)
+        entry = self.table.get((board.zobrist_key, plies))
+        return (entry[0], entry[1]) if entry else (1, 1)
+
+    def _out_of_budget(self) -> bool:
+        if self.stopped:
+            return True
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            self.stopped = True
+        elif self.nodes & 1023 == 0 and time.time() >= self.deadline:
+            self.stopped = True
+        elif self.stop_check is not None and self.nodes & 1023 == 0 and self.stop_check():
+            self.stopped = True
+        return self.stopped
+
+    def _store(self, key: Tuple[int, int], phi: int, delta: int, distance: int):
+        self.table[key] = [phi, delta, distance]
+        # Limit table size - drop the oldest entry like TranspositionTable does
+        if len(self.table) > self.max_entries:
+            self.table.pop(next(iter(self.table)))
+
+    def _mid(self, board: ChessBoard, plies: int, phi_limit: int, delta_limit: int):
+        # expand board until its phi or delta reaches the limit, storing the result
+        self.nodes += 1
+        key = (board.zobrist_key, plies)
+
+        # the attacker moves on odd plies left, the defender on even ones
+        attacker_to_move = plies % 2 == 1
+        turn = board.current_turn
+        moves = board.generate_moves(turn)
+
+        if not moves:
+            # mate is a win for the attacker, stalemate a win for the defender
+            if attacker_to_move or board.in_check(turn):
+                self._store(key, *LOST, 0)
+            else:
+                self._store(key, *WON, 0)
+            return
+        if plies == 0:
+            # defender to move and not mated - out of moves for the attacker
+            self._store(key, *WON, 0)
+            return
+
+        children = []
+        for move in moves:
+            child = board.copy()
+            child.make_move(move)
+            # Draws end the search for the attacker. They depend on the path, so
+            # they're kept out of the table (the usual graph-history caveat applies)
+            if (child.is_fifty_move_draw() or child.is_repetition()
+                    or child.has_insufficient_material()):
+                fixed = WON if attacker_to_move else LOST
+            else:
+                fixed = None
+            children.append((child, fixed))
+
+        child_key_plies = plies - 1
+        table = self.table
+        while True:
+            # phi = min child delta, delta = sum of child phi
+            best_index = -1
+            best_delta = second_delta = INFINITY
+            best_phi = INFINITY
+            phi_sum = 0
+            for index, (child, fixed) in enumerate(children):
+                if fixed is not None:
+                    child_phi, child_delta = fixed
+                else:
+                    entry = table.get((child.zobrist_key, child_key_plies), UNKNOWN)
+                    child_phi, child_delta = entry[0], entry[1]
+                phi_sum += child_phi
+                if child_delta < best_delta:
+                    second_delta = best_delta
+                    best_delta = child_delta
+                    best_phi = child_phi
+                    best_index = index
+                elif child_delta < second_delta:
+                    second_delta = child_delta
+            phi = best_delta
+            delta = min(phi_sum, INFINITY)
+
+            if phi >= phi_limit or delta >= delta_limit or self._out_of_budget():
+                break
+
+            child, fixed = children[best_index]
+            if fixed is not None:
+                break  # only decided children left to pick from
+            self._mid(child, child_key_plies,
+                      delta_limit - delta + best_phi,
+                      min(phi_limit, second_delta + 1))
+
+        # plies to mate for proven nodes, used to pick the line afterwards
+        # attacker: fastest mating move, defender: longest defence
+        distance = 0
+        if attacker_to_move and phi == 0:
+            distance = 1 + min(entry[2] for entry in self._child_entries(children, child_key_plies)
+                               if entry[1] == 0)
+        elif not attacker_to_move and delta == 0:
+            distance = 1 + max(entry[2] for entry in self._child_entries(children, child_key_plies))
+        self._store(key, phi, delta, distance)
+
+    def _child_entries(self, children, plies: int):
+        # table entries of the undecided-by-rule children
+        # an evicted child is unknown (1, 1) like one never searched - never proven
+        for child, fixed in children:
+            if fixed is None:
+                yield self.table.get((child.zobrist_key, plies), UNKNOWN)
+
+    def _extract_line(self, board: ChessBoard, plies: int) -> List[int]:
+        # attacker takes the fastest proven mate, defender the longest resistance
+        line = []
+        current = board.copy()
+        while plies > 0:
+            attacker_to_move = plies % 2 == 1
+            best_move = 0
+            best_distance = None
+            for move in current.generate_moves(current.current_turn):
+                child = current.copy()
+                child.make_move(move)
+                entry = self.table.get((child.zobrist_key, plies - 1))
+                if entry is None:
+                    continue
+                if attacker_to_move:
+                    # proven children are lost for the defender to move
+                    if entry[1] != 0:
+                        continue
+                    if best_distance is None or entry[2] < best_distance:
+                        best_move, best_distance = move, entry[2]
+                elif best_distance is None or entry[2] > best_distance:
+                    best_move, best_distance = move, entry[2]
+            if not best_move:
+                break
+            line.append(best_move)
+            current.make_move(best_move)
+            plies -= 1
+        return line
@@ -0,0 +1,280 @@
+# NNUE-style evaluator - a small neural network with an incrementally updated first layer
+# needs numpy; the engine keeps using the hand-written Evaluator without it
+#
+# Input: HalfKP features per side, (own king square, piece, square) for every
+# piece except the kings - 64 * 10 * 64 = 40960 inputs, about 30 of them active.
+# The first layer is just the sum of the weight rows of the active features
+# (the "accumulator"), so make_move only adds/subtracts the rows of the few
+# pieces that moved. Only a king move means summing everything again for that side.
+#
+# The rest is a small quantized dense head:
+#   clip(acc_us), clip(acc_them) -> L1 -> clip -> L2 -> clip -> 1
+#
+#   engine = ChessEngine(evaluator=NNUEEvaluator.load('net.nnue'))
+#
+# nnue_train.py trains a network and writes the file
+
+import struct
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional - only this evaluator needs it
+    np = None
+
+from chess_board import (ChessBoard, COLOR_SHIFT, TYPE_MASK, FLAG_MASK, EN_PASSANT,
+                         KING_CASTLE, QUEEN_CASTLE)
+from evaluation import Evaluator
+
+MAGIC = b'CHESSNN1'
+VERSION = 1
+HEADER_FORMAT = '<8sIIIII'  # magic, version, features, hidden, l1, l2
+
+# 10 piece kinds (5 types x own/their) on 64 squares, for each of 64 king squares
+PIECE_KINDS = 10
+FEATURES = 64 * PIECE_KINDS * 64
+
+DEFAULT_HIDDEN = 128
+DEFAULT_L1 = 32
+DEFAULT_L2 = 32
+
+# Quantization: activations are 0..ACTIVATION_MAX for the float range 0..1,
+# head weights are int8 with WEIGHT_SCALE steps per 1.0
+ACTIVATION_MAX = 127
+WEIGHT_SHIFT = 6
+WEIGHT_SCALE = 1 << WEIGHT_SHIFT
+# network output 1.0 = this many centipawns
+OUTPUT_SCALE = 400
+
+MATE_SCORE = 100000
+
+
+def _piece_kind_table() -> Tuple:
+    # PIECE_KIND[perspective][code] = 0..9, or -1 for empty squares and kings
+    table = ([-1] * 16, [-1] * 16)
+    for perspective in (ChessBoard.WHITE, ChessBoard.BLACK):
+        for color in (ChessBoard.WHITE, ChessBoard.BLACK):
+            for piece_type in range(ChessBoard.PAWN, ChessBoard.KING):
+                code = piece_type | color << COLOR_SHIFT
+                table[perspective][code] = (piece_type - 1) * 2 + (color != perspective)
+    return table
+
+
+PIECE_KIND = _piece_kind_table()
+
+
+def feature_index(perspective: int, king_square: int, code: int, square: int) -> int:
+    # black sees the board flipped vertically, so both sides share the weights
+    if perspective == ChessBoard.BLACK:
+        king_square ^= 56
+        square ^= 56
+    return (king_square * PIECE_KINDS + PIECE_KIND[perspective][code]) * 64 + square
+
+
+def active_features(board: ChessBoard, perspective: int) -> List[int]:
+    # indices of every non-king piece as seen from one side
+    king_square = board.white_king_square if perspective == ChessBoard.WHITE else board.black_king_square
+    kinds = PIECE_KIND[perspective]
+    return [feature_index(perspective, king_square, code, square)
+            for code, squares in enumerate(board.piece_squares) if kinds[code] >= 0
+            for square in squares]
+
+
+class NNUENetwork:
+    # Quantized weights, as stored in the file
+    #   feature_weights int16 [features, hidden], feature_bias int16 [hidden]
+    #   l1 int8 [2 * hidden, l1], l2 int8 [l1, l2], output int8 [l2], biases int32
+
+    def __init__(self, feature_weights, feature_bias, l1_weights, l1_bias,
+                 l2_weights, l2_bias, output_weights, output_bias):
+        if np is None:
+            raise ImportError("the NNUE evaluator needs numpy")
+        self.hidden = feature_bias.shape[0]
+        self.feature_weights = feature_weights.astype(np.int16)
+        self.feature_bias = feature_bias.astype(np.int16)
+        # head weights live as int8 in the file, int32 here so the matmuls don't overflow
+        self.l1_weights = l1_weights.astype(np.int32)
+        self.l1_bias = l1_bias.astype(np.int32)
+        self.l2_weights = l2_weights.astype(np.int32)
+        self.l2_bias = l2_bias.astype(np.int32)
+        self.output_weights = output_weights.astype(np.int32)
+        self.output_bias = int(output_bias)
+
+    @classmethod
+    def from_float(cls, feature_weights, feature_bias, l1_weights, l1_bias,
+                   l2_weights, l2_bias, output_weights, output_bias) -> 'NNUENetwork':
+        # quantize a float network (as trained by nnue_train.py)
+        activation_weight = ACTIVATION_MAX * WEIGHT_SCALE
+
+        def to_int(values, scale, dtype):
+            info = np.iinfo(dtype)
+            return np.clip(np.round(values * scale), info.min, info.max).astype(dtype)
+
+        return cls(to_int(feature_weights, ACTIVATION_MAX, np.int16),
+                   to_int(feature_bias, ACTIVATION_MAX, np.int16),
+                   to_int(l1_weights, WEIGHT_SCALE, np.int8), to_int(l1_bias, activation_weight, np.int32),
+                   to_int(l2_weights, WEIGHT_SCALE, np.int8), to_int(l2_bias, activation_weight, np.int32),
+                   to_int(output_weights, WEIGHT_SCALE, np.int8),
+                   to_int(np.asarray(output_bias), activation_weight, np.int32))
+
+    @classmethod
+    def random(cls, hidden: int = DEFAULT_HIDDEN, seed: int = 0) -> 'NNUENetwork':
+        # untrained network - for benchmarks and as a training starting point
+        if np is None:
+            raise ImportError("the NNUE evaluator needs numpy")
+        rng = np.random.default_rng(seed)
+        return cls.from_float(rng.normal(0, 0.05, (FEATURES, hidden)), np.full(hidden, 0.5),
+                              rng.normal(0, 0.1, (2 * hidden, DEFAULT_L1)), np.zeros(DEFAULT_L1),
+                              rng.normal(0, 0.2, (DEFAULT_L1, DEFAULT_L2)), np.zeros(DEFAULT_L2),
+                              rng.normal(0, 0.2, DEFAULT_L2), 0.0)
+
+    @classmethod
+    def load(cls, path: str) -> 'NNUENetwork':
+        if np is None:
+            raise ImportError("the NNUE evaluator needs numpy")
+        with open(path, 'rb') as f:
+            header = f.read(struct.calcsize(HEADER_FORMAT))
+            if len(header) < struct.calcsize(HEADER_FORMAT):
+                raise ValueError(f"{path} is not an NNUE network")
+            magic, version, features, hidden, l1, l2 = struct.unpack(HEADER_FORMAT, header)
+            if magic != MAGIC or version != VERSION or features != FEATURES:
+                raise ValueError(f"{path} is not a version {VERSION} NNUE network")
+
+            def read(dtype, count):
+                values = np.fromfile(f, dtype=np.dtype(dtype).newbyteorder('<'), count=count)
+                if values.size != count:
+                    raise ValueError(f"{path} is truncated")
+                return values
+
+            feature_weights = read(np.int16, features * hidden).reshape(features, hidden)
+            feature_bias = read(np.int16, hidden)
+            l1_weights = read(np.int8, 2 * hidden * l1).reshape(2 * hidden, l1)
+            l1_bias = read(np.int32, l1)
+            l2_weights = read(np.int8, l1 * l2).reshape(l1, l2)
+            l2_bias = read(np.int32, l2)
+            output_weights = read(np.int8, l2)
+            output_bias = read(np.int32, 1)[0]
+
+        return cls(feature_weights, feature_bias, l1_weights, l1_bias,
+                   l2_weights, l2_bias, output_weights, output_bias)
+
+    def save(self, path: str):
+        l1, l2 = self.l2_weights.shape
+        with open(path, 'wb') as f:
+            f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, FEATURES, self.hidden, l1, l2))
+            for values, dtype in ((self.feature_weights, '<i2'), (self.feature_bias, '<i2'),
+                                  (self.l1_weights, 'i1'), (self.l1_bias, '<i4'),
+                                  (self.l2_weights, 'i1'), (self.l2_bias, '<i4'),
+                                  (self.output_weights, 'i1'),
+                                  (np.array([self.output_bias]), '<i4')):
+                f.write(values.astype(dtype).tobytes())
+
+    def refresh(self, board: ChessBoard, perspective: int):
+        # accumulator of one side from scratch
+        features = active_features(board, perspective)
+        return self.feature_bias + self.feature_weights[features].sum(axis=0, dtype=np.int32)
+
+    def new_accumulator(self, board: ChessBoard) -> 'NNUEAccumulator':
+        return NNUEAccumulator(self, self.refresh(board, ChessBoard.WHITE),
+                               self.refresh(board, ChessBoard.BLACK))
+
+    def forward(self, us, them) -> int:
+        # head on the two accumulators, side to move first - centipawns for the side to move
+        x = np.concatenate((us, them)).clip(0, ACTIVATION_MAX)
+        x = ((x @ self.l1_weights + self.l1_bias) >> WEIGHT_SHIFT).clip(0, ACTIVATION_MAX)
+        x = ((x @ self.l2_weights + self.l2_bias) >> WEIGHT_SHIFT).clip(0, ACTIVATION_MAX)
+        output = int(x @ self.output_weights) + self.output_bias
+        return output * OUTPUT_SCALE // (ACTIVATION_MAX * WEIGHT_SCALE)
+
+
+class NNUEAccumulator:
+    # First layer output for both sides - never changed in place, so board
+    # copies made for the search can share it and the parent stays valid
+
+    __slots__ = ('network', 'white', 'black')
+
+    def __init__(self, network: NNUENetwork, white, black):
+        self.network = network
+        self.white = white
+        self.black = black
+
+    def updated(self, board: ChessBoard, move: int, moving_piece: int, placed_piece: int,
+                captured_piece: int) -> 'NNUEAccumulator':
+        # called by make_move with the board already in the new position
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        flags = move & FLAG_MASK
+        removed = []
+        added = []
+
+        king_moved = (moving_piece & TYPE_MASK) == ChessBoard.KING
+        if not king_moved:
+            removed.append((moving_piece, from_square))
+            added.append((placed_piece, to_square))
+        elif flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rook_from, rook_to = (to_square + 1, to_square - 1) if flags == KING_CASTLE \
+                else (to_square - 2, to_square + 1)
+            rook = board.squares[rook_to]
+            removed.append((rook, rook_from))
+            added.append((rook, rook_to))
+
+        if captured_piece:
+            capture_square = to_square
+            if flags == EN_PASSANT:
+                capture_square += 8 if moving_piece >> COLOR_SHIFT == ChessBoard.WHITE else -8
+            removed.append((captured_piece, capture_square))
+
+        network = self.network
+        mover = moving_piece >> COLOR_SHIFT
+        sides = []
+        for perspective, values in ((ChessBoard.WHITE, self.white), (ChessBoard.BLACK, self.black)):
+            if king_moved and perspective == mover:
+                # every feature of this side depends on its king square
+                sides.append(network.refresh(board, perspective))
+                continue
+            king_square = board.white_king_square if perspective == ChessBoard.WHITE \
+                else board.black_king_square
+            weights = network.feature_weights
+            for code, square in removed:
+                values = values - weights[feature_index(perspective, king_square, code, square)]
+            for code, square in added:
+                values = values + weights[feature_index(perspective, king_square, code, square)]
+            sides.append(values)
+
+        return NNUEAccumulator(network, sides[0], sides[1])
+
+
+class NNUEEvaluator(Evaluator):
+    # Drop-in for Evaluator - same move ordering, network for the score
+
+    def __init__(self, network: NNUENetwork):
+        super().__init__()
+        self.network = network
+
+    @classmethod
+    def load(cls, path: str) -> 'NNUEEvaluator':
+        return cls(NNUENetwork.load(path))
+
+    def prepare(self, board: ChessBoard):
+        # give the root an accumulator - copies and make_move carry it from there
+        accumulator = board.accumulator
+        if accumulator is None or accumulator.network is not self.network:
+            board.accumulator = self.network.new_accumulator(board)
+
+    def evaluate(self, board: ChessBoard, alpha: Optional[int] = None, beta: Optional[int] = None) -> int:
+        # positive = white better, like Evaluator.evaluate
+        # the window is ignored - the network output is one term, there's nothing to skip
+        turn = board.current_turn
+        if not board.generate_moves(turn):
+            if board.in_check(turn):
+                return -MATE_SCORE if turn == ChessBoard.WHITE else MATE_SCORE
+            return 0
+
+        accumulator = board.accumulator
+        if accumulator is None or accumulator.network is not self.network:
+            self.prepare(board)
+            accumulator = board.accumulator
+
+        if turn == ChessBoard.WHITE:
+            return self.network.forward(accumulator.white, accumulator.black)
+        return -self.network.forward(accumulator.black, accumulator.white)
@@ -0,0 +1,307 @@
+# Train the NNUE evaluator (nnue.py) on engine-scored positions
+# positions come from self-play games and/or batch_analysis.py output,
+# the network learns the search score and is written as a quantized .nnue file
+#
+#   python nnue_train.py -o net.nnue --selfplay 500 --nodes 2000 --save-data selfplay.jsonl
+#   python nnue_train.py -o net.nnue --data selfplay.jsonl --data results.jsonl --epochs 20
+#   python nnue_train.py -o net.nnue --selfplay 500 --save-data selfplay.pos   # packed, see packed_positions.py
+#
+# needs numpy
+
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from chess_board import ChessBoard
+from chess_engine import ChessEngine
+from match import DEFAULT_OPENINGS, Adjudicator
+from nnue import (FEATURES, DEFAULT_HIDDEN, DEFAULT_L1, DEFAULT_L2,
+                  WEIGHT_SCALE, OUTPUT_SCALE, NNUENetwork, active_features)
+from packed_positions import PositionReader, PositionWriter
+
+# At most 30 pieces besides the kings; shorter lists are padded with this index
+# (an extra all-zero weight row that is never trained)
+MAX_ACTIVE = 32
+PAD_FEATURE = FEATURES
+
+# Mate scores say nothing useful about the position value
+MAX_TRAIN_SCORE = 3000
+
+
+# Data
+
+# Files ending in this are read and written as packed positions instead of JSONL
+PACKED_SUFFIX = '.pos'
+
+
+def read_data(path: str) -> Iterator[Dict]:
+    # JSONL records with 'fen' and 'score' (side to move), e.g. batch_analysis.py output
+    # packed files give the board itself instead of a FEN
+    if path.endswith(PACKED_SUFFIX):
+        for board, score, _ in PositionReader(path).positions():
+            yield {'board': board, 'score': score}
+        return
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+_worker_engine: Optional[ChessEngine] = None
+
+
+def _init_worker(tt_size_mb: int):
+    global _worker_engine
+    _worker_engine = ChessEngine(tt_size_mb=tt_size_mb)
+
+
+def _selfplay_game(task: Tuple[int, int, int, int]) -> List[Dict]:
+    # one game from a built-in opening plus a few random plies, every quiet position recorded
+    game_index, nodes, random_plies, max_plies = task
+    rng = random.Random(game_index)
+    board = ChessBoard.from_fen(DEFAULT_OPENINGS[game_index % len(DEFAULT_OPENINGS)])
+    adjudicator = Adjudicator(max_plies=max_plies)
+    _worker_engine.clear_transposition_table()
+
+    records = []
+    for ply in range(max_plies):
+        if adjudicator.rules_result(board) is not None:
+            break
+        if ply < random_plies:
+            board.make_move(rng.choice(board.generate_moves(board.current_turn)))
+            continue
+
+        move, score = _worker_engine.search(board, max_depth=64, max_time=float('inf'), max_nodes=nodes)
+        if move is None:
+            break
+        # positions in check are never evaluated statically by the search
+        if not board.in_check(board.current_turn) and abs(score) < MAX_TRAIN_SCORE:
+            records.append({'fen': board.to_fen(), 'score': score})
+        board.make_move(move)
+    return records
+
+
+def generate_selfplay(games: int, nodes: int = 2000, random_plies: int = 6, max_plies: int = 200,
+                      workers: Optional[int] = None, tt_size_mb: int = 16) -> Iterator[Dict]:
+    # self-play positions scored by the normal engine, games spread over all cores
+    workers = workers or os.cpu_count() or 1
+    tasks = [(game_index, nodes, random_plies, max_plies) for game_index in range(games)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(tt_size_mb,)) as pool:
+        for records in pool.map(_selfplay_game, tasks):
+            yield from records
+
+
+def encode_positions(records) -> Tuple:
+    # (features_us, features_them, targets) - features as padded index arrays, side to move first
+    features_us = []
+    features_them = []
+    targets = []
+    for record in records:
+        score = record.get('score')
+        if score is None or abs(score) >= MAX_TRAIN_SCORE:
+            continue
+        board = record['board'] if 'board' in record else ChessBoard.from_fen(record['fen'])
+        us = board.current_turn
+        for perspective, out in ((us, features_us), (1 - us, features_them)):
+            features = active_features(board, perspective)
+            out.append(features + [PAD_FEATURE] * (MAX_ACTIVE - len(features)))
+        targets.append(score)
+    return (np.array(features_us, dtype=np.int32).reshape(-1, MAX_ACTIVE),
+            np.array(features_them, dtype=np.int32).reshape(-1, MAX_ACTIVE),
+            np.array(targets, dtype=np.float32))
+
+
+# Training
+
+class Adam:
+    # plain Adam; sparse rows for the feature weights (only the rows a batch touched)
+
+    def __init__(self, params: Dict, lr: float, beta1: float = 0.9, beta2: float = 0.999,
+                 eps: float = 1e-8):
+        self.params = params
+        self.lr = lr
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+        self.m = {name: np.zeros_like(value) for name, value in params.items()}
+        self.v = {name: np.zeros_like(value) for name, value in params.items()}
+        self.steps = 0
+
+    def step(self, grads: Dict, rows: Optional[Dict] = None):
+        self.steps += 1
+        correction = math.sqrt(1 - self.beta2 ** self.steps) / (1 - self.beta1 ** self.steps)
+        for name, grad in grads.items():
+            index = rows[name] if rows and name in rows else slice(None)
+            m = self.m[name]
+            v = self.v[name]
+            m[index] = self.beta1 * m[index] + (1 - self.beta1) * grad
+            v[index] = self.beta2 * v[index] + (1 - self.beta2) * grad * grad
+            self.params[name][index] -= self.lr * correction * m[index] / (np.sqrt(v[index]) + self.eps)
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class NNUETrainer:
+    # Float version of the network in nnue.py, trained on sigmoid(score / OUTPUT_SCALE)
+
+    def __init__(self, hidden: int = DEFAULT_HIDDEN, lr: float = 1e-3, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.params = {
+            'feature_weights': rng.normal(0, 0.05, (FEATURES + 1, hidden)).astype(np.float32),
+            'feature_bias': np.full(hidden, 0.5, dtype=np.float32),
+            'l1_weights': rng.normal(0, math.sqrt(2 / (2 * hidden)), (2 * hidden, DEFAULT_L1)).astype(np.float32),
+            'l1_bias': np.zeros(DEFAULT_L1, dtype=np.float32),
+            'l2_weights': rng.normal(0, math.sqrt(2 / DEFAULT_L1), (DEFAULT_L1, DEFAULT_L2)).astype(np.float32),
+            'l2_bias': np.zeros(DEFAULT_L2, dtype=np.float32),
+            'output_weights': rng.normal(0, math.sqrt(1 / DEFAULT_L2), DEFAULT_L2).astype(np.float32),
+            'output_bias': np.zeros(1, dtype=np.float32),
+        }
+        self.params['feature_weights'][PAD_FEATURE] = 0
+        self.optimizer = Adam(self.params, lr)
+        # the head is stored as int8, so keep its weights inside what int8 can hold
+        self.weight_limit = 127 / WEIGHT_SCALE
+
+    def _forward(self, features_us, features_them):
+        p = self.params
+        acc_us = p['feature_weights'][features_us].sum(axis=1) + p['feature_bias']
+        acc_them = p['feature_weights'][features_them].sum(axis=1) + p['feature_bias']
+        acc = np.concatenate((acc_us, acc_them), axis=1)
+        x = acc.clip(0, 1)
+        z1 = x @ p['l1_weights'] + p['l1_bias']
+        h1 = z1.clip(0, 1)
+        z2 = h1 @ p['l2_weights'] + p['l2_bias']
+        h2 = z2.clip(0, 1)
+        out = h2 @ p['output_weights'] + p['output_bias']
+        return out, (acc, x, z1, h1, z2, h2)
+
+    def loss(self, features_us, features_them, targets) -> float:
+        out, _ = self._forward(features_us, features_them)
+        return float(np.mean((_sigmoid(out) - _sigmoid(targets / OUTPUT_SCALE)) ** 2))
+
+    def train_batch(self, features_us, features_them, targets) -> float:
+        p = self.params
+        out, (acc, x, z1, h1, z2, h2) = self._forward(features_us, features_them)
+        prediction = _sigmoid(out)
+        error = prediction - _sigmoid(targets / OUTPUT_SCALE)
+
+        # backward - clipped units pass the gradient only inside (0, 1)
+        d_out = 2 * error * prediction * (1 - prediction) / len(targets)
+        grads = {'output_weights': h2.T @ d_out, 'output_bias': np.array([d_out.sum()])}
+        d_z2 = np.outer(d_out, p['output_weights']) * ((z2 > 0) & (z2 < 1))
+        grads['l2_weights'] = h1.T @ d_z2
+        grads['l2_bias'] = d_z2.sum(axis=0)
+        d_z1 = (d_z2 @ p['l2_weights'].T) * ((z1 > 0) & (z1 < 1))
+        grads['l1_weights'] = x.T @ d_z1
+        grads['l1_bias'] = d_z1.sum(axis=0)
+        d_acc = (d_z1 @ p['l1_weights'].T) * ((acc > 0) & (acc < 1))
+        hidden = p['feature_bias'].shape[0]
+        d_us, d_them = d_acc[:, :hidden], d_acc[:, hidden:]
+        grads['feature_bias'] = d_us.sum(axis=0) + d_them.sum(axis=0)
+
+        # sparse gradient: only the rows of features that appear in this batch
+        indices = np.concatenate((features_us, features_them)).ravel()
+        rows, inverse = np.unique(indices, return_inverse=True)
+        feature_grad = np.zeros((len(rows), hidden), dtype=np.float32)
+        np.add.at(feature_grad, inverse.ravel(), np.repeat(np.concatenate((d_us, d_them)), MAX_ACTIVE, axis=0))
+        feature_grad[rows == PAD_FEATURE] = 0
+        grads['feature_weights'] = feature_grad
+
+        self.optimizer.step(grads, rows={'feature_weights': rows})
+        for name in ('l1_weights', 'l2_weights', 'output_weights'):
+            np.clip(p[name], -self.weight_limit, self.weight_limit, out=p[name])
+        return float(np.mean(error ** 2))
+
+    def to_network(self) -> NNUENetwork:
+        p = self.params
+        return NNUENetwork.from_float(p['feature_weights'][:FEATURES], p['feature_bias'],
+                                      p['l1_weights'], p['l1_bias'], p['l2_weights'], p['l2_bias'],
+                                      p['output_weights'], p['output_bias'][0])
+
+
+def train(features_us, features_them, targets, hidden: int = DEFAULT_HIDDEN, epochs: int = 10,
+          batch_size: int = 1024, lr: float = 1e-3, validation: float = 0.05, seed: int = 0) -> NNUENetwork:
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(targets))
+    validation_count = int(len(targets) * validation)
+    validation_rows, train_rows = order[:validation_count], order[validation_count:]
+
+    trainer = NNUETrainer(hidden=hidden, lr=lr, seed=seed)
+    for epoch in range(1, epochs + 1):
+        start_time = time.time()
+        rng.shuffle(train_rows)
+        losses = []
+        for start in range(0, len(train_rows), batch_size):
+            batch = train_rows[start:start + batch_size]
+            losses.append(trainer.train_batch(features_us[batch], features_them[batch], targets[batch]))
+
+        report = f"epoch {epoch}: train loss {np.mean(losses):.6f}"
+        if validation_count:
+            validation_loss = trainer.loss(features_us[validation_rows], features_them[validation_rows],
+                                           targets[validation_rows])
+            report += f", validation loss {validation_loss:.6f}"
+        print(f"{report} ({time.time() - start_time:.1f}s)", file=sys.stderr)
+
+    return trainer.to_network()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Train the NNUE evaluator on engine-scored positions")
+    parser.add_argument('-o', '--output', required=True, help="network file to write")
+    parser.add_argument('--data', action='append', default=[],
+                        help="JSONL with fen/score or a packed .pos file (repeatable)")
+    parser.add_argument('--selfplay', type=int, default=0, help="play this many self-play games for data")
+    parser.add_argument('--nodes', type=int, default=2000, help="nodes per self-play move")
+    parser.add_argument('--random-plies', type=int, default=6, help="random plies after each opening")
+    parser.add_argument('--save-data', default=None, help="also write the self-play positions here")
+    parser.add_argument('--workers', type=int, default=None, help="self-play processes (default: all cores)")
+    parser.add_argument('--hidden', type=int, default=DEFAULT_HIDDEN, help="accumulator size per side")
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    args = parser.parse_args(argv)
+
+    records = []
+    for path in args.data:
+        records.extend(read_data(path))
+
+    if args.selfplay:
+        start_time = time.time()
+        selfplay = list(generate_selfplay(args.selfplay, nodes=args.nodes,
+                                          random_plies=args.random_plies, workers=args.workers))
+        print(f"Self-play: {len(selfplay):,} positions from {args.selfplay} games "
+              f"in {time.time() - start_time:.1f}s", file=sys.stderr)
+        if args.save_data and args.save_data.endswith(PACKED_SUFFIX):
+            with PositionWriter(args.save_data) as writer:
+                for record in selfplay:
+                    writer.write(ChessBoard.from_fen(record['fen']), record['score'])
+        elif args.save_data:
+            with open(args.save_data, 'w') as f:
+                for record in selfplay:
+                    f.write(json.dumps(record) + '\n')
+        records.extend(selfplay)
+
+    features_us, features_them, targets = encode_positions(records)
+    if not len(targets):
+        parser.error("no training positions (use --data or --selfplay)")
+    print(f"Training on {len(targets):,} positions", file=sys.stderr)
+
+    network = train(features_us, features_them, targets, hidden=args.hidden, epochs=args.epochs,
+                    batch_size=args.batch_size, lr=args.lr)
+    network.save(args.output)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# Packed positions - fixed-width binary records for training and tuning data
+# much smaller than FEN text and read back without any parsing
+#
+#   with PositionWriter('selfplay.pos') as writer:
+#       writer.write(board, score=35, result=WHITE_WIN)
+#
+#   reader = PositionReader('selfplay.pos')      # memory-mapped, needs numpy
+#   for batch in reader.batches(4096):           # zero-copy views of the file
+#       squares = batch_squares(batch)           # (n, 64) piece codes
+#       scores = batch['score']
+#   board = reader.board(17)
+#
+#   python packed_positions.py results.jsonl selfplay.jsonl -o data.pos
+#
+# Record layout, 32 bytes little-endian:
+#   occupancy   u64     bit i set = a piece on square i (ChessBoard square order)
+#   pieces      16 x u8 piece codes of the occupied squares in square order, 4 bits
+#                       each, low nibble first (at most 32 pieces)
+#   flags       u8      bit 0 side to move, bits 1-4 castling rights
+#   en_passant  u8      en passant square, 255 for none
+#   halfmove    u8      halfmove clock
+#   fullmove    u16     fullmove number
+#   score       i16     centipawns for the side to move, NO_SCORE if unknown
+#   result      i8      game result for white: 1, 0, -1, NO_RESULT if unknown
+
+import argparse
+import json
+import os
+import struct
+import sys
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional - only the reader needs it
+    np = None
+
+from chess_board import ChessBoard, COLOR_SHIFT, NO_SQUARES, ZOBRIST
+
+MAGIC = b'CHESSPOS'
+VERSION = 1
+HEADER_FORMAT = '<8sII'  # magic, version, record size
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+RECORD = struct.Struct('<Q16sBBBHhb')
+RECORD_SIZE = RECORD.size
+
+NO_EN_PASSANT = 255
+NO_SCORE = -32768
+MAX_SCORE = 32767
+
+WHITE_WIN = 1
+DRAW = 0
+BLACK_WIN = -1
+NO_RESULT = -128
+
+# Results as written in PGN / EPD / batch_analysis-style JSONL
+RESULT_NAMES = {'1-0': WHITE_WIN, '1/2-1/2': DRAW, '0-1': BLACK_WIN}
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([('occupancy', '<u8'), ('pieces', 'u1', 16), ('flags', 'u1'),
+                             ('en_passant', 'u1'), ('halfmove', 'u1'), ('fullmove', '<u2'),
+                             ('score', '<i2'), ('result', 'i1')])
+    assert RECORD_DTYPE.itemsize == RECORD_SIZE
+
+
+# Single records
+
+def pack_position(board: ChessBoard, score: Optional[int] = None, result: int = NO_RESULT) -> bytes:
+    if board.halfmove_clock > 255 or not 0 < board.fullmove_number <= 0xFFFF:
+        raise ValueError("move clocks out of range for a packed position")
+
+    occupancy = 0
+    nibbles = []
+    for square, code in enumerate(board.squares):
+        if code:
+            occupancy |= 1 << square
+            nibbles.append(code)
+    if len(nibbles) > 32:
+        raise ValueError("more than 32 pieces can't be packed")
+    nibbles.extend([0] * (32 - len(nibbles)))
+    pieces = bytes(nibbles[i] | nibbles[i + 1] << 4 for i in range(0, 32, 2))
+
+    flags = board.current_turn | board.castling << 1
+    en_passant = board.en_passant_square if board.en_passant_square >= 0 else NO_EN_PASSANT
+    if score is None:
+        score = NO_SCORE
+    else:
+        score = max(-MAX_SCORE, min(MAX_SCORE, score))
+    return RECORD.pack(occupancy, pieces, flags, en_passant, board.halfmove_clock,
+                       board.fullmove_number, score, result)
+
+
+def unpack_position(data: bytes) -> Tuple[ChessBoard, Optional[int], int]:
+    # (board, score or None, result)
+    occupancy, pieces, flags, en_passant, halfmove, fullmove, score, result = RECORD.unpack(data)
+
+    nibbles = []
+    for byte in pieces:
+        nibbles.append(byte & 15)
+        nibbles.append(byte >> 4)
+
+    # built field by field like ChessBoard.copy, no starting position to clear first
+    board = ChessBoard.__new__(ChessBoard)
+    board.squares = squares = bytearray(64)
+    board.piece_squares = piece_squares = [NO_SQUARES] * 16
+    board.white_king_square = 60  # where ChessBoard() has them, for positions without kings
+    board.black_king_square = 4
+    piece_index = 0
+    while occupancy:
+        low_bit = occupancy & -occupancy
+        square = low_bit.bit_length() - 1
+        code = nibbles[piece_index]
+        squares[square] = code
+        piece_squares[code] |= {square}
+        if code == ChessBoard.KING:
+            board.white_king_square = square
+        elif code == ChessBoard.KING | ChessBoard.BLACK << COLOR_SHIFT:
+            board.black_king_square = square
+        piece_index += 1
+        occupancy ^= low_bit
+
+    board.current_turn = flags & 1
+    board.castling = flags >> 1 & 15
+    board.en_passant_square = -1 if en_passant == NO_EN_PASSANT else en_passant
+    board.move_history = []
+    board.halfmove_clock = halfmove
+    board.fullmove_number = fullmove
+    board.zobrist_key = ZOBRIST.hash_position(board)
+    board.key_stack = None
+    board.accumulator = None
+    board.position_score = None
+    board.attacks = None
+    return board, (None if score == NO_SCORE else score), result
+
+
+# Files
+
+class PositionWriter:
+    # Appends packed records to a file, writing the header when it's new
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        new_file = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        if not new_file:
+            _check_header(path)
+        self.file = open(path, 'ab' if append else 'wb')
+        if new_file:
+            self.file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, RECORD_SIZE))
+        self.count = 0
+
+    def write(self, board: ChessBoard, score: Optional[int] = None, result: int = NO_RESULT):
+        self.file.write(pack_position(board, score, result))
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _check_header(path: str):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise ValueError(f"{path} is not a packed position file")
+    magic, version, record_size = struct.unpack(HEADER_FORMAT, header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f"{path} is not a version {VERSION} packed position file")
+
+
+class PositionReader:
+    # Memory-maps a packed file; records is a structured array over the file itself
+
+    def __init__(self, path: str):
+        if np is None:
+            raise ImportError("reading packed positions needs numpy")
+        _check_header(path)
+        self.path = path
+        count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_SIZE
+        if count:
+            # a record cut short by a crashed writer is left out
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)  # mmap can't map an empty range
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def batches(self, batch_size: int = 4096, start: int = 0, stop: Optional[int] = None) -> Iterator:
+        # consecutive slices of the map - views, nothing is copied until a field is used
+        stop = len(self.records) if stop is None else min(stop, len(self.records))
+        for batch_start in range(start, stop, batch_size):
+            yield self.records[batch_start:min(batch_start + batch_size, stop)]
+
+    def board(self, index: int) -> ChessBoard:
+        return unpack_position(self.records[index].tobytes())[0]
+
+    def positions(self) -> Iterator[Tuple[ChessBoard, Optional[int], int]]:
+        # (board, score, result) for every record
+        for batch in self.batches():
+            data = batch.tobytes()
+            for offset in range(0, len(data), RECORD_SIZE):
+                yield unpack_position(data[offset:offset + RECORD_SIZE])
+
+    def close(self):
+        self.records = None
+
+
+def batch_squares(batch) -> 'np.ndarray':
+    # (n, 64) uint8 piece codes of a batch of records, 0 for empty squares
+    occupancy = np.ascontiguousarray(batch['occupancy'], dtype='<u8')
+    occupied = np.unpackbits(occupancy.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little').astype(bool)
+    pieces = batch['pieces']
+    nibbles = np.empty((len(batch), 32), dtype=np.uint8)
+    nibbles[:, 0::2] = pieces & 15
+    nibbles[:, 1::2] = pieces >> 4
+    # the k-th occupied square holds the k-th nibble
+    piece_index = np.maximum(np.cumsum(occupied, axis=1) - 1, 0)
+    return np.where(occupied, np.take_along_axis(nibbles, piece_index, axis=1), 0).astype(np.uint8)
+
+
+# Conversion from JSONL (batch_analysis.py / nnue_train.py output)
+
+def _record_result(record) -> int:
+    result = record.get('result')
+    if result in RESULT_NAMES:
+        return RESULT_NAMES[result]
+    if isinstance(result, (int, float)):
+        # 1 / 0.5 / 0 like texel.py labels
+        return {1.0: WHITE_WIN, 0.5: DRAW, 0.0: BLACK_WIN}.get(float(result), NO_RESULT)
+    return NO_RESULT
+
+
+def convert_jsonl(paths: List[str], output_path: str, append: bool = False) -> int:
+    # records need a 'fen', 'score' and 'result' are optional
+    with PositionWriter(output_path, append=append) as writer:
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = json.loads(line)
+                    writer.write(ChessBoard.from_fen(record['fen']), record.get('score'),
+                                 _record_result(record))
+        return writer.count
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Pack JSONL positions into fixed-width binary records")
+    parser.add_argument('inputs', nargs='+', help="JSONL files with fen (and score / result)")
+    parser.add_argument('-o', '--output', required=True, help="packed file to write")
+    parser.add_argument('--append', action='store_true', help="add to an existing packed file")
+    args = parser.parse_args(argv)
+
+    count = convert_jsonl(args.inputs, args.output, append=args.append)
+    print(f"Packed {count:,} positions into {args.output} ({os.path.getsize(args.output):,} bytes)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
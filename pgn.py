@@ -0,0 +1,380 @@
+# PGN reading and writing with SAN moves
+# games are read lazily one at a time, so huge files are fine
+#
+#   for game in read_games('games.pgn'):
+#       for board, move in game.mainline():
+#           ...
+
+import io
+import re
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple, Union
+
+from chess_board import (ChessBoard, STARTING_FEN, parse_square, piece_code, square_name,
+                         BISHOP_RAYS, KING_TARGETS, KNIGHT_TARGETS, QUEEN_RAYS, ROOK_RAYS,
+                         SQUARE_COORDS, CAPTURE, FLAG_MASK, KING_CASTLE, QUEEN_CASTLE,
+                         promotion_piece)
+
+
+PIECE_LETTERS = ' PNBRQK'  # indexed by piece type, pawns get no letter in SAN
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+# Seven tag roster, written first and in this order
+STANDARD_TAGS = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+HEADER_PATTERN = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+COMMENT_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*')
+TOKEN_PATTERN = re.compile(r'\(|\)|[^\s()]+')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+')
+
+class PGNGame:
+    # One game: headers plus the mainline as SAN strings
+    # moves are only decoded when mainline()/moves() is called
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None,
+                 san_moves: Optional[List[str]] = None, result: str = '*'):
+        self.headers = headers if headers is not None else {}
+        self.san_moves = san_moves if san_moves is not None else []
+        self.result = result
+
+    def starting_board(self) -> ChessBoard:
+        return ChessBoard.from_fen(self.headers.get('FEN', STARTING_FEN))
+
+    def mainline(self) -> Iterator[Tuple[ChessBoard, int]]:
+        # yields (board, move) with board in the position before move
+        # the same board object is advanced after each yield - copy it to keep it
+        board = self.starting_board()
+        for san in self.san_moves:
+            move = decode_san(board, san)
+            yield board, move
+            board.make_move(move)
+
+    def moves(self) -> List[int]:
+        return [move for _, move in self.mainline()]
+
+
+def _open(source: Union[str, TextIO]) -> TextIO:
+    if isinstance(source, str):
+        return open(source, encoding='utf-8', errors='replace')
+    return source
+
+
+def read_games(source: Union[str, TextIO]) -> Iterator[PGNGame]:
+    # yields games one at a time from a path or an open text file
+    f = _open(source)
+    try:
+        headers = {}
+        movetext = []
+        comment_depth = 0
+
+        for line in f:
+            stripped = line.strip()
+
+            # a '[' at the start of a line is a header unless we're inside a {comment}
+            if comment_depth == 0 and stripped.startswith('['):
+                if movetext:
+                    yield _build_game(headers, movetext)
+                    headers, movetext = {}, []
+                match = HEADER_PATTERN.match(stripped)
+                if match:
+                    headers[match.group(1)] = match.group(2)
+                continue
+
+            if not stripped or (comment_depth == 0 and stripped.startswith('%')):
+                continue
+
+            movetext.append(stripped)
+            comment_depth += stripped.count('{') - stripped.count('}')
+            if comment_depth < 0:
+                comment_depth = 0
+
+        if movetext or headers:
+            yield _build_game(headers, movetext)
+    finally:
+        if f is not source:
+            f.close()
+
+
+def _build_game(headers: Dict[str, str], movetext: List[str]) -> PGNGame:
+    san_moves, result = parse_movetext(' '.join(movetext))
+    if result == '*':
+        result = headers.get('Result', '*')
+    return PGNGame(headers, san_moves, result)
+
+
+def parse_movetext(movetext: str) -> Tuple[List[str], str]:
+    # mainline SAN moves and the result token
+    # comments, NAGs, move numbers and (variations) are skipped
+    movetext = COMMENT_PATTERN.sub(' ', movetext)
+
+    san_moves = []
+    result = '*'
+    variation_depth = 0
+    for token in TOKEN_PATTERN.findall(movetext):
+        if token == '(':
+            variation_depth += 1
+        elif token == ')':
+            variation_depth = max(0, variation_depth - 1)
+        elif variation_depth == 0:
+            if token in RESULTS:
+                result = token
+                continue
+            token = MOVE_NUMBER_PATTERN.sub('', token)
+            if token and token[0] != '$':
+                san_moves.append(token)
+
+    return san_moves, result
+
+
+def _candidate_origins(board: ChessBoard, piece_type: int, color: int,
+                       to_row: int, to_col: int) -> List[Tuple[int, int]]:
+    # squares holding a piece of piece_type/color that could move to (to_row, to_col)
+    # works backwards from the target so we never generate the full move list
+    grid = board.squares
+    piece = piece_code(piece_type, color)
+    origins = []
+
+    if piece_type == ChessBoard.PAWN:
+        back = 1 if color == ChessBoard.WHITE else -1
+        to_square = to_row * 8 + to_col
+        is_capture = grid[to_square] != 0 or board.en_passant_square == to_square
+        if is_capture:
+            for dcol in (-1, 1):
+                row, col = to_row + back, to_col + dcol
+                if 0 <= row < 8 and 0 <= col < 8 and grid[row * 8 + col] == piece:
+                    origins.append((row, col))
+        else:
+            row = to_row + back
+            if 0 <= row < 8:
+                if grid[row * 8 + to_col] == piece:
+                    origins.append((row, to_col))
+                elif not grid[row * 8 + to_col]:
+                    # double push from the start rank
+                    start_row = 6 if color == ChessBoard.WHITE else 1
+                    row2 = row + back
+                    if row2 == start_row and grid[row2 * 8 + to_col] == piece:
+                        origins.append((row2, to_col))
+        return origins
+
+    # knight/king steps and rays are symmetric, so the tables work backwards too
+    to_square = to_row * 8 + to_col
+    if piece_type == ChessBoard.KNIGHT or piece_type == ChessBoard.KING:
+        targets = KNIGHT_TARGETS if piece_type == ChessBoard.KNIGHT else KING_TARGETS
+        for square in targets[to_square]:
+            if grid[square] == piece:
+                origins.append(SQUARE_COORDS[square])
+        return origins
+
+    if piece_type == ChessBoard.BISHOP:
+        rays = BISHOP_RAYS
+    elif piece_type == ChessBoard.ROOK:
+        rays = ROOK_RAYS
+    else:
+        rays = QUEEN_RAYS
+
+    for ray in rays[to_square]:
+        for square in ray:
+            occupant = grid[square]
+            if occupant:
+                if occupant == piece:
+                    origins.append(SQUARE_COORDS[square])
+                break
+
+    return origins
+
+
+def decode_san(board: ChessBoard, san: str) -> int:
+    # SAN string -> move for the side to move, raises ValueError if it doesn't fit
+    color = board.current_turn
+    text = san.rstrip('+#!?')
+
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        king_square = 60 if color == ChessBoard.WHITE else 4
+        move = board.move_from_squares(king_square, king_square + (2 if len(text) == 3 else -2))
+        castling_moves = []
+        if board.squares[king_square] == piece_code(ChessBoard.KING, color):
+            board._generate_king_moves(king_square, color, castling_moves)
+        if move not in castling_moves:
+            raise ValueError(f"Illegal castling: {san}")
+        return move
+
+    # Promotion piece: e8=Q, or e8Q without the '='
+    text, _, promotion_text = text.partition('=')
+    if not promotion_text and len(text) > 2 and text[-1] in 'NBRQ' and text[-2].isdigit():
+        text, promotion_text = text[:-1], text[-1]
+    promotion = 0
+    if promotion_text:
+        if promotion_text[0] not in 'NBRQ':
+            raise ValueError(f"Invalid SAN promotion: {san}")
+        promotion = PIECE_LETTERS.index(promotion_text[0])
+
+    text = text.replace('x', '').replace('-', '')
+    piece_type = ChessBoard.PAWN
+    if text and text[0] in 'NBRQK':
+        piece_type = PIECE_LETTERS.index(text[0])
+        text = text[1:]
+
+    if len(text) < 2:
+        raise ValueError(f"Invalid SAN move: {san}")
+    to_row, to_col = parse_square(text[-2:])
+    to_square = to_row * 8 + to_col
+    hint = text[:-2]
+    if promotion and (piece_type != ChessBoard.PAWN or to_row not in (0, 7)):
+        raise ValueError(f"Invalid SAN promotion: {san}")
+
+    candidates = []
+    for origin in _candidate_origins(board, piece_type, color, to_row, to_col):
+        name = square_name(*origin)
+        if all(char in name for char in hint):
+            candidates.append(board.move_from_squares(origin[0] * 8 + origin[1], to_square, promotion))
+
+    target = board.get_piece(to_row, to_col)
+    if target is not None and target[1] == color:
+        candidates = []
+
+    # a lone candidate can still be pinned, so every one gets the legality check
+    candidates = [move for move in candidates if board._is_legal_move(move, color)]
+
+    if len(candidates) != 1:
+        raise ValueError(f"Cannot resolve SAN move: {san}")
+    return candidates[0]
+
+
+def encode_san(board: ChessBoard, move: int) -> str:
+    # move -> SAN string in the position on board (move must be legal)
+    from_square = move & 63
+    to_square = move >> 6 & 63
+    (from_row, from_col), (to_row, to_col) = SQUARE_COORDS[from_square], SQUARE_COORDS[to_square]
+    piece_type, color = board.get_piece(from_row, from_col)
+    flags = move & FLAG_MASK
+
+    if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+        san = 'O-O' if flags == KING_CASTLE else 'O-O-O'
+    else:
+        is_capture = bool(move & CAPTURE)
+        destination = square_name(to_row, to_col)
+
+        if piece_type == ChessBoard.PAWN:
+            san = (square_name(from_row, from_col)[0] + 'x' if is_capture else '') + destination
+            promotion = promotion_piece(move)
+            if promotion:
+                san += '=' + PIECE_LETTERS[promotion]
+        else:
+            # Disambiguate against other pieces of the same type that can legally get there
+            others = [origin for origin in _candidate_origins(board, piece_type, color, to_row, to_col)
+                      if origin != (from_row, from_col)
+                      and board._is_legal_move(origin[0] * 8 + origin[1] | to_square << 6, color)]
+            origin_name = square_name(from_row, from_col)
+            prefix = ''
+            if others:
+                if all(col != from_col for _, col in others):
+                    prefix = origin_name[0]
+                elif all(row != from_row for row, _ in others):
+                    prefix = origin_name[1]
+                else:
+                    prefix = origin_name
+            san = PIECE_LETTERS[piece_type] + prefix + ('x' if is_capture else '') + destination
+
+    # Check / mate suffix
+    after = board.copy()
+    after.make_move(move)
+    opponent = after.current_turn
+    if after.in_check(opponent):
+        san += '#' if not after.generate_moves(opponent) else '+'
+
+    return san
+
+
+def format_game(headers: Dict[str, str], san_moves: List[str], result: str = '*',
+                start_fullmove: int = 1, white_to_move: bool = True) -> str:
+    # PGN text for one game, movetext wrapped at 80 columns
+    headers = dict(headers)
+    headers['Result'] = result
+
+    lines = []
+    for tag in STANDARD_TAGS:
+        value = headers.pop(tag, '?' if tag != 'Result' else result)
+        lines.append(f'[{tag} "{_escape(value)}"]')
+    for tag, value in headers.items():
+        lines.append(f'[{tag} "{_escape(value)}"]')
+    lines.append('')
+
+    tokens = []
+    fullmove = start_fullmove
+    white = white_to_move
+    for index, san in enumerate(san_moves):
+        # keep move numbers on the same line as their move
+        if white:
+            tokens.append(f"{fullmove}. {san}")
+        elif index == 0:
+            tokens.append(f"{fullmove}... {san}")
+        else:
+            tokens.append(san)
+        if not white:
+            fullmove += 1
+        white = not white
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def game_to_pgn(moves: List[int], headers: Optional[Dict[str, str]] = None,
+                result: str = '*', start_board: Optional[ChessBoard] = None) -> str:
+    # PGN text for a list of engine/CLI moves played from start_board
+    board = start_board.copy() if start_board is not None else ChessBoard()
+    headers = dict(headers or {})
+
+    start_fen = board.to_fen()
+    if start_fen != STARTING_FEN:
+        headers.setdefault('SetUp', '1')
+        headers.setdefault('FEN', start_fen)
+
+    start_fullmove = board.fullmove_number
+    white_to_move = board.current_turn == ChessBoard.WHITE
+
+    san_moves = []
+    for move in moves:
+        san_moves.append(encode_san(board, move))
+        board.make_move(move)
+
+    return format_game(headers, san_moves, result, start_fullmove, white_to_move)
+
+
+class PGNWriter:
+    # Appends games to a PGN file, one blank line between games
+
+    def __init__(self, target: Union[str, TextIO]):
+        self._owns_file = isinstance(target, str)
+        self.file = open(target, 'a', encoding='utf-8') if self._owns_file else target
+
+    def write_game(self, moves: List[int], headers: Optional[Dict[str, str]] = None,
+                   result: str = '*', start_board: Optional[ChessBoard] = None):
+        self.file.write(game_to_pgn(moves, headers, result, start_board))
+        self.file.write('\n')
+
+    def close(self):
+        if self._owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_games_from_string(text: str) -> Iterator[PGNGame]:
+    return read_games(io.StringIO(text))
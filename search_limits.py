@@ -0,0 +1,78 @@
+# Search limits - what stops a ChessEngine search
+#
+#   limits = SearchLimits(nodes=50000)              # reproducible, no clock involved
+#   limits = SearchLimits(movetime=2.0, depth=8)
+#   limits = SearchLimits(mate=3)                   # stop once a mate in 3 is found
+#   limits = SearchLimits(infinite=True)            # until the stop token is set
+#   limits = SearchLimits(depth=6, searchmoves=[move_a, move_b])   # only these root moves
+#
+#   token = StopToken()
+#   threading.Timer(1.0, token.stop).start()
+#   engine.search(board, limits=limits, stop_token=token)
+
+import threading
+from typing import List, Optional
+
+# Deepest iteration a search will start
+MAX_DEPTH = 64
+
+
+class SearchLimits:
+    # Any combination of limits - the search stops at whichever is hit first
+    # nothing set (or infinite) means: search until stopped
+
+    def __init__(self, depth: Optional[int] = None, nodes: Optional[int] = None,
+                 movetime: Optional[float] = None, mate: Optional[int] = None,
+                 infinite: bool = False, searchmoves: Optional[List[int]] = None):
+        if depth is not None and depth < 1:
+            raise ValueError(f"search depth must be at least 1, got {depth}")
+        self.depth = depth
+        self.nodes = nodes
+        self.movetime = movetime
+        self.mate = mate
+        self.infinite = infinite
+        self.searchmoves = searchmoves
+
+    @classmethod
+    def from_args(cls, max_depth: int, max_time: Optional[float], max_nodes: Optional[int]) -> 'SearchLimits':
+        # the old search(max_depth, max_time, max_nodes) arguments
+        if max_time is not None and max_time == float('inf'):
+            max_time = None
+        return cls(depth=max_depth, nodes=max_nodes, movetime=max_time)
+
+    def max_depth(self) -> int:
+        # a mate in N moves is found within 2N - 1 plies
+        if self.infinite:
+            return MAX_DEPTH
+        depth = MAX_DEPTH if self.depth is None else self.depth
+        if self.mate:
+            depth = min(depth, 2 * self.mate - 1)
+        return depth
+
+    def max_time(self) -> float:
+        if self.infinite or self.movetime is None:
+            return float('inf')
+        return self.movetime
+
+    def max_nodes(self) -> Optional[int]:
+        return None if self.infinite else self.nodes
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={value!r}" for name, value in vars(self).items() if value)
+        return f"SearchLimits({fields})"
+
+
+class StopToken:
+    # Thread-safe stop flag - any thread calls stop(), the search polls is_set()
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def stop(self):
+        self._event.set()
+
+    def reset(self):
+        self._event.clear()
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
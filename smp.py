@@ -0,0 +1,228 @@
+# Parallel search - several engines working on one position
+#
+# On a free-threaded CPython (3.13t with the GIL disabled) this is lazy SMP:
+# one ChessEngine per thread, each with its own board copy, all searching the
+# same root and sharing a SharedTranspositionTable. With the GIL on, threads
+# would just take turns, so the root moves are split over worker processes instead.
+#
+#   searcher = ParallelSearch(threads=8)
+#   best_move, score = searcher.search(board, SearchLimits(movetime=5.0))
+#   searcher.close()
+
+import concurrent.futures
+import sys
+import threading
+from typing import List, Optional, Tuple
+
+from analysis_store import pack_entry, unpack_entry
+from chess_board import ChessBoard
+from chess_engine import ChessEngine, TranspositionTable
+from search_limits import SearchLimits, StopToken
+
+
+def gil_disabled() -> bool:
+    # True on a free-threaded build running without the GIL
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+class SharedTranspositionTable:
+    # Fixed-size table that many threads read and write without locks
+    # Each slot is (key ^ data, data) in two lists, data packed like analysis_store.py.
+    # A reader only trusts a slot whose check ^ data gives back its key, so an
+    # entry torn by two threads writing at once just reads as a miss.
+
+    EXACT = TranspositionTable.EXACT
+    LOWER_BOUND = TranspositionTable.LOWER_BOUND
+    UPPER_BOUND = TranspositionTable.UPPER_BOUND
+
+    def __init__(self, size_mb: int = 64):
+        # roughly 80 bytes per slot for the two lists and their int objects
+        slots = 1
+        while slots * 2 * 80 <= size_mb * 1024 * 1024:
+            slots *= 2
+        self.max_entries = slots
+        self.mask = slots - 1
+        self.checks = [0] * slots
+        self.data = [0] * slots
+        # approximate under contention - plain int counters
+        self.hits = 0
+        self.misses = 0
+        self.telemetry = None
+
+    def _read(self, zobrist_hash: int) -> Optional[Tuple[int, int, int, int]]:
+        index = zobrist_hash & self.mask
+        data = self.data[index]
+        if data and self.checks[index] ^ data == zobrist_hash:
+            return unpack_entry(data)
+        return None
+
+    def store(self, zobrist_hash: int, depth: int, score: int, flag: int, best_move: int = 0):
+        # depth-preferred for the same position, always replace a different one
+        index = zobrist_hash & self.mask
+        existing = self._read(zobrist_hash)
+        if existing is not None and existing[1] > depth:
+            return
+        data = pack_entry(score, depth, flag, best_move)
+        self.data[index] = data
+        self.checks[index] = zobrist_hash ^ data
+
+    def probe(self, zobrist_hash: int, depth: int, alpha: int, beta: int) -> Optional[Tuple[Optional[int], int]]:
+        # same contract as TranspositionTable.probe
+        entry = self._read(zobrist_hash)
+        if entry is not None:
+            score, stored_depth, flag, best_move = entry
+            if stored_depth >= depth:
+                self.hits += 1
+                if flag == self.EXACT:
+                    return (score, best_move)
+                elif flag == self.LOWER_BOUND and score >= beta:
+                    return (score, best_move)
+                elif flag == self.UPPER_BOUND and score <= alpha:
+                    return (score, best_move)
+            if best_move:
+                return (None, best_move)
+        self.misses += 1
+        return None
+
+    def get_move(self, zobrist_hash: int) -> int:
+        entry = self._read(zobrist_hash)
+        return entry[3] if entry else 0
+
+    def get_entry(self, zobrist_hash: int) -> Optional[Tuple[int, int, int, int]]:
+        return self._read(zobrist_hash)
+
+    def clear(self):
+        self.checks = [0] * len(self.checks)
+        self.data = [0] * len(self.data)
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self) -> dict:
+        total_probes = self.hits + self.misses
+        return {
+            'entries': sum(1 for data in self.data if data),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total_probes if total_probes > 0 else 0,
+        }
+
+
+# Process fallback - one long-lived engine per worker
+
+_worker_engine: Optional[ChessEngine] = None
+
+
+def _init_worker(tt_size_mb: int):
+    global _worker_engine
+    _worker_engine = ChessEngine(tt_size_mb=tt_size_mb)
+
+
+def _search_moves(task: Tuple[ChessBoard, SearchLimits]) -> Tuple[List[Tuple[int, int, int]], int]:
+    # ([(depth, best_move, score) for every finished iteration], nodes) over the task's root moves
+    board, limits = task
+    iterations = []
+    last = None
+    for last in _worker_engine.iter_search(board, limits):
+        if last.complete:
+            iterations.append((last.depth, last.best_move, last.score))
+    if not iterations and last is not None:
+        # cut short at the first depth - still better than no move
+        iterations.append((last.depth, last.best_move, last.score))
+    return iterations, _worker_engine.nodes_searched
+
+
+class ParallelSearch:
+    # threads engines on one search; use_threads defaults to "is the GIL off"
+
+    def __init__(self, threads: int = 4, tt_size_mb: int = 64, use_threads: Optional[bool] = None):
+        self.threads = max(1, threads)
+        self.tt_size_mb = tt_size_mb
+        self.use_threads = gil_disabled() if use_threads is None else use_threads
+        self.engines: List[ChessEngine] = []
+        self.pool = None
+        self.nodes_searched = 0
+        self.completed_depth = 0
+
+        if self.use_threads:
+            self.transposition_table = SharedTranspositionTable(tt_size_mb)
+            for thread_id in range(self.threads):
+                engine = ChessEngine(transposition_table=self.transposition_table)
+                # helpers skip ahead on alternate depths so the threads spread out
+                # instead of all searching the same tree in lockstep
+                engine.start_depth = 1 + thread_id % 2
+                self.engines.append(engine)
+
+    def search(self, board: ChessBoard, limits: SearchLimits,
+               stop_token: Optional[StopToken] = None) -> Tuple[Optional[int], float]:
+        # (best_move, score) like ChessEngine.search
+        # stop_token only reaches the threads - worker processes run to their limits
+        if self.use_threads:
+            return self._search_threads(board, limits, stop_token)
+        return self._search_processes(board, limits)
+
+    def _search_threads(self, board: ChessBoard, limits: SearchLimits,
+                        stop_token: Optional[StopToken]) -> Tuple[Optional[int], float]:
+        # the calling thread runs engine 0 and decides; helpers only fill the table
+        helpers_stop = StopToken()
+        main_engine = self.engines[0]
+
+        def run_helper(engine):
+            # a helper also gives up when the caller's token is set
+            engine.stop_check = stop_token.is_set if stop_token is not None else None
+            engine.search(board.copy(), limits=limits, stop_token=helpers_stop)
+
+        helpers = [threading.Thread(target=run_helper, args=(engine,), name=f'smp-{thread_id}', daemon=True)
+                   for thread_id, engine in enumerate(self.engines[1:], 1)]
+        for thread in helpers:
+            thread.start()
+        try:
+            result = main_engine.search(board.copy(), limits=limits, stop_token=stop_token)
+        finally:
+            helpers_stop.stop()
+            for thread in helpers:
+                thread.join()
+
+        self.nodes_searched = sum(engine.nodes_searched for engine in self.engines)
+        self.completed_depth = main_engine.completed_depth
+        return result
+
+    def _search_processes(self, board: ChessBoard, limits: SearchLimits) -> Tuple[Optional[int], float]:
+        # root splitting: each worker searches every threads-th root move
+        moves = board.generate_moves(board.current_turn)
+        if limits.searchmoves:
+            moves = [move for move in moves if move in limits.searchmoves]
+        if not moves:
+            return None, float('-inf')
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.threads, initializer=_init_worker,
+                                                               initargs=(self.tt_size_mb,))
+
+        tasks = []
+        for worker in range(min(self.threads, len(moves))):
+            worker_limits = SearchLimits(depth=limits.depth, nodes=limits.nodes, movetime=limits.movetime,
+                                         mate=limits.mate, infinite=limits.infinite,
+                                         searchmoves=moves[worker::self.threads])
+            tasks.append((board, worker_limits))
+        results = list(self.pool.map(_search_moves, tasks))
+        self.nodes_searched = sum(nodes for _, nodes in results)
+
+        # scores from different depths don't compare - a shallow worker's optimistic
+        # score could beat a deeper one's, so every worker's move is taken from the
+        # deepest iteration they all finished
+        finished = [iterations for iterations, _ in results if iterations]
+        if not finished:
+            self.completed_depth = 0
+            return None, float('-inf')
+        common_depth = min(iterations[-1][0] for iterations in finished)
+        candidates = [next(iteration for iteration in reversed(iterations) if iteration[0] <= common_depth)
+                      for iterations in finished]
+        _, best_move, score = max(candidates, key=lambda iteration: iteration[2])
+        self.completed_depth = common_depth
+        return (best_move or None), score
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
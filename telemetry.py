@@ -0,0 +1,123 @@
+# Search telemetry - counters collected while the engine searches
+# attach one to an engine with engine.set_telemetry(...)
+# when nothing is attached the engine only pays for an "is None" check
+
+import csv
+import io
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+from chess_board import move_to_notation
+
+
+class SearchTelemetry:
+    # Counters for one search, split per iterative deepening iteration
+
+    # Iteration fields in export order
+    FIELDS = [
+        'depth', 'score', 'best_move', 'nodes', 'time',
+        'pv_nodes', 'cut_nodes', 'all_nodes',
+        'cutoffs', 'first_move_cutoffs', 'first_move_cutoff_rate',
+        'ebf',
+        'tt_probes', 'tt_hits',
+        'tt_stores_exact', 'tt_stores_lower', 'tt_stores_upper',
+        'tt_overwrites',
+        'eval_calls', 'movegen_calls',
+    ]
+
+    def __init__(self, listener: Optional[Callable[[Dict], None]] = None):
+        # listener gets a dict for every completed iteration
+        self.listener = listener
+        self.iterations: List[Dict] = []
+        self.search_start_time = 0.0
+        self._iteration_start_time = 0.0
+        self._reset_counters()
+
+    def _reset_counters(self):
+        # plain int attributes - the engine bumps these directly
+        self.pv_nodes = 0
+        self.cut_nodes = 0
+        self.all_nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_stores = [0, 0, 0]  # indexed by TranspositionTable flag
+        self.tt_overwrites = 0
+        self.eval_calls = 0
+        self.movegen_calls = 0
+
+    def begin_search(self):
+        self.iterations = []
+        self.search_start_time = time.time()
+        self._reset_counters()
+
+    def begin_iteration(self, depth: int):
+        self._iteration_start_time = time.time()
+        self._reset_counters()
+
+    def end_iteration(self, depth: int, score: int, best_move: Optional[int], nodes: int):
+        # nodes is the engine's node count for this iteration only
+        previous_nodes = self.iterations[-1]['nodes'] if self.iterations else 0
+
+        record = {
+            'depth': depth,
+            'score': score,
+            'best_move': move_to_notation(best_move) if best_move else None,
+            'nodes': nodes,
+            'time': time.time() - self._iteration_start_time,
+            'pv_nodes': self.pv_nodes,
+            'cut_nodes': self.cut_nodes,
+            'all_nodes': self.all_nodes,
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'first_move_cutoff_rate': self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+            # effective branching factor: growth in nodes from the previous iteration
+            'ebf': nodes / previous_nodes if previous_nodes else 0.0,
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_stores_exact': self.tt_stores[0],
+            'tt_stores_lower': self.tt_stores[1],
+            'tt_stores_upper': self.tt_stores[2],
+            'tt_overwrites': self.tt_overwrites,
+            'eval_calls': self.eval_calls,
+            'movegen_calls': self.movegen_calls,
+        }
+        self.iterations.append(record)
+
+        if self.listener is not None:
+            self.listener(record)
+
+        return record
+
+    def totals(self) -> Dict:
+        # sum of the counters over all iterations
+        totals = {}
+        for field in self.FIELDS:
+            if field in ('depth', 'score', 'best_move', 'first_move_cutoff_rate', 'ebf'):
+                continue
+            totals[field] = sum(record[field] for record in self.iterations)
+
+        cutoffs = totals.get('cutoffs', 0)
+        totals['first_move_cutoff_rate'] = totals.get('first_move_cutoffs', 0) / cutoffs if cutoffs else 0.0
+        totals['depth'] = self.iterations[-1]['depth'] if self.iterations else 0
+        return totals
+
+    def to_dict(self) -> Dict:
+        return {
+            'iterations': self.iterations,
+            'totals': self.totals(),
+        }
+
+    def to_json(self, indent: Optional[int] = None) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_csv(self) -> str:
+        # one row per iteration
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=self.FIELDS)
+        writer.writeheader()
+        for record in self.iterations:
+            writer.writerow(record)
+        return out.getvalue()
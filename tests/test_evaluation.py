@@ -0,0 +1,44 @@
+import random
+
+from chess_board import ChessBoard
+from evaluation import Evaluator
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+# castling both ways, en passant and promotions with and without capture
+SPECIAL_MOVES = "r3k2r/1P6/8/2pP4/8/8/6p1/R3K2R w KQkq c6 0 1"
+
+
+def test_position_score_matches_full_sum():
+    evaluator = Evaluator()
+    rng = random.Random(1)
+    for fen in (KIWIPETE, SPECIAL_MOVES):
+        for _ in range(20):
+            board = ChessBoard.from_fen(fen)
+            evaluator.prepare(board)
+            for _ in range(40):
+                moves = board.generate_moves(board.current_turn)
+                if not moves:
+                    break
+                board = board.copy()
+                board.make_move(rng.choice(moves))
+                position_score = board.position_score
+                assert position_score.middle == evaluator._sum_scores(board, evaluator.square_scores)
+                assert position_score.end == evaluator._sum_scores(board, evaluator.end_square_scores)
+
+
+def test_lazy_bound_never_hides_stalemate():
+    # a queen up but stalemated - no window may get a bound instead of the draw
+    evaluator = Evaluator()
+    board = ChessBoard.from_fen("k7/8/1Q6/8/8/8/8/2K5 b - - 0 1")
+    assert evaluator.evaluate(board) == 0
+    for alpha, beta in ((-50, 50), (-1000, -900), (900, 1000)):
+        assert evaluator.evaluate(ChessBoard.from_fen(board.to_fen()), alpha, beta) == 0
+
+
+def test_lazy_bound_is_on_the_same_side_of_the_window():
+    evaluator = Evaluator()
+    full = evaluator.evaluate(ChessBoard.from_fen(KIWIPETE))
+    for alpha, beta in ((-50, 50), (-1000, -900), (900, 1000)):
+        lazy = evaluator.evaluate(ChessBoard.from_fen(KIWIPETE), alpha, beta)
+        assert (full <= alpha) == (lazy <= alpha)
+        assert (full >= beta) == (lazy >= beta)
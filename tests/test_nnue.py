@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from chess_board import ChessBoard
+from nnue import NNUEEvaluator, NNUENetwork
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+# castling both ways, en passant and promotions with and without capture
+SPECIAL_MOVES = "r3k2r/1P6/8/2pP4/8/8/6p1/R3K2R w KQkq c6 0 1"
+
+
+@pytest.mark.parametrize('fen', [KIWIPETE, SPECIAL_MOVES])
+def test_incremental_accumulator_matches_refresh(fen):
+    network = NNUENetwork.random(hidden=32, seed=1)
+    evaluator = NNUEEvaluator(network)
+    rng = random.Random(2)
+    for _ in range(10):
+        board = ChessBoard.from_fen(fen)
+        evaluator.prepare(board)
+        for _ in range(30):
+            moves = board.generate_moves(board.current_turn)
+            if not moves:
+                break
+            board = board.copy()
+            board.make_move(rng.choice(moves))
+            accumulator = board.accumulator
+            assert np.array_equal(accumulator.white, network.refresh(board, ChessBoard.WHITE))
+            assert np.array_equal(accumulator.black, network.refresh(board, ChessBoard.BLACK))
+            assert evaluator.evaluate(board) == evaluator.evaluate(ChessBoard.from_fen(board.to_fen()))
+
+
+def test_copies_share_the_parent_accumulator():
+    network = NNUENetwork.random(hidden=32, seed=1)
+    board = ChessBoard.from_fen(KIWIPETE)
+    NNUEEvaluator(network).prepare(board)
+    parent = board.accumulator
+    white = parent.white.copy()
+    child = board.copy()
+    child.make_move(child.generate_moves(child.current_turn)[0])
+    assert board.accumulator is parent
+    assert np.array_equal(parent.white, white)
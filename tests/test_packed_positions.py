@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from chess_board import ChessBoard
+from packed_positions import (BLACK_WIN, DRAW, NO_RESULT, RECORD_SIZE, WHITE_WIN, PositionWriter,
+                              pack_position, unpack_position)
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+
+def random_positions(plies, seed=0):
+    # positions along random games - castling rights, en passant squares and clocks vary
+    rng = random.Random(seed)
+    boards = []
+    for fen in (ChessBoard().to_fen(), KIWIPETE, "4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 40"):
+        board = ChessBoard.from_fen(fen)
+        for _ in range(plies):
+            boards.append(board.copy())
+            moves = board.generate_moves(board.current_turn)
+            if not moves:
+                break
+            board.make_move(rng.choice(moves))
+    return boards
+
+
+def test_pack_round_trip():
+    results = (WHITE_WIN, DRAW, BLACK_WIN, NO_RESULT)
+    for index, board in enumerate(random_positions(40)):
+        score = None if index % 5 == 0 else index * 37 - 700
+        data = pack_position(board, score, results[index % 4])
+        assert len(data) == RECORD_SIZE
+        unpacked, unpacked_score, result = unpack_position(data)
+        assert unpacked.to_fen() == board.to_fen()
+        assert unpacked.zobrist_key == board.zobrist_key
+        assert unpacked.piece_squares == board.piece_squares
+        assert (sorted(unpacked.generate_moves(unpacked.current_turn))
+                == sorted(board.generate_moves(board.current_turn)))
+        assert unpacked_score == score
+        assert result == results[index % 4]
+
+
+def test_file_round_trip(tmp_path):
+    np = pytest.importorskip('numpy')
+    from packed_positions import PositionReader, batch_squares
+
+    boards = random_positions(40)
+    path = str(tmp_path / 'positions.pos')
+    with PositionWriter(path) as writer:
+        for index, board in enumerate(boards):
+            writer.write(board, score=index)
+
+    reader = PositionReader(path)
+    assert len(reader) == len(boards)
+    squares = np.concatenate([batch_squares(batch) for batch in reader.batches(16)])
+    assert squares.tolist() == [list(board.squares) for board in boards]
+    for index, (board, score, result) in enumerate(reader.positions()):
+        assert board.to_fen() == boards[index].to_fen()
+        assert score == index
+        assert result == NO_RESULT
+    reader.close()
@@ -0,0 +1,20 @@
+import pytest
+
+from chess_board import ChessBoard
+
+START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+
+# known leaf counts from the usual perft test positions
+@pytest.mark.parametrize('fen, counts', [
+    (START, [20, 400, 8902]),
+    (KIWIPETE, [48, 2039, 97862]),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238]),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467]),
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379]),
+])
+def test_perft(fen, counts):
+    board = ChessBoard.from_fen(fen)
+    for depth, count in enumerate(counts, 1):
+        assert board.perft(depth) == count
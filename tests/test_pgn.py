@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+import pgn
+from chess_board import ChessBoard
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+# promotions with and without capture, en passant, castling both ways
+SPECIAL_MOVES = "r3k2r/1P6/8/2pP4/8/8/6p1/R3K2R w KQkq c6 0 1"
+# three knights reaching d4 and e5 - needs file, rank and full square hints
+DISAMBIGUATION = "4k3/8/8/1N3N2/8/1N6/8/4K3 w - - 0 1"
+
+
+@pytest.mark.parametrize('fen', [ChessBoard().to_fen(), KIWIPETE, SPECIAL_MOVES, DISAMBIGUATION])
+def test_san_round_trip(fen):
+    rng = random.Random(0)
+    for _ in range(10):
+        board = ChessBoard.from_fen(fen)
+        for _ in range(30):
+            moves = board.generate_moves(board.current_turn)
+            if not moves:
+                break
+            for move in moves:
+                assert pgn.decode_san(board, pgn.encode_san(board, move)) == move
+            board.make_move(rng.choice(moves))
+
+
+def test_pinned_lone_candidate_is_rejected():
+    # the e2 knight is the only one that could reach d4, but it is pinned
+    board = ChessBoard.from_fen("4r1k1/8/8/8/8/8/4N3/4K3 w - - 0 1")
+    with pytest.raises(ValueError):
+        pgn.decode_san(board, "Nd4")
+
+
+def test_game_round_trip():
+    board = ChessBoard()
+    rng = random.Random(1)
+    moves = []
+    for _ in range(40):
+        legal = board.generate_moves(board.current_turn)
+        if not legal:
+            break
+        move = rng.choice(legal)
+        board.make_move(move)
+        moves.append(move)
+    game = next(pgn.read_games_from_string(pgn.game_to_pgn(moves)))
+    assert game.moves() == moves
@@ -0,0 +1,63 @@
+from chess_board import ChessBoard
+from chess_engine import ChessEngine
+from search_limits import SearchLimits
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+
+def board_from_fen(fen):
+    board = ChessBoard()
+    board.set_fen(fen)
+    return board
+
+
+def test_limited_search_returns_last_complete_iteration():
+    # the node limit runs out part way through a depth - that depth's move
+    # is only the best of the moves it reached, so the one before is the result
+    board = board_from_fen(KIWIPETE)
+    limited = ChessEngine()
+    result = limited.search(board, limits=SearchLimits(depth=6, nodes=20000))
+    depth = limited.completed_depth
+    assert limited.search_stopped
+    assert 1 <= depth < 6
+
+    full = ChessEngine()
+    assert full.search(board_from_fen(KIWIPETE), limits=SearchLimits(depth=depth)) == result
+
+
+def test_iter_search_yields_only_finished_depths():
+    board = board_from_fen(KIWIPETE)
+    engine = ChessEngine()
+    infos = list(engine.iter_search(board, SearchLimits(depth=6, nodes=20000)))
+    assert [info.depth for info in infos] == list(range(1, len(infos) + 1))
+    assert all(info.complete for info in infos)
+    assert infos[-1].depth == engine.completed_depth
+
+
+def test_partial_first_depth_still_gives_a_move():
+    board = board_from_fen(KIWIPETE)
+    engine = ChessEngine()
+    infos = list(engine.iter_search(board, SearchLimits(nodes=10)))
+    assert len(infos) == 1
+    assert not infos[0].complete
+    assert infos[0].best_move in board.generate_moves(board.current_turn)
+    assert engine.completed_depth == 0
+
+
+def multipv_lines(depth):
+    engine = ChessEngine()
+    return {(move, score) for move, score, _ in
+            engine.search(ChessBoard(), limits=SearchLimits(depth=depth), multipv=3)}
+
+
+def test_multipv_keeps_previous_lines_for_unfinished_slots():
+    # the limit hits during the depth 3 re-searches - the missing lines are
+    # depth 2's, never the partial result of an interrupted re-search
+    engine = ChessEngine()
+    info = list(engine.iter_search(ChessBoard(), SearchLimits(depth=5, nodes=1100), multipv=3))[-1]
+    assert info.depth == 3
+    assert len(info.lines) == 3
+    assert (info.lines[0][0], info.lines[0][1]) == (info.best_move, info.score)
+    lines = {(move, score) for move, score, _ in info.lines}
+    assert not lines <= multipv_lines(3)
+    assert lines <= multipv_lines(3) | multipv_lines(2)
@@ -0,0 +1,382 @@
+# Texel tuning - fit the Evaluator weights to game results
+# every evaluation term is linear in its weight, so a position becomes a sparse
+# feature row and the eval is just features . weights. The weights are then fitted
+# by gradient descent on (result - sigmoid(K * eval))^2, all in numpy.
+#
+#   python texel.py games.pgn -o tuned.json --cache texel_cache --epochs 50
+#   python texel.py labelled.epd -o tuned.json          # lines like: <fen> c9 "1-0";
+#
+# Features are extracted once (on all cores) into .npy chunks under --cache;
+# later runs reuse them and only ever hold one chunk in memory.
+#
+# needs numpy
+
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import pgn
+from chess_board import ChessBoard, SQUARE_COORDS, TYPE_MASK, COLOR_SHIFT
+from evaluation import Evaluator, PIECE_NAMES, TABLE_NAMES, WHITE_PAWN, BLACK_PAWN
+
+# Feature layout - one weight each
+#   material:   count difference (white - black) per piece type, no king
+#   tables:     +1 / -1 per piece on its square (black mirrored), kings on the
+#               middlegame or endgame table like Evaluator does
+#   mobility:   white moves - black moves
+#   shield:     white shield pawns - black shield pawns
+#   king zone:  attacks on the black king zone - attacks on the white one
+MATERIAL_OFFSET = 0
+TABLE_OFFSET = MATERIAL_OFFSET + len(PIECE_NAMES)
+MOBILITY_FEATURE = TABLE_OFFSET + 64 * len(TABLE_NAMES)
+SHIELD_FEATURE = MOBILITY_FEATURE + 1
+KING_ZONE_FEATURE = SHIELD_FEATURE + 1
+FEATURE_COUNT = KING_ZONE_FEATURE + 1
+
+KING_MIDDLE_TABLE = TABLE_NAMES.index('king_middle')
+KING_END_TABLE = TABLE_NAMES.index('king_end')
+
+RESULT_PATTERN = re.compile(r'(1-0|0-1|1/2-1/2|\[(?:1|0|0\.5|1\.0|0\.0)\])\W*$')
+RESULT_VALUES = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5,
+                 '[1]': 1.0, '[1.0]': 1.0, '[0.5]': 0.5, '[0]': 0.0, '[0.0]': 0.0}
+
+DEFAULT_CHUNK_SIZE = 500_000
+
+
+# Positions (FEN, result for white)
+
+def read_labelled_epd(path: str) -> Iterator[Tuple[str, float]]:
+    # "<fen> c9 \"1-0\";", "<fen> [0.5]", "<fen>; 1/2-1/2" ...
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            match = RESULT_PATTERN.search(line)
+            if not match or line.startswith('#'):
+                continue
+            fields = line[:match.start()].replace(';', ' ').split()
+            if len(fields) < 4:
+                continue
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                fen = ' '.join(fields[:6])
+            else:
+                fen = ' '.join(fields[:4])
+            yield fen, RESULT_VALUES[match.group(1)]
+
+
+def read_pgn_positions(path: str, min_ply: int = 8) -> Iterator[Tuple[str, float]]:
+    # every position of every finished game, labelled with the game result
+    for game in pgn.read_games(path):
+        result = RESULT_VALUES.get(game.result)
+        if result is None:
+            continue
+        try:
+            for ply, (board, _) in enumerate(game.mainline()):
+                if ply >= min_ply:
+                    yield board.to_fen(), result
+        except ValueError:
+            continue  # skip the rest of a game we can't follow
+
+
+def read_labelled(path: str, min_ply: int = 8) -> Iterator[Tuple[str, float]]:
+    if path.lower().endswith('.pgn'):
+        return read_pgn_positions(path, min_ply)
+    return read_labelled_epd(path)
+
+
+# Features
+
+_evaluator = Evaluator()
+
+
+def extract_features(board: ChessBoard) -> Optional[Tuple[List[int], List[int]]]:
+    # (feature indices, values) so that Evaluator.evaluate == sum(values * weights),
+    # or None for positions the static eval doesn't score (in check, no moves)
+    turn = board.current_turn
+    if board.in_check(turn):
+        return None
+    white_moves = len(board.generate_moves(ChessBoard.WHITE))
+    black_moves = len(board.generate_moves(ChessBoard.BLACK))
+    if not (white_moves if turn == ChessBoard.WHITE else black_moves):
+        return None
+
+    indices = []
+    values = []
+    king_table = KING_END_TABLE if _evaluator._is_endgame(board) else KING_MIDDLE_TABLE
+    for square, code in enumerate(board.squares):
+        if not code:
+            continue
+        piece_type = code & TYPE_MASK
+        row, col = SQUARE_COORDS[square]
+        sign = 1
+        if code >> COLOR_SHIFT == ChessBoard.BLACK:
+            row, sign = 7 - row, -1
+        if piece_type == ChessBoard.KING:
+            table = king_table
+        else:
+            table = piece_type - 1
+            indices.append(MATERIAL_OFFSET + piece_type - 1)
+            values.append(sign)
+        indices.append(TABLE_OFFSET + table * 64 + row * 8 + col)
+        values.append(sign)
+
+    indices.append(MOBILITY_FEATURE)
+    values.append(white_moves - black_moves)
+    indices.append(SHIELD_FEATURE)
+    values.append(_pawn_shield(board, ChessBoard.WHITE) - _pawn_shield(board, ChessBoard.BLACK))
+    attacks = board.attack_map()
+    indices.append(KING_ZONE_FEATURE)
+    values.append(attacks.king_zone_attacks(board, ChessBoard.BLACK)
+                  - attacks.king_zone_attacks(board, ChessBoard.WHITE))
+    return indices, values
+
+
+def _pawn_shield(board: ChessBoard, color: int) -> int:
+    # same rule as Evaluator._evaluate_king_safety
+    if color == ChessBoard.WHITE:
+        king_row, king_col = SQUARE_COORDS[board.white_king_square]
+        back_row, pawn_row, pawn = 7, 48, WHITE_PAWN
+    else:
+        king_row, king_col = SQUARE_COORDS[board.black_king_square]
+        back_row, pawn_row, pawn = 0, 8, BLACK_PAWN
+    if king_row != back_row:
+        return 0
+    return sum(1 for col in (king_col - 1, king_col, king_col + 1)
+               if 0 <= col < 8 and board.squares[pawn_row + col] == pawn)
+
+
+def weights_to_vector(weights: dict) -> np.ndarray:
+    vector = np.zeros(FEATURE_COUNT)
+    for i, name in enumerate(PIECE_NAMES):
+        vector[MATERIAL_OFFSET + i] = weights['piece_values'][name]
+    for i, name in enumerate(TABLE_NAMES):
+        vector[TABLE_OFFSET + i * 64:TABLE_OFFSET + (i + 1) * 64] = np.ravel(weights['tables'][name])
+    vector[MOBILITY_FEATURE] = weights['mobility']
+    vector[SHIELD_FEATURE] = weights['pawn_shield']
+    vector[KING_ZONE_FEATURE] = weights.get('king_zone', Evaluator.KING_ZONE_ATTACK)
+    return vector
+
+
+def vector_to_weights(vector: np.ndarray) -> dict:
+    # rounded to whole centipawns, the Evaluator works in ints
+    values = [int(round(value)) for value in vector]
+    return {
+        'piece_values': {name: values[MATERIAL_OFFSET + i] for i, name in enumerate(PIECE_NAMES)},
+        'tables': {name: [values[TABLE_OFFSET + i * 64 + row * 8:TABLE_OFFSET + i * 64 + row * 8 + 8]
+                          for row in range(8)]
+                   for i, name in enumerate(TABLE_NAMES)},
+        'mobility': values[MOBILITY_FEATURE],
+        'pawn_shield': values[SHIELD_FEATURE],
+        'king_zone': values[KING_ZONE_FEATURE],
+    }
+
+
+# Feature cache - chunks of a sparse matrix in COO form, as .npy files
+#   rows int32 (row within the chunk), cols int16, values int16, results float32
+
+def _extract_chunk(task: Tuple[int, List[Tuple[str, float]], str]) -> int:
+    chunk_index, positions, cache_dir = task
+    rows, cols, values, results = [], [], [], []
+    for fen, result in positions:
+        try:
+            features = extract_features(ChessBoard.from_fen(fen))
+        except ValueError:
+            continue
+        if features is None:
+            continue
+        indices, feature_values = features
+        rows.extend([len(results)] * len(indices))
+        cols.extend(indices)
+        values.extend(feature_values)
+        results.append(result)
+
+    prefix = os.path.join(cache_dir, f'chunk{chunk_index:05d}')
+    np.save(prefix + '_rows.npy', np.array(rows, dtype=np.int32))
+    np.save(prefix + '_cols.npy', np.array(cols, dtype=np.int16))
+    np.save(prefix + '_values.npy', np.array(values, dtype=np.int16))
+    np.save(prefix + '_results.npy', np.array(results, dtype=np.float32))
+    return len(results)
+
+
+def _chunks(positions: Iterator[Tuple[str, float]], chunk_size: int) -> Iterator[List[Tuple[str, float]]]:
+    chunk = []
+    for position in positions:
+        chunk.append(position)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_cache(positions: Iterator[Tuple[str, float]], cache_dir: str,
+                chunk_size: int = DEFAULT_CHUNK_SIZE, workers: Optional[int] = None) -> int:
+    # extract features of every position into cache_dir, returns the number of positions kept
+    os.makedirs(cache_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    kept = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk_index, chunk in enumerate(_chunks(positions, chunk_size)):
+            pending.add(pool.submit(_extract_chunk, (chunk_index, chunk, cache_dir)))
+            # a couple of chunks per worker in flight keeps memory bounded
+            if len(pending) >= workers * 2:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                kept += sum(future.result() for future in done)
+        kept += sum(future.result() for future in pending)
+    return kept
+
+
+def load_cache(cache_dir: str) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    # (rows, cols, values, results) per chunk, memory-mapped
+    names = sorted(name[:-len('_results.npy')] for name in os.listdir(cache_dir)
+                   if name.endswith('_results.npy'))
+    for name in names:
+        prefix = os.path.join(cache_dir, name)
+        yield tuple(np.load(prefix + suffix, mmap_mode='r')
+                    for suffix in ('_rows.npy', '_cols.npy', '_values.npy', '_results.npy'))
+
+
+def _batches(chunk, batch_size: int):
+    # split a chunk into row ranges; rows are sorted, so nnz ranges come from searchsorted
+    rows, cols, values, results = chunk
+    for start in range(0, len(results), batch_size):
+        stop = min(start + batch_size, len(results))
+        begin, end = np.searchsorted(rows, (start, stop))
+        yield (np.asarray(rows[begin:end]) - start, np.asarray(cols[begin:end], dtype=np.intp),
+               np.asarray(values[begin:end], dtype=np.float64), np.asarray(results[start:stop], dtype=np.float64))
+
+
+# Fitting
+
+def _scores(batch, weights: np.ndarray) -> np.ndarray:
+    rows, cols, values, results = batch
+    return np.bincount(rows, weights=values * weights[cols], minlength=len(results))
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def total_error(cache_dir: str, weights: np.ndarray, k: float, batch_size: int = 1 << 16,
+                max_positions: Optional[int] = None) -> float:
+    # mean squared error over the cache (or its first max_positions positions)
+    error, count = 0.0, 0
+    for chunk in load_cache(cache_dir):
+        for batch in _batches(chunk, batch_size):
+            error += float(np.sum((batch[3] - _sigmoid(k * _scores(batch, weights))) ** 2))
+            count += len(batch[3])
+            if max_positions is not None and count >= max_positions:
+                return error / count
+    return error / count if count else 0.0
+
+
+def fit_scale(cache_dir: str, weights: np.ndarray, max_positions: int = 1_000_000) -> float:
+    # K for the starting weights - golden-section search on log K
+    def error(log_k):
+        return total_error(cache_dir, weights, math.exp(log_k), max_positions=max_positions)
+
+    low, high = math.log(1e-4), math.log(1e-1)
+    ratio = (math.sqrt(5) - 1) / 2
+    a, b = high - ratio * (high - low), low + ratio * (high - low)
+    error_a, error_b = error(a), error(b)
+    for _ in range(30):
+        if error_a < error_b:
+            high, b, error_b = b, a, error_a
+            a = high - ratio * (high - low)
+            error_a = error(a)
+        else:
+            low, a, error_a = a, b, error_b
+            b = low + ratio * (high - low)
+            error_b = error(b)
+    return math.exp((low + high) / 2)
+
+
+def tune(cache_dir: str, weights: np.ndarray, k: float, epochs: int = 50, batch_size: int = 1 << 16,
+         lr: float = 1.0, beta1: float = 0.9, beta2: float = 0.999) -> np.ndarray:
+    # Adam on mini-batches, streaming the chunks from disk every epoch
+    weights = weights.copy()
+    m = np.zeros_like(weights)
+    v = np.zeros_like(weights)
+    step = 0
+    for epoch in range(1, epochs + 1):
+        start_time = time.time()
+        error, count = 0.0, 0
+        for chunk in load_cache(cache_dir):
+            for batch in _batches(chunk, batch_size):
+                rows, cols, values, results = batch
+                prediction = _sigmoid(k * _scores(batch, weights))
+                residual = prediction - results
+                error += float(np.sum(residual ** 2))
+                count += len(results)
+
+                # d/dw of mean (p - r)^2, scattered back through the sparse features
+                d_score = 2 * k * residual * prediction * (1 - prediction) / len(results)
+                grad = np.bincount(cols, weights=values * d_score[rows], minlength=len(weights))
+
+                step += 1
+                m = beta1 * m + (1 - beta1) * grad
+                v = beta2 * v + (1 - beta2) * grad * grad
+                correction = math.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+                weights -= lr * correction * m / (np.sqrt(v) + 1e-12)
+        print(f"epoch {epoch}: error {error / max(count, 1):.6f} ({time.time() - start_time:.1f}s)",
+              file=sys.stderr)
+    return weights
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Tune Evaluator weights on labelled positions")
+    parser.add_argument('input', nargs='*', help="PGN games or EPD/FEN lines with results")
+    parser.add_argument('-o', '--output', required=True, help="JSON weights to write")
+    parser.add_argument('--cache', default=None, help="feature cache directory (reused if it exists)")
+    parser.add_argument('--start', default=None, help="start from these JSON weights instead of the built-in ones")
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1 << 16)
+    parser.add_argument('--lr', type=float, default=1.0, help="Adam step size in centipawns")
+    parser.add_argument('--k', type=float, default=None, help="sigmoid scale (default: fitted)")
+    parser.add_argument('--min-ply', type=int, default=8, help="skip the first plies of each PGN game")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help="extraction processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    cache_dir = args.cache or tempfile.mkdtemp(prefix='texel_')
+    if not os.path.isdir(cache_dir) or not any(name.endswith('_results.npy') for name in os.listdir(cache_dir)):
+        if not args.input:
+            parser.error("no input files and no existing feature cache")
+        start_time = time.time()
+
+        def positions():
+            for path in args.input:
+                yield from read_labelled(path, args.min_ply)
+
+        kept = build_cache(positions(), cache_dir, chunk_size=args.chunk_size, workers=args.workers)
+        print(f"Extracted {kept:,} positions in {time.time() - start_time:.1f}s into {cache_dir}",
+              file=sys.stderr)
+
+    evaluator = Evaluator(args.start)
+    weights = weights_to_vector(evaluator.get_weights())
+    k = args.k or fit_scale(cache_dir, weights)
+    before = total_error(cache_dir, weights, k)
+    print(f"K = {k:.6f}, starting error {before:.6f}", file=sys.stderr)
+
+    start_time = time.time()
+    weights = tune(cache_dir, weights, k, epochs=args.epochs, batch_size=args.batch_size, lr=args.lr)
+    tuned = vector_to_weights(weights)
+    after = total_error(cache_dir, weights_to_vector(tuned), k)
+    print(f"Tuned in {time.time() - start_time:.1f}s, error {before:.6f} -> {after:.6f}", file=sys.stderr)
+
+    with open(args.output, 'w') as f:
+        json.dump(tuned, f, indent=1)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()